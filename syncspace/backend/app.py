@@ -3,23 +3,56 @@ from flask_restful import Api
 from flask_cors import CORS
 
 # Import routes
+from utils.config import settings
 from utils.users import register_user_routes
 from utils.messages import register_message_routes
 from utils.groups import register_group_routes
 from utils.events import register_event_routes
-from utils.db import get_db_connection
+from utils.stream import register_stream_routes
+from utils.bootstrap import register_bootstrap_routes
+from utils.inbox import register_inbox_routes
+from utils.calendar_feed import register_calendar_routes
+from utils.db import STICKY_HEADER, get_db_connection, init_app as init_db_pool
+from utils.metrics import init_app as init_metrics
+from utils.querylog import init_app as init_query_log
+from utils.responses import init_app as init_responses
+from utils.warmup import warmup, register_health_routes
 
 
-# Initialize Flask app
-application = Flask(__name__)
-CORS(application)
-api = Api(application)
+def create_app(config=None):
+    # config overrides entries of utils.config.settings. Building the app
+    # opens no connections and starts no threads, so it is safe to do in a
+    # server's master process before it forks; call warmup.start() in the
+    # process that serves requests.
+    if config:
+        settings.update(config)
 
-# Register routes
-register_user_routes(application)
-register_message_routes(application)
-register_group_routes(application)
-register_event_routes(application)
+    # Initialize Flask app
+    app = Flask(__name__)
+    # The frontend is served from another origin and echoes STICKY_HEADER
+    CORS(app, expose_headers=[STICKY_HEADER])
+    Api(app)
+    init_db_pool(app)
+    init_metrics(app)
+    init_query_log(app)
+    init_responses(app)
+
+    # Register routes
+    register_user_routes(app)
+    register_message_routes(app)
+    register_group_routes(app)
+    register_event_routes(app)
+    register_stream_routes(app)
+    register_bootstrap_routes(app)
+    register_inbox_routes(app)
+    register_calendar_routes(app)
+    register_health_routes(app)
+    return app
+
+
+application = create_app()
 
 if __name__ == '__main__':
+    # Development server; production runs gunicorn with gunicorn.conf.py
+    warmup.start()
     application.run(debug=True)
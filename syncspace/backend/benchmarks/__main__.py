@@ -0,0 +1,73 @@
+import argparse
+import sys
+
+from benchmarks.client import HttpClient, InProcessClient
+from benchmarks.runner import run_scenario, metadata, save, compare
+from benchmarks.scenarios import SCENARIOS, load_sample
+from benchmarks.seed import DATASETS, seed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description="Seed data and benchmark the API.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = commands.add_parser('seed', help="fill the configured database with synthetic data")
+    seed_parser.add_argument('--dataset', choices=sorted(DATASETS), default='small')
+    seed_parser.add_argument('--seed', type=int, default=1, help="random seed, for reproducible datasets")
+    seed_parser.add_argument('--append', action='store_true', help="seed even if the database already has users")
+
+    run_parser = commands.add_parser('run', help="drive the API and record latency and throughput")
+    run_parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                            help="scenario to run (repeatable; default: all)")
+    run_parser.add_argument('--url', help="base URL of a running server; default: call the app in-process")
+    run_parser.add_argument('--concurrency', type=int, default=8)
+    run_parser.add_argument('--duration', type=float, default=30.0, help="seconds measured per scenario")
+    run_parser.add_argument('--warmup', type=float, default=3.0, help="seconds run before measuring")
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--output', default='benchmark-results.json')
+
+    compare_parser = commands.add_parser('compare', help="compare two result files")
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'seed':
+        counts = seed(args.dataset, args.seed, args.append)
+        for table, count in counts.items():
+            print(f"{table}: {count}")
+        return 0
+
+    if args.command == 'compare':
+        compare(args.old, args.new)
+        return 0
+
+    if args.url:
+        target = args.url
+        client_factory = lambda: HttpClient(args.url)
+    else:
+        from app import create_app
+        from utils.warmup import warmup
+        app = create_app()
+        warmup.run()
+        target = 'in-process'
+        client_factory = lambda: InProcessClient(app)
+
+    sample = load_sample()
+    results = {"meta": metadata(target, args.concurrency, args.duration, sample), "scenarios": {}}
+    for name in args.scenario or sorted(SCENARIOS):
+        print(f"Running {name} for {args.duration:.0f}s with {args.concurrency} clients")
+        result = run_scenario(client_factory, SCENARIOS[name], sample, args.concurrency,
+                              args.duration, args.warmup, args.seed)
+        latency = result['latency_ms']
+        print(f"  {result['throughput']:.1f} req/s, p50 {latency['p50'] or 0:.1f} ms, "
+              f"p95 {latency['p95'] or 0:.1f} ms, p99 {latency['p99'] or 0:.1f} ms, {result['errors']} errors")
+        results["scenarios"][name] = result
+
+    save(results, args.output)
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+import http.client
+import json
+import urllib.parse
+
+
+class HttpClient:
+    # One keep-alive connection per benchmark thread, like a browser tab.
+    def __init__(self, base_url, timeout=30.0):
+        parsed = urllib.parse.urlsplit(base_url)
+        self._host = parsed.hostname
+        self._port = parsed.port or 80
+        self._prefix = parsed.path.rstrip('/')
+        self._timeout = timeout
+        self._conn = None
+
+    def request(self, method, path, body=None):
+        # Returns (status, parsed JSON body or None).
+        payload = json.dumps(body).encode('utf-8') if body is not None else None
+        headers = {'Accept-Encoding': 'identity'}
+        if payload is not None:
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self._host, self._port, timeout=self._timeout)
+            try:
+                self._conn.request(method, self._prefix + path, body=payload, headers=headers)
+                response = self._conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed an idle keep-alive connection; retry once.
+                self.close()
+                if attempt:
+                    raise
+        return response.status, _parse(data)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class InProcessClient:
+    # Calls the Flask app directly, without a server or sockets.
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self._client.open(path, method=method, json=body)
+        return response.status_code, _parse(response.get_data())
+
+    def close(self):
+        pass
+
+
+def _parse(data):
+    if not data:
+        return None
+    try:
+        return json.loads(data)
+    except ValueError:
+        return None
@@ -0,0 +1,168 @@
+import datetime
+import json
+import math
+import platform
+import random
+import subprocess
+import threading
+import time
+
+from utils.config import settings
+
+# Settings that change what a run measures, recorded with every result.
+RECORDED_SETTINGS = (
+    'MESSAGE_CACHE_ENABLED', 'SEARCH_INDEX_ENABLED', 'ETAGS_ENABLED', 'COMPRESS_ENABLED',
+    'DB_POOL_MAX_SIZE', 'BCRYPT_ROUNDS', 'PASSWORD_WORKERS', 'LAZY_RSVP_MIN_MEMBERS',
+)
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list.
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "mean": sum(latencies) / len(latencies) * 1000 if latencies else None,
+            "p50": _ms(percentile(latencies, 0.50)),
+            "p95": _ms(percentile(latencies, 0.95)),
+            "p99": _ms(percentile(latencies, 0.99)),
+            "max": _ms(latencies[-1] if latencies else None),
+        },
+    }
+
+
+def _ms(seconds):
+    return seconds * 1000 if seconds is not None else None
+
+
+class _Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.statuses = {}
+
+    def add(self, name, seconds, status):
+        with self._lock:
+            self.samples.setdefault(name, []).append(seconds)
+            self.statuses.setdefault(name, {})
+            self.statuses[name][status] = self.statuses[name].get(status, 0) + 1
+            if status is None or status >= 500:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def run_scenario(client_factory, operations, sample, concurrency=8, duration=30.0, warmup=3.0, rng_seed=1):
+    # Run the weighted operations from `concurrency` threads for `duration`
+    # seconds (after `warmup` seconds that are not recorded).
+    weights = [weight for weight, _ in operations]
+    functions = [operation for _, operation in operations]
+    recorder = _Recorder()
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    def worker(index):
+        rng = random.Random(rng_seed * 1000 + index)
+        client = client_factory()
+
+        def call(name, method, path, body=None):
+            began = time.perf_counter()
+            try:
+                status, data = client.request(method, path, body)
+            except Exception as e:
+                print(f"{name}: {e}")
+                status, data = None, None
+            if began >= measure_from:
+                recorder.add(name, time.perf_counter() - began, status)
+            return status, data
+
+        try:
+            while time.perf_counter() < stop_at:
+                rng.choices(functions, weights)[0](call, sample, rng)
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=worker, args=(index,), name=f'bench-{index}') for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - measure_from
+
+    all_latencies = [value for values in recorder.samples.values() for value in values]
+    result = summarize(all_latencies, sum(recorder.errors.values()), elapsed)
+    result["operations"] = {}
+    for name, values in sorted(recorder.samples.items()):
+        summary = summarize(values, recorder.errors.get(name, 0), elapsed)
+        summary["statuses"] = {str(status): count for status, count in sorted(recorder.statuses[name].items(),
+                                                                               key=lambda item: str(item[0]))}
+        result["operations"][name] = summary
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata(target, concurrency, duration, sample):
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.datetime.utcnow().replace(microsecond=0).isoformat() + 'Z',
+        "python": platform.python_version(),
+        "target": target,
+        "concurrency": concurrency,
+        "duration": duration,
+        "sample": sample.describe(),
+        "settings": {name: settings[name] for name in RECORDED_SETTINGS if name in settings},
+    }
+
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def compare(old_path, new_path, log=print):
+    # Print p50/p95/p99 and throughput changes per scenario and operation.
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    log(f"{old['meta'].get('commit')} -> {new['meta'].get('commit')}")
+    for scenario, new_result in sorted(new['scenarios'].items()):
+        old_result = old['scenarios'].get(scenario)
+        if old_result is None:
+            continue
+        log(f"\n{scenario}")
+        rows = [('(all)', old_result, new_result)]
+        for name, new_op in sorted(new_result['operations'].items()):
+            old_op = old_result['operations'].get(name)
+            if old_op is not None:
+                rows.append((name, old_op, new_op))
+        for name, before, after in rows:
+            changes = [_change('rps', before['throughput'], after['throughput'])]
+            for key in ('p50', 'p95', 'p99'):
+                changes.append(_change(key, before['latency_ms'][key], after['latency_ms'][key]))
+            log(f"  {name:<40} " + '  '.join(changes))
+
+
+def _change(label, before, after):
+    if before is None or after is None:
+        return f"{label} n/a"
+    if not before:
+        return f"{label} {after:.1f}"
+    return f"{label} {after:.1f} ({(after - before) / before * 100:+.0f}%)"
@@ -0,0 +1,254 @@
+import datetime
+
+from utils.db import get_db_connection
+
+from benchmarks.seed import USERNAME_PREFIX, PASSWORD
+
+SAMPLE_SIZE = 2000
+SAMPLE_GROUP_MEMBERS = 200
+
+
+class Sample:
+    # Ids drawn from the database that the scenarios pick requests from.
+    def __init__(self, users, groups, events, conversations, last_message_id, last_group_message_id):
+        self.users = users                      # [(id, username)]
+        self.groups = groups                    # {group_id: [member ids]}
+        self.events = events                    # [(event_id, group_id)]
+        self.conversations = conversations      # [(user_id, other_user_id)]
+        self.last_message_id = last_message_id
+        self.last_group_message_id = last_group_message_id
+
+    def describe(self):
+        return {
+            "users": len(self.users),
+            "groups": len(self.groups),
+            "events": len(self.events),
+            "conversations": len(self.conversations),
+        }
+
+
+def load_sample(size=SAMPLE_SIZE):
+    db = get_db_connection()
+    if db is None:
+        raise RuntimeError("Database connection failed")
+
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT id, username FROM user_verification WHERE username LIKE %s ORDER BY id LIMIT %s",
+                       (f"{USERNAME_PREFIX}%", size))
+        users = list(cursor.fetchall())
+
+        cursor.execute("SELECT id FROM group_chats ORDER BY id LIMIT %s", (size,))
+        # Admins first, so members[0] can run admin-only operations
+        groups = {}
+        for (group_id,) in cursor.fetchall():
+            cursor.execute("SELECT user_id FROM group_chat_members WHERE group_id = %s ORDER BY admin DESC LIMIT %s",
+                           (group_id, SAMPLE_GROUP_MEMBERS))
+            groups[group_id] = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute("SELECT id, group_id FROM events ORDER BY id LIMIT %s", (size,))
+        events = [row for row in cursor.fetchall() if groups.get(row[1])]
+
+        cursor.execute("SELECT sender_id, recipient_id FROM messages ORDER BY id DESC LIMIT %s", (size,))
+        conversations = sorted(set(cursor.fetchall()))
+
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM messages")
+        last_message_id = cursor.fetchone()[0]
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM group_messages")
+        last_group_message_id = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        db.close()
+
+    if not users or not groups or not conversations:
+        raise RuntimeError("No benchmark data found; run python -m benchmarks seed first")
+    groups = {group_id: members for group_id, members in groups.items() if members}
+    return Sample(users, groups, events, conversations, last_message_id, last_group_message_id)
+
+
+# Each operation gets call(name, method, path, body=None), which times one
+# request under the given name and returns (status, body), plus the sample
+# and the worker's random generator.
+
+def direct_page(call, sample, rng):
+    user_id, other_user_id = rng.choice(sample.conversations)
+    call('GET /messages', 'GET', f'/messages?user_id={user_id}&other_user_id={other_user_id}&limit=50')
+
+
+def direct_poll(call, sample, rng):
+    # A client that is up to date asks for anything newer than its last id.
+    user_id, other_user_id = rng.choice(sample.conversations)
+    call('GET /messages (poll)', 'GET',
+         f'/messages?user_id={user_id}&other_user_id={other_user_id}&after_id={sample.last_message_id}')
+
+
+def group_page(call, sample, rng):
+    group_id = rng.choice(list(sample.groups))
+    call('GET /groups/<id>/messages', 'GET', f'/groups/{group_id}/messages?limit=50')
+
+
+def group_poll(call, sample, rng):
+    group_id = rng.choice(list(sample.groups))
+    call('GET /groups/<id>/messages (poll)', 'GET',
+         f'/groups/{group_id}/messages?after_id={sample.last_group_message_id}')
+
+
+def long_poll(call, sample, rng):
+    user_id = rng.choice(sample.users)[0]
+    call('GET /messages/poll', 'GET', f'/messages/poll?user_id={user_id}&timeout=0')
+
+
+def inbox(call, sample, rng):
+    user_id, _ = rng.choice(sample.conversations)
+    call('GET /inbox', 'GET', f'/inbox?user_id={user_id}&limit=20')
+
+
+def mark_read(call, sample, rng):
+    user_id, other_user_id = rng.choice(sample.conversations)
+    call('PUT /inbox/read', 'PUT', '/inbox/read', {"user_id": other_user_id, "peer_id": user_id})
+
+
+def send_direct(call, sample, rng):
+    user_id, other_user_id = rng.choice(sample.conversations)
+    call('POST /messages', 'POST', '/messages',
+         {"sender_id": user_id, "recipient_id": other_user_id, "content": "benchmark message"})
+
+
+def send_group(call, sample, rng):
+    group_id, members = rng.choice(list(sample.groups.items()))
+    call('POST /groups/<id>/messages', 'POST', f'/groups/{group_id}/messages',
+         {"sender_id": rng.choice(members), "content": "benchmark group message"})
+
+
+def login(call, sample, rng):
+    username = rng.choice(sample.users)[1]
+    call('POST /users/login', 'POST', '/users/login', {"username": username, "password": PASSWORD})
+
+
+def login_failure(call, sample, rng):
+    username = rng.choice(sample.users)[1]
+    call('POST /users/login (wrong password)', 'POST', '/users/login', {"username": username, "password": "wrong"})
+
+
+def user_events(call, sample, rng):
+    user_id = rng.choice(sample.users)[0]
+    call('GET /events', 'GET', f'/events?user_id={user_id}')
+
+
+def calendar_window(call, sample, rng):
+    # One month of the user's calendar, recurring events expanded
+    user_id = rng.choice(sample.users)[0]
+    start = datetime.datetime.utcnow().replace(microsecond=0) + datetime.timedelta(days=rng.randint(-30, 60))
+    end = start + datetime.timedelta(days=31)
+    call('GET /events (window)', 'GET', f'/events?user_id={user_id}&from={start.isoformat()}&to={end.isoformat()}')
+
+
+def group_events(call, sample, rng):
+    group_id, members = rng.choice(list(sample.groups.items()))
+    call('GET /groups/<id>/events', 'GET', f'/groups/{group_id}/events?user_id={rng.choice(members)}')
+
+
+def calendar_feed(call, sample, rng):
+    # A subscribed calendar app polling the user's feed
+    user_id = rng.choice(sample.users)[0]
+    call('GET /users/<id>/calendar.ics', 'GET', f'/users/{user_id}/calendar.ics')
+
+
+def event_participants(call, sample, rng):
+    event_id, _ = rng.choice(sample.events)
+    call('GET /events/<id>/participants', 'GET', f'/events/{event_id}/participants')
+
+
+def rsvp(call, sample, rng):
+    event_id, group_id = rng.choice(sample.events)
+    call('PUT /events/<id>/status', 'PUT', f'/events/{event_id}/status',
+         {"user_id": rng.choice(sample.groups[group_id]), "status": rng.choice(['attending', 'not_attending'])})
+
+
+def list_users(call, sample, rng):
+    call('GET /users (page)', 'GET', f'/users?limit=100&fields=id,name&cursor={rng.choice(sample.users)[0]}')
+
+
+def search_users(call, sample, rng):
+    user_id = rng.choice(sample.users)[0]
+    query = rng.choice(['bench', 'user 1', 'user 42', 'Bench User 7', 'zz'])
+    call('GET /users/search', 'GET', f'/users/search?query={query.replace(" ", "+")}&current_user_id={user_id}')
+
+
+def user_groups(call, sample, rng):
+    call('GET /groups', 'GET', f'/groups?user_id={rng.choice(sample.users)[0]}')
+
+
+def group_members(call, sample, rng):
+    call('GET /groups/<id>/members', 'GET', f'/groups/{rng.choice(list(sample.groups))}/members')
+
+
+def bootstrap(call, sample, rng):
+    group_id, members = rng.choice(list(sample.groups.items()))
+    call('GET /bootstrap', 'GET', f'/bootstrap?user_id={rng.choice(members)}&group_id={group_id}')
+
+
+def user_lifecycle(call, sample, rng):
+    suffix = rng.getrandbits(48)
+    status, body = call('POST /users', 'POST', '/users', {
+        "name": "Bench Temp", "username": f"{USERNAME_PREFIX}tmp_{suffix:012x}",
+        "password": PASSWORD, "email": "temp@example.com"
+    })
+    if status == 201 and body:
+        call('PUT /users/<id>', 'PUT', f'/users/{body["id"]}', {"name": "Bench Temp 2", "email": "temp2@example.com"})
+        call('DELETE /users/<id>', 'DELETE', f'/users/{body["id"]}')
+
+
+def group_lifecycle(call, sample, rng):
+    members = [user_id for user_id, _ in rng.sample(sample.users, min(6, len(sample.users)))]
+    admin, others, extra = members[0], members[1:-1], members[-1]
+    status, body = call('POST /groups', 'POST', '/groups',
+                        {"name": "Bench Temp Group", "created_by": admin, "member_ids": others})
+    if status != 201 or not body:
+        return
+    group_id = body["group_id"]
+    call('POST /groups/<id>/members', 'POST', f'/groups/{group_id}/members', {"user_id": extra})
+    call('PUT /groups/<id>/members/<id>/admin', 'PUT', f'/groups/{group_id}/members/{extra}/admin?admin_id={admin}')
+    call('DELETE /groups/<id>/members/<id>', 'DELETE', f'/groups/{group_id}/members/{extra}?admin_id={admin}')
+    call('DELETE /groups/<id>', 'DELETE', f'/groups/{group_id}?admin_id={admin}')
+
+
+def event_lifecycle(call, sample, rng):
+    group_id, members = rng.choice(list(sample.groups.items()))
+    status, body = call('POST /groups/<id>/events', 'POST', f'/groups/{group_id}/events', {
+        "title": "Bench Temp Event", "description": "created by the benchmark",
+        "event_time": "2030-01-01 12:00:00", "creator_id": rng.choice(members)
+    })
+    if status == 201 and body:
+        call('DELETE /events/<id>', 'DELETE', f'/events/{body["id"]}?user_id={members[0]}')
+
+
+# name -> [(weight, operation)]
+SCENARIOS = {
+    'chat': [
+        (30, direct_poll), (30, group_poll), (10, direct_page), (10, group_page),
+        (10, long_poll), (10, inbox), (5, mark_read), (5, send_direct), (5, send_group),
+    ],
+    'login': [
+        (9, login), (1, login_failure),
+    ],
+    'calendar': [
+        (20, user_events), (20, calendar_window), (20, group_events), (25, event_participants), (15, rsvp),
+        (20, calendar_feed),
+    ],
+    'directory': [
+        (20, list_users), (30, search_users), (20, user_groups), (20, group_members), (10, bootstrap),
+    ],
+    'admin': [
+        (1, user_lifecycle), (1, group_lifecycle), (1, event_lifecycle),
+    ],
+}
+
+# Every operation at once, weighted like a day of normal traffic.
+SCENARIOS['mixed'] = (
+    [(weight * 6, operation) for weight, operation in SCENARIOS['chat']]
+    + [(weight, operation) for weight, operation in SCENARIOS['login']]
+    + [(weight * 2, operation) for weight, operation in SCENARIOS['calendar']]
+    + [(weight * 2, operation) for weight, operation in SCENARIOS['directory']]
+    + [(weight * 2, operation) for weight, operation in SCENARIOS['admin']]
+)
@@ -0,0 +1,169 @@
+import datetime
+import random
+
+import bcrypt
+
+from migrations import ensure_schema
+from utils.config import settings
+from utils.db import get_db_connection
+from utils.inbox import rebuild_conversations
+from utils.recurrence import parse_rule, last_occurrence
+
+USERNAME_PREFIX = 'bench_'
+PASSWORD = 'benchmark'
+
+# Dataset sizes. Group sizes follow a Pareto distribution, so most groups are
+# small and a few are very large (past LAZY_RSVP_MIN_MEMBERS in the bigger
+# sets); conversation lengths are skewed the same way.
+DATASETS = {
+    'small': {
+        'users': 200,
+        'groups': 20,
+        'conversations': 300,
+        'conversation_messages': 200,
+        'group_messages': 500,
+        'events_per_group': 3,
+    },
+    'medium': {
+        'users': 5000,
+        'groups': 300,
+        'conversations': 5000,
+        'conversation_messages': 2000,
+        'group_messages': 5000,
+        'events_per_group': 5,
+    },
+    'large': {
+        'users': 50000,
+        'groups': 2000,
+        'conversations': 50000,
+        'conversation_messages': 10000,
+        'group_messages': 20000,
+        'events_per_group': 8,
+    },
+}
+
+BATCH_SIZE = 1000
+MIN_GROUP_SIZE = 3
+SKEW = 1.2
+NOT_ATTENDING_SHARE = 0.1
+# Share of events that repeat, and the rules they use
+RECURRING_SHARE = 0.2
+RECURRENCES = ('FREQ=WEEKLY', 'FREQ=DAILY;COUNT=30', 'FREQ=MONTHLY;INTERVAL=1;COUNT=24', 'FREQ=WEEKLY;INTERVAL=2')
+
+
+def _skewed(rng, minimum, maximum):
+    return min(maximum, int(minimum * (1 - rng.random()) ** (-1 / SKEW)))
+
+
+def _insert_many(cursor, sql, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        cursor.executemany(sql, rows[start:start + BATCH_SIZE])
+
+
+def _text(rng, words=12):
+    vocabulary = ("lorem ipsum dolor sit amet meeting tomorrow lunch project update "
+                  "sounds good thanks see you later can we move the call review notes").split()
+    return ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(1, words)))
+
+
+def seed(dataset='small', rng_seed=1, append=False, log=print):
+    # Fill the configured database with synthetic data. Returns the number of
+    # rows written per table.
+    sizes = DATASETS[dataset]
+    rng = random.Random(rng_seed)
+    counts = {}
+
+    ensure_schema(log)
+    db = get_db_connection()
+    if db is None:
+        raise RuntimeError("Database connection failed")
+
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM user_verification")
+        if cursor.fetchone()[0] and not append:
+            raise RuntimeError("user_verification is not empty; pass --append to seed anyway")
+
+        # One hash shared by every user keeps seeding fast; logins still pay
+        # the full bcrypt cost.
+        hashed = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=settings['BCRYPT_ROUNDS']))
+        tag = f"{rng_seed}_{rng.getrandbits(32):08x}"
+
+        log(f"Seeding {sizes['users']} users")
+        _insert_many(cursor, "INSERT INTO user_verification (name, username, password, email) VALUES (%s, %s, %s, %s)", [
+            (f"Bench User {i}", f"{USERNAME_PREFIX}{tag}_{i}", hashed, f"bench{i}@example.com")
+            for i in range(sizes['users'])
+        ])
+        cursor.execute("SELECT id FROM user_verification WHERE username LIKE %s ORDER BY id",
+                       (f"{USERNAME_PREFIX}{tag}_%",))
+        user_ids = [row[0] for row in cursor.fetchall()]
+        counts['users'] = len(user_ids)
+        db.commit()
+
+        log(f"Seeding {sizes['conversations']} conversations")
+        direct_rows = []
+        for _ in range(sizes['conversations']):
+            first, second = rng.sample(user_ids, 2)
+            for _ in range(_skewed(rng, 1, sizes['conversation_messages'])):
+                sender, recipient = (first, second) if rng.random() < 0.5 else (second, first)
+                direct_rows.append((sender, recipient, _text(rng)))
+        _insert_many(cursor, "INSERT INTO messages (sender_id, recipient_id, content) VALUES (%s, %s, %s)",
+                     direct_rows)
+        counts['messages'] = len(direct_rows)
+        db.commit()
+
+        log(f"Seeding {sizes['groups']} groups with events")
+        counts.update(group_chats=0, group_chat_members=0, group_messages=0, events=0, event_participants=0)
+        now = datetime.datetime.utcnow().replace(microsecond=0)
+        for index in range(sizes['groups']):
+            members = rng.sample(user_ids, _skewed(rng, MIN_GROUP_SIZE, len(user_ids)))
+            cursor.execute("INSERT INTO group_chats (name, created_by) VALUES (%s, %s)",
+                           (f"Bench Group {index}", members[0]))
+            group_id = cursor.lastrowid
+            _insert_many(cursor, "INSERT INTO group_chat_members (group_id, user_id, admin) VALUES (%s, %s, %s)",
+                         [(group_id, user_id, int(position == 0)) for position, user_id in enumerate(members)])
+
+            message_count = min(sizes['group_messages'], len(members) * _skewed(rng, 5, sizes['group_messages']))
+            _insert_many(cursor, "INSERT INTO group_messages (group_id, sender_id, content) VALUES (%s, %s, %s)",
+                         [(group_id, rng.choice(members), _text(rng)) for _ in range(message_count)])
+
+            lazy = 0 < settings['LAZY_RSVP_MIN_MEMBERS'] <= len(members)
+            for _ in range(sizes['events_per_group']):
+                event_time = now + datetime.timedelta(hours=rng.randint(-30 * 24, 60 * 24))
+                recurrence = rng.choice(RECURRENCES) if rng.random() < RECURRING_SHARE else None
+                final_time = last_occurrence(event_time, parse_rule(recurrence)) if recurrence else event_time
+                declined = [user_id for user_id in members if rng.random() < NOT_ATTENDING_SHARE]
+                cursor.execute(
+                    "INSERT INTO events (group_id, title, description, event_time, recurrence, last_occurrence, "
+                    "lazy_rsvp, attending_count) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                    (group_id, _text(rng, 4).title(), _text(rng, 30), event_time, recurrence, final_time, int(lazy),
+                     len(members) - len(declined))
+                )
+                event_id = cursor.lastrowid
+                declined_set = set(declined)
+                if lazy:
+                    rows = [(event_id, user_id, 'not_attending') for user_id in declined]
+                else:
+                    rows = [(event_id, user_id, 'not_attending' if user_id in declined_set else 'attending')
+                            for user_id in members]
+                _insert_many(cursor, "INSERT INTO event_participants (event_id, user_id, status) VALUES (%s, %s, %s)",
+                             rows)
+                counts['events'] += 1
+                counts['event_participants'] += len(rows)
+
+            counts['group_chats'] += 1
+            counts['group_chat_members'] += len(members)
+            counts['group_messages'] += message_count
+            db.commit()
+
+        log("Rebuilding conversation summaries")
+        rebuild_conversations(cursor)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+        db.close()
+
+    return counts
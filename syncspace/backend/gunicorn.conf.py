@@ -0,0 +1,59 @@
+import os
+
+# Production server settings. From the backend folder:
+#   gunicorn -c gunicorn.conf.py
+# Every value can be overridden with the environment variable next to it.
+
+wsgi_app = 'app:application'
+bind = os.environ.get('SYNCSPACE_BIND', '0.0.0.0:8000')
+
+# Threaded workers: requests mostly wait on MySQL, bcrypt runs on its own
+# pool without the GIL, and each open /messages/stream holds one thread.
+worker_class = 'gthread'
+workers = int(os.environ.get('SYNCSPACE_WORKERS', 1))
+threads = int(os.environ.get('SYNCSPACE_THREADS', 32))
+
+# A stream holds its thread for up to SYNCSPACE_STREAM_MAX_AGE seconds, so
+# streams and long polls may only take half of the threads; further ones are
+# told to reconnect later. To hold many more open streams, route
+# /messages/stream and /messages/poll to a separate gunicorn running with
+# SYNCSPACE_THREADS raised for them alone.
+os.environ.setdefault('SYNCSPACE_STREAM_MAX_CONNECTIONS', str(max(threads // 2, 1)))
+
+# Keep client connections open between polls instead of reconnecting.
+keepalive = int(os.environ.get('SYNCSPACE_KEEPALIVE', 75))
+backlog = int(os.environ.get('SYNCSPACE_BACKLOG', 2048))
+timeout = int(os.environ.get('SYNCSPACE_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('SYNCSPACE_GRACEFUL_TIMEOUT', 30))
+
+# Import the code once in the master and fork it into the workers. The app
+# factory opens no connections, so nothing is shared across the fork.
+preload_app = True
+
+# Workers are not recycled after N requests: a restart throws away the warm
+# connection pool, caches and search index.
+max_requests = 0
+
+# The message push channel, hot-tail message cache, membership cache and
+# ETag counters live in each process. With several worker processes, writes
+# made by one worker are not seen by the others, so the caches that could
+# serve stale data are turned off and membership is re-read more often.
+# Calendar feeds are regenerated on every poll.
+# Stream subscribers only get instant pushes for messages posted through
+# their own worker; the rest arrive when the stream is renewed after
+# SYNCSPACE_STREAM_MAX_AGE seconds and catches up from the database.
+if workers > 1:
+    os.environ.setdefault('SYNCSPACE_MESSAGE_CACHE_ENABLED', '0')
+    os.environ.setdefault('SYNCSPACE_ETAGS_ENABLED', '0')
+    os.environ.setdefault('SYNCSPACE_CALENDAR_CACHE_ENABLED', '0')
+    os.environ.setdefault('SYNCSPACE_MEMBERSHIP_CACHE_TTL', '5')
+
+
+def post_worker_init(worker):
+    # Warm the pool, password workers and search index before the worker
+    # accepts requests, but give up waiting well before the worker timeout;
+    # /health/ready stays 503 until the warm-up has finished.
+    from utils.warmup import warmup
+    warmup.start()
+    if not warmup.wait(int(os.environ.get('SYNCSPACE_WARM_UP_WAIT', 20))):
+        worker.log.warning("Warm-up still running; serving requests anyway")
@@ -0,0 +1,132 @@
+import importlib
+import os
+import re
+
+import pymysql
+
+from utils.config import settings
+from utils.db import get_db_connection
+
+VERSIONS_DIR = os.path.join(os.path.dirname(__file__), 'versions')
+VERSION_FILE = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+# Errors that mean the object a statement creates is already there, which
+# happens when a migration is adopted by a database that predates it.
+ALREADY_APPLIED_ERRORS = {
+    1050,  # table already exists
+    1060,  # duplicate column name
+    1061,  # duplicate key name
+}
+
+
+def available_migrations():
+    migrations = []
+    for filename in sorted(os.listdir(VERSIONS_DIR)):
+        match = VERSION_FILE.match(filename)
+        if match:
+            migrations.append((match.group(1), filename[:-3]))
+    return migrations
+
+
+def load_migration(module_name):
+    return importlib.import_module(f'migrations.versions.{module_name}')
+
+
+def _ensure_version_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(16) PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def applied_versions(cursor):
+    _ensure_version_table(cursor)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def pending_migrations(cursor):
+    applied = applied_versions(cursor)
+    return [(version, name) for version, name in available_migrations() if version not in applied]
+
+
+def upgrade(target=None, log=print):
+    # Apply every pending migration up to and including target (all of them
+    # by default), one version at a time.
+    db = get_db_connection()
+    if db is None:
+        raise RuntimeError("Database connection failed")
+
+    cursor = db.cursor()
+    applied = []
+    try:
+        for version, name in pending_migrations(cursor):
+            if target is not None and version > target:
+                break
+            log(f"Applying {name}")
+            for statement in load_migration(name).UP:
+                try:
+                    cursor.execute(statement)
+                except pymysql.MySQLError as e:
+                    if e.args and e.args[0] in ALREADY_APPLIED_ERRORS:
+                        log(f"  skipped, already present: {e.args[1]}")
+                        continue
+                    raise
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (version, name)
+            )
+            db.commit()
+            applied.append(version)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+        db.close()
+    return applied
+
+
+def ensure_schema(log=print):
+    # Start-up hook: bring the schema up to date when DB_AUTO_MIGRATE is set,
+    # and always for the embedded sqlite database, which starts out empty.
+    if not settings['DB_AUTO_MIGRATE'] and settings['DB_BACKEND'] != 'sqlite':
+        return []
+    return upgrade(log=log)
+
+
+def check_schema():
+    # Start-up check: raises while migrations are pending, because the routes
+    # of this revision may use the tables and columns they add.
+    db = get_db_connection()
+    if db is None:
+        raise RuntimeError("Database connection failed")
+
+    cursor = db.cursor()
+    try:
+        pending = pending_migrations(cursor)
+        db.commit()
+    finally:
+        cursor.close()
+        db.close()
+    if pending:
+        names = ', '.join(name for _, name in pending)
+        raise RuntimeError(f"Schema migrations pending: {names}; run 'python -m migrations upgrade'")
+
+
+def status():
+    db = get_db_connection()
+    if db is None:
+        raise RuntimeError("Database connection failed")
+
+    cursor = db.cursor()
+    try:
+        applied = applied_versions(cursor)
+        db.commit()
+    finally:
+        cursor.close()
+        db.close()
+    return [(version, name, version in applied) for version, name in available_migrations()]
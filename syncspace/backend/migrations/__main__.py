@@ -0,0 +1,35 @@
+import argparse
+import sys
+
+from migrations import upgrade, status
+from migrations.audit import run_audit
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m migrations', description="Database schema migrations.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    upgrade_parser = commands.add_parser('upgrade', help="apply pending migrations")
+    upgrade_parser.add_argument('--target', help="stop after this version (e.g. 0002)")
+    commands.add_parser('status', help="list migrations and whether they are applied")
+    commands.add_parser('audit', help="EXPLAIN every query in utils/ and fail on full scans or filesorts")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'upgrade':
+        applied = upgrade(args.target)
+        print(f"{len(applied)} migration(s) applied")
+        return 0
+
+    if args.command == 'status':
+        for version, name, applied in status():
+            print(f"[{'x' if applied else ' '}] {name}")
+        return 0
+
+    failures = run_audit()
+    print(f"{failures} problem query(s)" if failures else "No unexpected full scans or filesorts")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
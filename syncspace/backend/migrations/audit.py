@@ -0,0 +1,169 @@
+import ast
+import os
+import re
+
+from utils.config import settings
+from utils.db import get_db_connection
+
+UTILS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'utils')
+
+EXPLAINABLE = re.compile(
+    r'^\s*(SELECT\s|UPDATE\s+\w+\s+SET\s|DELETE\s+FROM\s|INSERT\s+INTO\s+\w+\s*\([^)]*\)\s*SELECT\s)',
+    re.IGNORECASE
+)
+
+# Values substituted for the f-string fragments the routes build their SQL
+# from, so that every variant can be explained.
+FSTRING_FRAGMENTS = {
+    'condition': [''],
+    'order': ['ASC', 'DESC'],
+    'placeholders': ['%s, %s'],
+    'columns': ['id, name, username, email'],
+}
+
+# Queries that are allowed to scan or sort, by function (or module-level
+# constant), with the reason.
+ALLOWED = {
+    'build': "loads every user into the search index",
+    'REBUILD_STATEMENTS': "rebuilds every conversation from all messages after a bulk load",
+    'search_users': "LIKE '%q%' cannot use an index",
+    'fetch_group_members': "sorts one group's members by name",
+    'get_event_participants': "sorts one event's participants by name",
+    'user_events_query': "sorts one user's events by time",
+}
+
+
+class Statement:
+    def __init__(self, path, function, lineno, sql):
+        self.path = path
+        self.function = function
+        self.lineno = lineno
+        self.sql = sql
+
+    @property
+    def location(self):
+        return f"{os.path.basename(self.path)}:{self.lineno} ({self.function})"
+
+
+def _module_constants(tree):
+    constants = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant) \
+                and isinstance(node.value.value, str):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    constants[target.id] = node.value.value
+    return constants
+
+
+def _render(node, constants):
+    # All the strings an f-string can produce, or None if it uses a value
+    # the audit does not know how to fill in.
+    variants = ['']
+    for part in node.values:
+        if isinstance(part, ast.Constant):
+            options = [part.value]
+        elif isinstance(part, ast.FormattedValue) and isinstance(part.value, ast.Name):
+            name = part.value.id
+            if name in constants:
+                options = [constants[name]]
+            elif name in FSTRING_FRAGMENTS:
+                options = FSTRING_FRAGMENTS[name]
+            else:
+                return None
+        else:
+            return None
+        variants = [prefix + option for prefix in variants for option in options]
+    return variants
+
+
+def collect_statements(directory=UTILS_DIR):
+    statements = []
+    seen = set()
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.py'):
+            continue
+        path = os.path.join(directory, filename)
+        with open(path) as f:
+            tree = ast.parse(f.read(), filename=path)
+        constants = _module_constants(tree)
+
+        def add(function, lineno, sql):
+            if EXPLAINABLE.match(sql) and (path, lineno, sql) not in seen:
+                seen.add((path, lineno, sql))
+                statements.append(Statement(path, function, lineno, sql))
+
+        def visit(node, function):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                function = node.name
+            elif function == '<module>' and isinstance(node, ast.Assign) and len(node.targets) == 1 \
+                    and isinstance(node.targets[0], ast.Name):
+                # SQL kept in a module constant is reported under its name
+                function = node.targets[0].id
+            if isinstance(node, ast.Constant) and isinstance(node.value, str):
+                add(function, node.lineno, node.value)
+                return
+            if isinstance(node, ast.JoinedStr):
+                for sql in _render(node, constants) or []:
+                    add(function, node.lineno, sql)
+                return
+            for child in ast.iter_child_nodes(node):
+                visit(child, function)
+
+        visit(tree, '<module>')
+    return statements
+
+
+def explain(cursor, sql):
+    # Parameters do not change the plan shape for these queries; bind 1.
+    cursor.execute("EXPLAIN " + sql.replace('%s', '1'))
+    columns = [column[0].lower() for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def problems(plan):
+    found = []
+    for row in plan:
+        table = row.get('table') or ''
+        if table.startswith('<'):
+            # Derived tables and union results are bounded by the LIMITs of
+            # the subqueries that produce them.
+            continue
+        extra = row.get('extra') or ''
+        if row.get('type') == 'ALL':
+            found.append(f"full scan of {table}")
+        if 'Using filesort' in extra:
+            found.append(f"filesort on {table}")
+    return found
+
+
+def run_audit(log=print):
+    # Returns the number of statements with unexpected full scans/filesorts.
+    if settings['DB_BACKEND'] != 'mysql':
+        raise RuntimeError("The audit reads MySQL query plans; run it with DB_BACKEND=mysql")
+    db = get_db_connection()
+    if db is None:
+        raise RuntimeError("Database connection failed")
+
+    failures = 0
+    cursor = db.cursor()
+    try:
+        for statement in collect_statements():
+            try:
+                found = problems(explain(cursor, statement.sql))
+            except Exception as e:
+                log(f"ERROR {statement.location}: {e}")
+                failures += 1
+                continue
+            if not found:
+                continue
+            reason = ALLOWED.get(statement.function)
+            if reason:
+                log(f"allowed {statement.location}: {', '.join(found)} ({reason})")
+            else:
+                log(f"FAIL {statement.location}: {', '.join(found)}")
+                failures += 1
+    finally:
+        cursor.close()
+        db.close()
+    return failures
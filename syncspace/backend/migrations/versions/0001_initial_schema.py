@@ -0,0 +1,75 @@
+# Tables as used by the routes in utils/. Written with IF NOT EXISTS so the
+# existing database can be adopted without touching its data.
+UP = [
+    """
+    CREATE TABLE IF NOT EXISTS user_verification (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        username VARCHAR(100) NOT NULL UNIQUE,
+        password VARCHAR(255) NOT NULL,
+        email VARCHAR(255)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS messages (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        sender_id INT NOT NULL,
+        recipient_id INT NOT NULL,
+        content TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (sender_id) REFERENCES user_verification(id) ON DELETE CASCADE,
+        FOREIGN KEY (recipient_id) REFERENCES user_verification(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS group_chats (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        created_by INT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (created_by) REFERENCES user_verification(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS group_chat_members (
+        group_id INT NOT NULL,
+        user_id INT NOT NULL,
+        admin TINYINT(1) NOT NULL DEFAULT 0,
+        PRIMARY KEY (group_id, user_id),
+        FOREIGN KEY (group_id) REFERENCES group_chats(id) ON DELETE CASCADE,
+        FOREIGN KEY (user_id) REFERENCES user_verification(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS group_messages (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        group_id INT NOT NULL,
+        sender_id INT NOT NULL,
+        content TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (group_id) REFERENCES group_chats(id) ON DELETE CASCADE,
+        FOREIGN KEY (sender_id) REFERENCES user_verification(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS events (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        group_id INT NOT NULL,
+        title VARCHAR(255) NOT NULL,
+        description TEXT,
+        event_time DATETIME NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (group_id) REFERENCES group_chats(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS event_participants (
+        event_id INT NOT NULL,
+        user_id INT NOT NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'attending',
+        PRIMARY KEY (event_id, user_id),
+        FOREIGN KEY (event_id) REFERENCES events(id) ON DELETE CASCADE,
+        FOREIGN KEY (user_id) REFERENCES user_verification(id) ON DELETE CASCADE
+    )
+    """,
+]
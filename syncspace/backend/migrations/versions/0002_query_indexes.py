@@ -0,0 +1,20 @@
+# Composite indexes for the hot queries. Message history is paged by id, so
+# the conversation indexes end in id rather than created_at (InnoDB ids
+# follow insertion order).
+UP = [
+    # get_messages: one range per direction of a conversation
+    "CREATE INDEX idx_messages_pair ON messages (sender_id, recipient_id, id)",
+    # push channel catch-up: everything sent / received by one user
+    "CREATE INDEX idx_messages_sender ON messages (sender_id, id)",
+    "CREATE INDEX idx_messages_recipient ON messages (recipient_id, id)",
+    # get_group_messages
+    "CREATE INDEX idx_group_messages_group ON group_messages (group_id, id)",
+    # get_groups and the push channel: groups of one user
+    "CREATE INDEX idx_group_chat_members_user ON group_chat_members (user_id, group_id)",
+    # attending counts and reconciliation
+    "CREATE INDEX idx_event_participants_status ON event_participants (event_id, status)",
+    # get_user_events and member removal
+    "CREATE INDEX idx_event_participants_user ON event_participants (user_id, event_id)",
+    # get_group_events, ordered by time
+    "CREATE INDEX idx_events_group_time ON events (group_id, event_time)",
+]
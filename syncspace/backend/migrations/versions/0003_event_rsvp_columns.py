@@ -0,0 +1,18 @@
+# Lazy RSVPs and the denormalized attending counter, filled in for the
+# existing events. The count is frozen here rather than taken from
+# utils.events.ATTENDING_COUNT_SQL so that later changes to the application
+# cannot change what this migration does.
+UP = [
+    "ALTER TABLE events ADD COLUMN lazy_rsvp TINYINT(1) NOT NULL DEFAULT 0",
+    "ALTER TABLE events ADD COLUMN attending_count INT NOT NULL DEFAULT 0",
+    """
+    UPDATE events AS e SET attending_count = (
+        CASE WHEN e.lazy_rsvp = 1 THEN
+            (SELECT COUNT(*) FROM group_chat_members WHERE group_id = e.group_id)
+            - (SELECT COUNT(*) FROM event_participants WHERE event_id = e.id AND status = 'not_attending')
+        ELSE
+            (SELECT COUNT(*) FROM event_participants WHERE event_id = e.id AND status = 'attending')
+        END
+    )
+    """,
+]
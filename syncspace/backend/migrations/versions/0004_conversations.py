@@ -0,0 +1,53 @@
+# Per-user conversation summaries behind GET /inbox, filled from the existing
+# messages (all of which start out read). The fill is a frozen copy of
+# utils.inbox.REBUILD_STATEMENTS so that later changes to the application
+# cannot change what this migration does.
+UP = [
+    """
+    CREATE TABLE IF NOT EXISTS conversations (
+        user_id INT NOT NULL,
+        peer_id INT NOT NULL DEFAULT 0,
+        group_id INT NOT NULL DEFAULT 0,
+        last_message_id INT,
+        last_sender_id INT,
+        last_content TEXT,
+        last_activity DATETIME NOT NULL,
+        unread_count INT NOT NULL DEFAULT 0,
+        last_read_id INT,
+        PRIMARY KEY (user_id, peer_id, group_id),
+        FOREIGN KEY (user_id) REFERENCES user_verification(id) ON DELETE CASCADE
+    )
+    """,
+    # GET /inbox: one user's rows, most recent first
+    "CREATE INDEX idx_conversations_recent ON conversations (user_id, last_activity)",
+    # group message fan-out and group deletion
+    "CREATE INDEX idx_conversations_group ON conversations (group_id, user_id)",
+    # user deletion
+    "CREATE INDEX idx_conversations_peer ON conversations (peer_id)",
+    "DELETE FROM conversations",
+    """
+    INSERT INTO conversations (user_id, peer_id, group_id, last_message_id, last_sender_id, last_content,
+                               last_activity, unread_count, last_read_id)
+    SELECT c.user_id, c.peer_id, 0, m.id, m.sender_id, m.content, m.created_at, 0, m.id
+    FROM (
+        SELECT user_id, peer_id, MAX(id) as last_id FROM (
+            SELECT sender_id as user_id, recipient_id as peer_id, id FROM messages
+            UNION ALL
+            SELECT recipient_id as user_id, sender_id as peer_id, id FROM messages
+        ) exchanged
+        GROUP BY user_id, peer_id
+    ) c
+    JOIN messages m ON m.id = c.last_id
+    """,
+    """
+    INSERT INTO conversations (user_id, peer_id, group_id, last_message_id, last_sender_id, last_content,
+                               last_activity, unread_count, last_read_id)
+    SELECT gm.user_id, 0, gm.group_id, m.id, m.sender_id, m.content, COALESCE(m.created_at, g.created_at), 0, m.id
+    FROM group_chat_members gm
+    JOIN group_chats g ON g.id = gm.group_id
+    LEFT JOIN (
+        SELECT group_id, MAX(id) as last_id FROM group_messages GROUP BY group_id
+    ) latest ON latest.group_id = gm.group_id
+    LEFT JOIN group_messages m ON m.id = latest.last_id
+    """,
+]
@@ -0,0 +1,27 @@
+# Recurring events and per-occurrence RSVPs. recurrence holds the rule (NULL
+# for one-off events) and last_occurrence the start of the final occurrence,
+# so that an event overlaps the window [from, to) exactly when
+# event_time < to AND last_occurrence >= from.
+UP = [
+    "ALTER TABLE events ADD COLUMN recurrence VARCHAR(255)",
+    "ALTER TABLE events ADD COLUMN last_occurrence DATETIME",
+    "UPDATE events SET last_occurrence = event_time WHERE last_occurrence IS NULL",
+    # calendar windows of one group (GET /events goes through the user's groups)
+    "CREATE INDEX idx_events_group_window ON events (group_id, last_occurrence, event_time)",
+    # Answers for single occurrences of a recurring event that differ from
+    # the user's answer for the whole series. Occurrences without one are
+    # not stored.
+    """
+    CREATE TABLE IF NOT EXISTS event_occurrence_rsvps (
+        event_id INT NOT NULL,
+        occurrence_time DATETIME NOT NULL,
+        user_id INT NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        PRIMARY KEY (event_id, occurrence_time, user_id),
+        FOREIGN KEY (event_id) REFERENCES events(id) ON DELETE CASCADE,
+        FOREIGN KEY (user_id) REFERENCES user_verification(id) ON DELETE CASCADE
+    )
+    """,
+    # one user's answers inside a window, and member removal
+    "CREATE INDEX idx_event_occurrence_rsvps_user ON event_occurrence_rsvps (user_id, event_id, occurrence_time)",
+]
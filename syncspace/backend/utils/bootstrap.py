@@ -0,0 +1,104 @@
+from flask import request, jsonify
+from utils.config import settings
+from utils.db import get_db_connection, get_read_connection
+from utils.events import fetch_user_events, fetch_group_events, utc_now
+from utils.groups import fetch_user_groups, fetch_group_members, fetch_group_messages
+from utils.membership import membership
+from utils.message_cache import message_cache, direct_key, group_key
+from utils.inbox import fetch_inbox
+from utils.messages import fetch_direct_messages
+from utils.pagination import parse_page_args
+from utils.profiles import with_sender_names
+
+
+def _thread_page(key, fetch, before_id, after_id, limit):
+    # Same read path as the message routes: cached tail first, then a cache
+    # load, then a plain query.
+    result = None
+    if settings['MESSAGE_CACHE_ENABLED']:
+        result = message_cache.get_page(key, before_id, after_id, limit)
+        if result is None:
+            result = message_cache.load(key, lambda n: fetch(None, None, n), before_id, after_id, limit)
+    if result is None:
+        result = fetch(before_id, after_id, limit)
+    # Names are read from the primary: they go into the profile cache
+    return with_sender_names(result)
+
+
+def register_bootstrap_routes(app):
+    @app.route('/bootstrap', methods=['GET'])
+    def bootstrap():
+        # Everything the client shell needs on load in one response: the
+        # user, their groups, upcoming events and recent conversations, plus
+        # the first page of the thread picked by ?group_id= or ?other_user_id=.
+        user_id = request.args.get('user_id')
+        group_id = request.args.get('group_id')
+        other_user_id = request.args.get('other_user_id')
+
+        if not user_id:
+            return jsonify({"error": "Missing user_id parameter"}), 400
+        if group_id and other_user_id:
+            return jsonify({"error": "Pass either group_id or other_user_id, not both"}), 400
+
+        try:
+            before_id, after_id, limit = parse_page_args(request.args)
+            thread_key = None
+            if group_id:
+                thread_key = group_key(group_id)
+            elif other_user_id:
+                thread_key = direct_key(user_id, other_user_id)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Thread pages go through the message cache, which is filled from the
+        # primary.
+        db = get_db_connection() if settings['MESSAGE_CACHE_ENABLED'] else get_read_connection()
+        if db is None:
+            return jsonify({"error": "Database connection failed"}), 500
+
+        cursor = db.cursor()
+        try:
+            cursor.execute("SELECT id, name, username, email FROM user_verification WHERE id = %s", (user_id,))
+            user = cursor.fetchone()
+            if user is None:
+                return jsonify({"error": "User not found"}), 404
+
+            result = {
+                "user": {"id": user[0], "name": user[1], "username": user[2], "email": user[3]},
+                "groups": fetch_user_groups(cursor, user_id),
+                "events": fetch_user_events(cursor, user_id, start=utc_now()),
+                "conversations": fetch_inbox(cursor, user_id, settings['BOOTSTRAP_CONVERSATIONS']),
+                "thread": None
+            }
+
+            if group_id:
+                if not membership.is_member(None, group_id, user_id):
+                    return jsonify({"error": "User is not a member of this group"}), 403
+                result["thread"] = {
+                    "type": "group",
+                    "id": int(group_id),
+                    "messages": _thread_page(
+                        thread_key,
+                        lambda before, after, n: fetch_group_messages(cursor, group_id, before, after, n),
+                        before_id, after_id, limit
+                    ),
+                    "members": fetch_group_members(cursor, group_id),
+                    "events": fetch_group_events(cursor, group_id, user_id)
+                }
+            elif other_user_id:
+                result["thread"] = {
+                    "type": "direct",
+                    "id": int(other_user_id),
+                    "messages": _thread_page(
+                        thread_key,
+                        lambda before, after, n: fetch_direct_messages(cursor, user_id, other_user_id, before, after, n),
+                        before_id, after_id, limit
+                    )
+                }
+
+            return jsonify(result), 200
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        finally:
+            cursor.close()
+            db.close()
@@ -0,0 +1,279 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import pymysql
+from flask import Response, request, jsonify
+
+from utils.config import settings
+from utils.db import get_db_connection, get_streaming_db_connection
+from utils.events import user_events_query, group_events_query, format_user_event, format_group_event, utc_now
+from utils.groups import fetch_user_group_ids
+from utils.membership import membership
+from utils.recurrence import parse_time
+from utils.versions import versions, not_modified, tagged, group_version, user_version
+
+# iCalendar (RFC 5545) feeds for calendar apps that subscribe to a URL and
+# poll it. A feed lists the same events as GET /events or GET
+# /groups/<id>/events, a recurring event as one VEVENT with its RRULE
+# (answers for single occurrences are left out). Feeds are streamed from an
+# unbuffered cursor as they are generated, and the finished text is kept
+# under a token made of the version counters of the groups it was built
+# from. Creating or deleting an event and answering for one bump the
+# group's counter, so the next poll after a change regenerates the feed and
+# every other poll is answered from memory (or with a 304).
+
+MIMETYPE = 'text/calendar'
+PRODID = '-//SyncSpace//Calendar//EN'
+FOOTER = 'END:VCALENDAR\r\n'
+
+
+def _escape(value):
+    return (str(value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _fold(line):
+    # Content lines longer than 75 octets continue on the next line after a
+    # space, without splitting a UTF-8 sequence.
+    encoded = line.encode('utf-8')
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74
+        while encoded[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    parts.append(encoded.decode('utf-8'))
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _time(value):
+    return parse_time(value).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _header(name):
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}', 'CALSCALE:GREGORIAN', 'METHOD:PUBLISH',
+             f'X-WR-CALNAME:{_escape(name)}']
+    return ''.join(_fold(line) for line in lines)
+
+
+def _vevent(event, generated_at):
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:event-{event["id"]}@syncspace',
+        # RFC 5545: in a published feed DTSTAMP is when the feed was made
+        f'DTSTAMP:{generated_at}',
+        f'DTSTART:{_time(event["event_time"])}',
+        f'SUMMARY:{_escape(event["title"])}',
+    ]
+    if event["created_at"]:
+        lines.append(f'CREATED:{_time(event["created_at"])}')
+    if event["description"]:
+        lines.append(f'DESCRIPTION:{_escape(event["description"])}')
+    if event.get("group_name"):
+        lines.append(f'CATEGORIES:{_escape(event["group_name"])}')
+    if event["recurrence"]:
+        lines.append(f'RRULE:{event["recurrence"]}')
+    if event["user_status"] == 'not_attending':
+        # Shown, but not as busy time
+        lines.append('TRANSP:TRANSPARENT')
+    lines.append('END:VEVENT')
+    return ''.join(_fold(line) for line in lines)
+
+
+def _etag(token):
+    # The token of a user feed grows with their groups; the ETag is a digest.
+    if not settings['ETAGS_ENABLED']:
+        return None
+    return 'ics-' + hashlib.sha1(token.encode('utf-8')).hexdigest()[:24]
+
+
+class FeedCache:
+    # key -> (version keys, token, body, stored at), least recently used
+    # first. An entry is only served while versions.token() of its keys
+    # still matches, and for at most CALENDAR_CACHE_TTL seconds, which bounds
+    # how long changes made by other worker processes go unseen.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._feeds = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        # (token, body) of the cached feed if it is still current, else None.
+        now = time.monotonic()
+        ttl = settings['CALENDAR_CACHE_TTL']
+        with self._lock:
+            entry = self._feeds.get(key)
+            if entry is not None:
+                dependencies, token, body, stored_at = entry
+                if (not ttl or now - stored_at < ttl) and versions.token(*dependencies) == token:
+                    self.hits += 1
+                    self._feeds.move_to_end(key)
+                    return token, body
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, dependencies, token, body):
+        # token was taken before the feed was read; if anything changed
+        # since, the feed may be missing it and is not kept.
+        budget = settings['CALENDAR_CACHE_MAX_BYTES']
+        if len(body) > budget or versions.token(*dependencies) != token:
+            return
+        with self._lock:
+            self._remove(key)
+            self._feeds[key] = (dependencies, token, body, time.monotonic())
+            self._bytes += len(body)
+            while self._bytes > budget:
+                _, (_, _, evicted, _) = self._feeds.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._feeds.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[2])
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "feeds": len(self._feeds),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+feed_cache = FeedCache()
+
+
+def _cached_response(token, body):
+    etag = _etag(token)
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    return tagged(Response(body, mimetype=MIMETYPE), etag)
+
+
+def _stream_feed(db, key, dependencies, token, name, query, format_row):
+    # Streams the feed from db (a streaming connection, closed here) and
+    # caches the text once it has been sent in full.
+    etag = _etag(token)
+    cached = not_modified(etag)
+    if cached is not None:
+        db.close()
+        return cached
+
+    def generate():
+        budget = settings['CALENDAR_CACHE_MAX_BYTES'] if settings['CALENDAR_CACHE_ENABLED'] else 0
+        chunks, size = [], 0
+        cursor = db.cursor(pymysql.cursors.SSCursor)
+        try:
+            cursor.execute(*query)
+            generated_at = _time(utc_now())
+            for chunk in _rows(cursor, name, format_row, generated_at):
+                if chunks is not None:
+                    size += len(chunk)
+                    if size <= budget:
+                        chunks.append(chunk)
+                    else:
+                        chunks = None
+                yield chunk
+        finally:
+            cursor.close()
+            db.close()
+        if chunks is not None:
+            feed_cache.put(key, dependencies, token, ''.join(chunks).encode('utf-8'))
+
+    response = Response(generate(), mimetype=MIMETYPE)
+    # A body that never starts (HEAD, a client gone before the first chunk)
+    # does not run its finally, so the response closes db as well.
+    response.call_on_close(db.close)
+    return tagged(response, etag)
+
+
+def _rows(cursor, name, format_row, generated_at):
+    yield _header(name)
+    for row in cursor:
+        yield _vevent(format_row(row), generated_at)
+    yield FOOTER
+
+
+def register_calendar_routes(app):
+    @app.route('/users/<int:user_id>/calendar.ics', methods=['GET'])
+    def get_user_calendar(user_id):
+        key = ('user', user_id)
+        if settings['CALENDAR_CACHE_ENABLED']:
+            cached = feed_cache.get(key)
+            if cached is not None:
+                return _cached_response(*cached)
+
+        db = get_streaming_db_connection()
+        if db is None:
+            return jsonify({"error": "Database connection failed"}), 500
+
+        cursor = db.cursor()
+        try:
+            group_ids = fetch_user_group_ids(cursor, user_id)
+        except Exception as e:
+            cursor.close()
+            db.close()
+            return jsonify({"error": str(e)}), 500
+        cursor.close()
+
+        # Joining or leaving a group bumps the user; events of groups the
+        # user has left are only refreshed by the TTL.
+        dependencies = (user_version(user_id),) + tuple(group_version(group_id) for group_id in group_ids)
+        token = versions.token(*dependencies)
+        return _stream_feed(db, key, dependencies, token, 'SyncSpace', user_events_query(user_id),
+                            format_user_event)
+
+    @app.route('/groups/<int:group_id>/calendar.ics', methods=['GET'])
+    def get_group_calendar(group_id):
+        user_id = request.args.get('user_id')
+
+        if not user_id:
+            return jsonify({"error": "Missing user_id parameter"}), 400
+
+        db = get_db_connection()
+        if db is None:
+            return jsonify({"error": "Database connection failed"}), 500
+
+        key = ('group', group_id)
+        cached = None
+        cursor = db.cursor()
+        try:
+            if not membership.is_member(cursor, group_id, user_id):
+                return jsonify({"error": "User is not a member of this group"}), 403
+            if settings['CALENDAR_CACHE_ENABLED']:
+                cached = feed_cache.get(key)
+            if cached is None:
+                cursor.execute("SELECT name FROM group_chats WHERE id = %s", (group_id,))
+                group_name = cursor.fetchone()[0]
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        finally:
+            cursor.close()
+            db.close()
+
+        if cached is not None:
+            return _cached_response(*cached)
+
+        db = get_streaming_db_connection()
+        if db is None:
+            return jsonify({"error": "Database connection failed"}), 500
+
+        dependencies = (group_version(group_id),)
+        token = versions.token(*dependencies)
+        # No user: the feed is the same for every member
+        return _stream_feed(db, key, dependencies, token, f'SyncSpace: {group_name}',
+                            group_events_query(group_id, None), format_group_event)
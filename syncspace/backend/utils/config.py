@@ -0,0 +1,158 @@
+import os
+
+
+def _env(name, default, cast=str):
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    if cast is bool:
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return cast(value)
+
+
+# Runtime settings shared by the backend modules. Every value can be overridden
+# with a SYNCSPACE_* environment variable; modules read from this dict at call
+# time so changes made during startup take effect everywhere.
+settings = {
+    # Database backend: 'mysql' (the server below, or any local
+    # MySQL-compatible one) or 'sqlite', an embedded database in DB_PATH for
+    # tests and benchmarks. DB_AUTO_MIGRATE applies pending migrations at
+    # start-up; the sqlite backend always does, so its schema is created on
+    # first use.
+    'DB_BACKEND': _env('SYNCSPACE_DB_BACKEND', 'mysql'),
+    'DB_PATH': _env('SYNCSPACE_DB_PATH', 'syncspace.db'),
+    'DB_AUTO_MIGRATE': _env('SYNCSPACE_DB_AUTO_MIGRATE', False, bool),
+
+    # Database connection
+    'DB_HOST': _env('SYNCSPACE_DB_HOST', 'syncspace.cneuuiucg129.us-east-2.rds.amazonaws.com'),
+    'DB_PORT': _env('SYNCSPACE_DB_PORT', 3306, int),
+    'DB_USER': _env('SYNCSPACE_DB_USER', 'admin'),
+    'DB_PASSWORD': _env('SYNCSPACE_DB_PASSWORD', 'syncspace'),
+    'DB_NAME': _env('SYNCSPACE_DB_NAME', 'data'),
+    'DB_CONNECT_TIMEOUT': _env('SYNCSPACE_DB_CONNECT_TIMEOUT', 10, int),
+
+    # Read replicas as "host[:port],host[:port]" (empty: every read goes to
+    # the primary). Replicas more than DB_REPLICA_MAX_LAG seconds behind, as
+    # measured every DB_REPLICA_CHECK_INTERVAL seconds, leave the rotation.
+    # For DB_STICKY_SECONDS after a client writes, its reads stay on the
+    # primary; the client carries the time of its last write in the
+    # X-SyncSpace-Last-Write header, so this holds across workers.
+    'DB_REPLICAS': _env('SYNCSPACE_DB_REPLICAS', ''),
+    'DB_REPLICA_MAX_LAG': _env('SYNCSPACE_DB_REPLICA_MAX_LAG', 5.0, float),
+    'DB_REPLICA_CHECK_INTERVAL': _env('SYNCSPACE_DB_REPLICA_CHECK_INTERVAL', 2.0, float),
+    'DB_STICKY_SECONDS': _env('SYNCSPACE_DB_STICKY_SECONDS', 5.0, float),
+
+    # Connection pool
+    'DB_POOL_MIN_SIZE': _env('SYNCSPACE_DB_POOL_MIN_SIZE', 1, int),
+    'DB_POOL_MAX_SIZE': _env('SYNCSPACE_DB_POOL_MAX_SIZE', 10, int),
+    'DB_POOL_TIMEOUT': _env('SYNCSPACE_DB_POOL_TIMEOUT', 5.0, float),
+    'DB_POOL_RECYCLE': _env('SYNCSPACE_DB_POOL_RECYCLE', 3600.0, float),
+    'DB_POOL_PING_AFTER': _env('SYNCSPACE_DB_POOL_PING_AFTER', 1.0, float),
+
+    # Message history pages
+    'MESSAGE_PAGE_DEFAULT': _env('SYNCSPACE_MESSAGE_PAGE_DEFAULT', 50, int),
+    'MESSAGE_PAGE_MAX': _env('SYNCSPACE_MESSAGE_PAGE_MAX', 200, int),
+
+    # Push channel for new messages
+    'STREAM_QUEUE_SIZE': _env('SYNCSPACE_STREAM_QUEUE_SIZE', 100, int),
+    'STREAM_BACKLOG': _env('SYNCSPACE_STREAM_BACKLOG', 50, int),
+    'STREAM_BACKLOG_TOPICS': _env('SYNCSPACE_STREAM_BACKLOG_TOPICS', 10000, int),
+    'STREAM_HEARTBEAT': _env('SYNCSPACE_STREAM_HEARTBEAT', 15.0, float),
+    'STREAM_MAX_AGE': _env('SYNCSPACE_STREAM_MAX_AGE', 300.0, float),
+    'LONG_POLL_TIMEOUT': _env('SYNCSPACE_LONG_POLL_TIMEOUT', 25.0, float),
+    # Streams and long polls each hold a server thread until they end; past
+    # this many open at once (per process, 0 for no cap) new ones are turned
+    # away so they cannot take every thread from ordinary requests.
+    'STREAM_MAX_CONNECTIONS': _env('SYNCSPACE_STREAM_MAX_CONNECTIONS', 16, int),
+    'STREAM_BUSY_RETRY': _env('SYNCSPACE_STREAM_BUSY_RETRY', 10.0, float),
+
+    # Hot-tail message cache (per process; writes from other processes are
+    # not seen, so disable it when several workers serve the same users)
+    'MESSAGE_CACHE_ENABLED': _env('SYNCSPACE_MESSAGE_CACHE_ENABLED', True, bool),
+    'MESSAGE_CACHE_TAIL': _env('SYNCSPACE_MESSAGE_CACHE_TAIL', 100, int),
+    'MESSAGE_CACHE_MAX_BYTES': _env('SYNCSPACE_MESSAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024, int),
+
+    # User profiles used to put sender names on messages. 'local' keeps the
+    # PROFILE_CACHE_ENTRIES most recently used in each process; 'redis'
+    # shares them between workers through the Redis-compatible server at
+    # PROFILE_CACHE_URL (needs the redis package), so a rename is seen by
+    # all of them. Either way entries expire after PROFILE_CACHE_TTL seconds.
+    'PROFILE_CACHE_BACKEND': _env('SYNCSPACE_PROFILE_CACHE_BACKEND', 'local'),
+    'PROFILE_CACHE_URL': _env('SYNCSPACE_PROFILE_CACHE_URL', 'redis://127.0.0.1:6379/0'),
+    'PROFILE_CACHE_ENTRIES': _env('SYNCSPACE_PROFILE_CACHE_ENTRIES', 100000, int),
+    'PROFILE_CACHE_TTL': _env('SYNCSPACE_PROFILE_CACHE_TTL', 300.0, float),
+
+    # Group membership / admin cache used for authorization checks
+    'MEMBERSHIP_CACHE_GROUPS': _env('SYNCSPACE_MEMBERSHIP_CACHE_GROUPS', 10000, int),
+    'MEMBERSHIP_CACHE_TTL': _env('SYNCSPACE_MEMBERSHIP_CACHE_TTL', 30.0, float),
+
+    # Events in groups with at least this many members store only RSVP
+    # overrides instead of one participant row per member (0 disables)
+    'LAZY_RSVP_MIN_MEMBERS': _env('SYNCSPACE_LAZY_RSVP_MIN_MEMBERS', 1000, int),
+
+    # Longest from/to window the event listings expand recurring events in
+    'EVENT_WINDOW_MAX_DAYS': _env('SYNCSPACE_EVENT_WINDOW_MAX_DAYS', 5 * 366, int),
+
+    # Generated iCalendar feeds, kept until an event in one of their groups
+    # changes (as seen by this process) or for at most CALENDAR_CACHE_TTL
+    # seconds, in up to CALENDAR_CACHE_MAX_BYTES per process
+    'CALENDAR_CACHE_ENABLED': _env('SYNCSPACE_CALENDAR_CACHE_ENABLED', True, bool),
+    'CALENDAR_CACHE_TTL': _env('SYNCSPACE_CALENDAR_CACHE_TTL', 300.0, float),
+    'CALENDAR_CACHE_MAX_BYTES': _env('SYNCSPACE_CALENDAR_CACHE_MAX_BYTES', 16 * 1024 * 1024, int),
+
+    # In-memory user search index; rebuilt every SEARCH_INDEX_REFRESH seconds
+    # (0 disables) to pick up users created by other worker processes
+    'SEARCH_INDEX_ENABLED': _env('SYNCSPACE_SEARCH_INDEX_ENABLED', True, bool),
+    'SEARCH_INDEX_REFRESH': _env('SYNCSPACE_SEARCH_INDEX_REFRESH', 300.0, float),
+
+    # Largest page GET /users returns when a limit is given
+    'USERS_PAGE_MAX': _env('SYNCSPACE_USERS_PAGE_MAX', 1000, int),
+
+    # bcrypt runs on a pool of PASSWORD_WORKERS threads with room for
+    # PASSWORD_QUEUE waiting jobs; further requests get a 503. Hashes with a
+    # different cost than BCRYPT_ROUNDS are upgraded on the next login.
+    'PASSWORD_WORKERS': _env('SYNCSPACE_PASSWORD_WORKERS', os.cpu_count() or 2, int),
+    'PASSWORD_QUEUE': _env('SYNCSPACE_PASSWORD_QUEUE', 32, int),
+    'BCRYPT_ROUNDS': _env('SYNCSPACE_BCRYPT_ROUNDS', 12, int),
+
+    # Group commit for message inserts: concurrent sends arriving within
+    # MESSAGE_BATCH_WAIT_MS are written with one INSERT and one commit
+    'MESSAGE_BATCHING_ENABLED': _env('SYNCSPACE_MESSAGE_BATCHING_ENABLED', False, bool),
+    'MESSAGE_BATCH_WAIT_MS': _env('SYNCSPACE_MESSAGE_BATCH_WAIT_MS', 2.0, float),
+    'MESSAGE_BATCH_MAX': _env('SYNCSPACE_MESSAGE_BATCH_MAX', 100, int),
+
+    # Conversations returned by GET /inbox without / with the largest limit
+    'INBOX_PAGE_DEFAULT': _env('SYNCSPACE_INBOX_PAGE_DEFAULT', 50, int),
+    'INBOX_PAGE_MAX': _env('SYNCSPACE_INBOX_PAGE_MAX', 200, int),
+
+    # Number of recent conversations returned by GET /bootstrap
+    'BOOTSTRAP_CONVERSATIONS': _env('SYNCSPACE_BOOTSTRAP_CONVERSATIONS', 20, int),
+
+    # ETags for group/event listings come from in-process version counters;
+    # like the caches above they only see writes made by this process
+    'ETAGS_ENABLED': _env('SYNCSPACE_ETAGS_ENABLED', True, bool),
+    'VERSION_CACHE_ENTRIES': _env('SYNCSPACE_VERSION_CACHE_ENTRIES', 100000, int),
+
+    # JSON bodies of at least COMPRESS_MIN_BYTES are sent brotli (when the
+    # brotli package is installed) or gzip compressed
+    'COMPRESS_ENABLED': _env('SYNCSPACE_COMPRESS_ENABLED', True, bool),
+    'COMPRESS_MIN_BYTES': _env('SYNCSPACE_COMPRESS_MIN_BYTES', 1024, int),
+    'COMPRESS_GZIP_LEVEL': _env('SYNCSPACE_COMPRESS_GZIP_LEVEL', 6, int),
+    'COMPRESS_BROTLI_QUALITY': _env('SYNCSPACE_COMPRESS_BROTLI_QUALITY', 5, int),
+
+    # Seconds between retries of failed start-up warm-up steps
+    'WARM_UP_RETRY': _env('SYNCSPACE_WARM_UP_RETRY', 5.0, float),
+
+    # Per-route request metrics, exported in Prometheus format at /metrics
+    'METRICS_ENABLED': _env('SYNCSPACE_METRICS_ENABLED', True, bool),
+
+    # Query profiling: statements slower than SLOW_QUERY_MS are logged (with
+    # an EXPLAIN), statements run QUERY_REPEAT_THRESHOLD or more times in one
+    # request are reported, and QUERY_DEBUG_HEADERS adds Server-Timing /
+    # X-Query-Count headers to every response
+    'QUERY_PROFILING_ENABLED': _env('SYNCSPACE_QUERY_PROFILING_ENABLED', True, bool),
+    'SLOW_QUERY_MS': _env('SYNCSPACE_SLOW_QUERY_MS', 200.0, float),
+    'SLOW_QUERY_EXPLAIN': _env('SYNCSPACE_SLOW_QUERY_EXPLAIN', True, bool),
+    'QUERY_REPEAT_THRESHOLD': _env('SYNCSPACE_QUERY_REPEAT_THRESHOLD', 10, int),
+    'QUERY_DEBUG_HEADERS': _env('SYNCSPACE_QUERY_DEBUG_HEADERS', False, bool),
+}
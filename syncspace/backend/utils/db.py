@@ -1,13 +1,562 @@
+import re
+import threading
+import time
+from collections import deque
+
 import pymysql
+from flask import g, has_request_context, request
+
+from utils import sqlite_db
+from utils.config import settings
+from utils.querylog import InstrumentedCursor
+
+BACKENDS = ('mysql', 'sqlite')
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class _PooledConnection:
+    # A raw connection plus the bookkeeping the pool needs to decide whether
+    # it is still safe to hand out.
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    def __init__(self, connect, min_size=1, max_size=10, timeout=5.0, recycle=3600.0, ping_after=1.0):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+
+        self._idle = deque()
+        self._cond = threading.Condition()
+        self._size = 0
+
+        # Counters
+        self.waiting = 0
+        self.in_use = 0
+        self.created = 0
+        self.recycled = 0
+        self.discarded = 0
+        self.timeouts = 0
+
+    def _open(self):
+        conn = _PooledConnection(self._connect())
+        with self._cond:
+            self.created += 1
+        return conn
+
+    def _close(self, pooled):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def _validate(self, pooled):
+        now = time.monotonic()
+        if self.recycle and now - pooled.created_at > self.recycle:
+            self._close(pooled)
+            with self._cond:
+                self.recycled += 1
+            return self._open()
+        if now - pooled.last_used > self.ping_after:
+            try:
+                pooled.conn.ping(reconnect=False)
+            except Exception:
+                self._close(pooled)
+                with self._cond:
+                    self.discarded += 1
+                return self._open()
+        return pooled
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    pooled = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    pooled = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                self.waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.in_use += 1
+
+        # Connecting and pinging happen outside the lock so that one slow
+        # handshake does not hold up every other borrower.
+        try:
+            if pooled is None:
+                return self._open()
+            return self._validate(pooled)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self.in_use -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, pooled):
+        discard = False
+        try:
+            # End whatever transaction the borrower left open so the next one
+            # does not read from a stale snapshot.
+            pooled.conn.rollback()
+        except Exception:
+            discard = True
+
+        with self._cond:
+            self.in_use -= 1
+            if discard:
+                self._size -= 1
+                self.discarded += 1
+            else:
+                pooled.last_used = time.monotonic()
+                self._idle.append(pooled)
+            self._cond.notify()
+
+        if discard:
+            self._close(pooled)
+
+    def fill(self):
+        # Open connections until the pool holds at least min_size of them.
+        opened = []
+        with self._cond:
+            missing = max(0, self.min_size - self._size)
+            self._size += missing
+        try:
+            for _ in range(missing):
+                opened.append(self._open())
+        finally:
+            with self._cond:
+                self._size -= missing - len(opened)
+                self._idle.extend(opened)
+                self._cond.notify_all()
+        return len(opened)
+
+    def close_all(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+        for pooled in idle:
+            self._close(pooled)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self.in_use,
+                "waiting": self.waiting,
+                "created": self.created,
+                "recycled": self.recycled,
+                "discarded": self.discarded,
+                "timeouts": self.timeouts,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            }
+
+
+class _Lease:
+    # One checked-out connection shared by every get_db_connection() call made
+    # on the same thread until the last handle is closed.
+    def __init__(self, pool, pooled):
+        self.pool = pool
+        self.pooled = pooled
+        self.refs = 0
+
+    def release(self):
+        self.refs -= 1
+        if self.refs == 0:
+            leases = getattr(_local, 'leases', None)
+            if leases is not None and leases.get(self.pool) is self:
+                del leases[self.pool]
+            self.pool.release(self.pooled)
+
+
+class ConnectionHandle:
+    # Behaves like a pymysql connection; close() gives the connection back to
+    # the pool instead of tearing down the socket.
+    def __init__(self, lease):
+        self._lease = lease
+        self._closed = False
+
+    def __getattr__(self, name):
+        if self._closed:
+            raise pymysql.err.InterfaceError(0, "Connection handle already closed")
+        return getattr(self._lease.pooled.conn, name)
+
+    def cursor(self, *args, **kwargs):
+        cursor = self.__getattr__('cursor')(*args, **kwargs)
+        if settings['QUERY_PROFILING_ENABLED']:
+            return InstrumentedCursor(cursor)
+        return cursor
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._lease.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Replica:
+    # One read replica: its own connection pool plus the replication lag
+    # last measured on it.
+    def __init__(self, host, port, pool):
+        self.name = f"{host}:{port}"
+        self.key = re.sub(r'\W', '_', self.name)
+        self.pool = pool
+        self.lag = None
+        self.checked_at = 0.0
+        self.checking = False
+        self.failures = 0
+
+    def measure_lag(self):
+        # Seconds behind the primary, or None if replication is not running.
+        pooled = self.pool.acquire()
+        try:
+            cursor = pooled.conn.cursor(pymysql.cursors.DictCursor)
+            try:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except pymysql.err.ProgrammingError:
+                    # MySQL before 8.0.22
+                    cursor.execute("SHOW SLAVE STATUS")
+                row = cursor.fetchone()
+            finally:
+                cursor.close()
+        finally:
+            self.pool.release(pooled)
+        if row is None:
+            # Not replicating at all, so not behind either (a primary listed
+            # as a replica in development).
+            return 0.0
+        lag = row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+        return float(lag) if lag is not None else None
+
+
+class ReplicaSet:
+    # Hands out replicas round-robin, skipping any whose last measured lag is
+    # above max_lag or unknown. Lag is re-measured in the background every
+    # check_interval seconds, so choose() never waits on it.
+    def __init__(self, replicas, max_lag=5.0, check_interval=2.0):
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._next = 0
+        self.chosen = 0
+        self.skipped = 0
+
+    def _healthy(self, replica):
+        return replica.lag is not None and replica.lag <= self.max_lag
+
+    def _check(self, replica):
+        try:
+            lag = replica.measure_lag()
+            failed = False
+        except Exception as e:
+            print(f"Error checking replica {replica.name}: {e}")
+            lag = None
+            failed = True
+        with self._lock:
+            was_healthy = self._healthy(replica)
+            replica.lag = lag
+            replica.checked_at = time.monotonic()
+            replica.checking = False
+            if failed:
+                replica.failures += 1
+            if was_healthy and not self._healthy(replica):
+                print(f"Replica {replica.name} taken out of rotation (lag {lag})")
+
+    def _schedule_checks(self):
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            for replica in self.replicas:
+                if not replica.checking and now - replica.checked_at >= self.check_interval:
+                    replica.checking = True
+                    due.append(replica)
+        for replica in due:
+            threading.Thread(target=self._check, args=(replica,), name='replica-lag-check', daemon=True).start()
+
+    def choose(self):
+        self._schedule_checks()
+        with self._lock:
+            for offset in range(len(self.replicas)):
+                replica = self.replicas[(self._next + offset) % len(self.replicas)]
+                if self._healthy(replica):
+                    self._next = (self._next + offset + 1) % len(self.replicas)
+                    self.chosen += 1
+                    return replica
+            self.skipped += 1
+            return None
+
+    def failed(self, replica):
+        # A replica that could not hand out a connection leaves the rotation
+        # until its next successful lag check.
+        with self._lock:
+            replica.lag = None
+            replica.failures += 1
+
+    def close_all(self):
+        for replica in self.replicas:
+            replica.pool.close_all()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "chosen": self.chosen,
+                "primary_fallbacks": self.skipped,
+                "replicas": {
+                    replica.key: {
+                        "healthy": self._healthy(replica),
+                        "lag_seconds": replica.lag if replica.lag is not None else -1,
+                        "failures": replica.failures,
+                    }
+                    for replica in self.replicas
+                },
+            }
+
+
+# Response header holding the time of the request's write, and request header
+# a client echoes it back in.
+STICKY_HEADER = 'X-SyncSpace-Last-Write'
+
+
+class RecentWrites:
+    # Read-your-writes across worker processes. A request that writes answers
+    # with STICKY_HEADER set to the time of the write; the client sends that
+    # value back, and for DB_STICKY_SECONDS after it its reads go to the
+    # primary, whichever worker serves them.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.marked = 0
+        self.sticky_reads = 0
+
+    def mark(self):
+        if not settings['DB_REPLICAS'] or not has_request_context():
+            return
+        g.db_last_write = time.time()
+        with self._lock:
+            self.marked += 1
+
+    def contains(self):
+        # Whether the current request comes from a client that wrote recently
+        if not has_request_context():
+            return False
+        last_write = g.get('db_last_write')
+        if last_write is None:
+            try:
+                last_write = float(request.headers.get(STICKY_HEADER, ''))
+            except ValueError:
+                return False
+        if time.time() - last_write >= settings['DB_STICKY_SECONDS']:
+            return False
+        with self._lock:
+            self.sticky_reads += 1
+        return True
+
+    def add_header(self, response):
+        last_write = g.get('db_last_write')
+        if last_write is not None:
+            response.headers[STICKY_HEADER] = f"{last_write:.3f}"
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {"marked": self.marked, "sticky_reads": self.sticky_reads}
+
+
+recent_writes = RecentWrites()
+
+_local = threading.local()
+_pool = None
+_replicas = None
+_pool_lock = threading.Lock()
+
+
+def _connect(host=None, port=None):
+    if settings['DB_BACKEND'] == 'sqlite':
+        return sqlite_db.connect(settings['DB_PATH'], timeout=settings['DB_CONNECT_TIMEOUT'])
+    return pymysql.connect(
+        host=host or settings['DB_HOST'],
+        port=port or settings['DB_PORT'],
+        user=settings['DB_USER'],
+        password=settings['DB_PASSWORD'],
+        database=settings['DB_NAME'],
+        connect_timeout=settings['DB_CONNECT_TIMEOUT'],
+    )
+
+
+def _new_pool(connect):
+    return ConnectionPool(
+        connect,
+        min_size=settings['DB_POOL_MIN_SIZE'],
+        max_size=settings['DB_POOL_MAX_SIZE'],
+        timeout=settings['DB_POOL_TIMEOUT'],
+        recycle=settings['DB_POOL_RECYCLE'],
+        ping_after=settings['DB_POOL_PING_AFTER'],
+    )
+
+
+def _parse_replicas(value):
+    # "host[:port],host[:port]" -> [(host, port)]
+    hosts = []
+    for entry in value.split(','):
+        entry = entry.strip()
+        if entry:
+            host, _, port = entry.partition(':')
+            hosts.append((host, int(port) if port else settings['DB_PORT']))
+    return hosts
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if settings['DB_BACKEND'] not in BACKENDS:
+                    raise ValueError(f"Unknown DB_BACKEND {settings['DB_BACKEND']!r}; expected one of {BACKENDS}")
+                _pool = _new_pool(_connect)
+    return _pool
+
+
+def get_replicas():
+    # The configured replicas, or None when reads all go to the primary.
+    global _replicas
+    if _replicas is None and settings['DB_REPLICAS'] and settings['DB_BACKEND'] == 'mysql':
+        with _pool_lock:
+            if _replicas is None:
+                _replicas = ReplicaSet(
+                    [Replica(host, port, _new_pool(lambda host=host, port=port: _connect(host, port)))
+                     for host, port in _parse_replicas(settings['DB_REPLICAS'])],
+                    max_lag=settings['DB_REPLICA_MAX_LAG'],
+                    check_interval=settings['DB_REPLICA_CHECK_INTERVAL'],
+                )
+    return _replicas
+
+
+def reset_pool():
+    # Drop the current pools (for example after settings change or a fork).
+    global _pool, _replicas
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        if _replicas is not None:
+            _replicas.close_all()
+        _pool = None
+        _replicas = None
+    _local.leases = {}
+
+
+def _thread_connection(pool):
+    # Raises PoolTimeout or a pymysql error if no connection can be had.
+    leases = getattr(_local, 'leases', None)
+    if leases is None:
+        leases = _local.leases = {}
+    lease = leases.get(pool)
+    if lease is None or lease.refs <= 0:
+        lease = _Lease(pool, pool.acquire())
+        leases[pool] = lease
+    lease.refs += 1
+    return ConnectionHandle(lease)
+
 
 def get_db_connection():
     try:
-        return pymysql.connect(
-            host="syncspace.cneuuiucg129.us-east-2.rds.amazonaws.com", 
-            user="admin", 
-            password="syncspace", 
-            database="data"
-        )
-    except pymysql.MySQLError as e:
+        return _thread_connection(get_pool())
+    except (pymysql.MySQLError, PoolTimeout) as e:
         print(f"Error connecting to the database: {e}")
-        return None 
\ No newline at end of file
+        return None
+
+
+def get_read_connection():
+    # A connection for a read-only handler. Goes to a replica unless none is
+    # configured or healthy, the client wrote recently, or this thread
+    # already holds a primary connection (reads inside a write must see it).
+    # Reads whose results feed the in-process caches or ETags must not use
+    # it, as a lagging replica would pin stale data there.
+    replicas = get_replicas()
+    if replicas is None or recent_writes.contains():
+        return get_db_connection()
+    primary = getattr(_local, 'leases', {}).get(_pool)
+    if primary is not None and primary.refs > 0:
+        return get_db_connection()
+    replica = replicas.choose()
+    if replica is None:
+        return get_db_connection()
+    try:
+        return _thread_connection(replica.pool)
+    except (pymysql.MySQLError, PoolTimeout) as e:
+        print(f"Error connecting to replica {replica.name}: {e}")
+        replicas.failed(replica)
+        return get_db_connection()
+
+
+def get_streaming_db_connection():
+    # A connection owned by a streamed response body rather than the request
+    # thread: it is not shared with other calls and not released at teardown,
+    # so the generator using it must close it.
+    pool = get_pool()
+    try:
+        pooled = pool.acquire()
+    except (pymysql.MySQLError, PoolTimeout) as e:
+        print(f"Error connecting to the database: {e}")
+        return None
+    lease = _Lease(pool, pooled)
+    lease.refs = 1
+    return ConnectionHandle(lease)
+
+
+def release_thread_connection():
+    # Safety net run at the end of every request: hand back connections that
+    # a handler forgot to close.
+    leases = getattr(_local, 'leases', None)
+    _local.leases = {}
+    for lease in (leases or {}).values():
+        if lease.refs > 0:
+            lease.refs = 1
+            lease.release()
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def replica_stats():
+    replicas = get_replicas()
+    stats = replicas.stats() if replicas is not None else {"replicas": {}}
+    stats["sticky"] = recent_writes.stats()
+    return stats
+
+
+def init_app(app):
+    app.after_request(recent_writes.add_header)
+
+    @app.teardown_request
+    def _release_db_connection(exc):
+        release_thread_connection()
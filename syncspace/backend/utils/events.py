@@ -1,5 +1,271 @@
+import datetime
+
 from flask import request, jsonify
-from utils.db import get_db_connection
+from utils.config import settings
+from utils.db import get_db_connection, get_read_connection, recent_writes
+from utils.membership import membership
+from utils.recurrence import parse_time, parse_rule, occurrences, is_occurrence, last_occurrence, FOREVER
+from utils.versions import versions, not_modified, tagged, PROFILES, group_version, event_version
+
+# Events in groups with at least LAZY_RSVP_MIN_MEMBERS members use lazy RSVPs:
+# every member is implicitly attending and event_participants only stores the
+# members who changed their answer. Other events keep one row per participant.
+#
+# Recurring events are one row with a rule (see utils/recurrence.py); their
+# occurrences are expanded only inside the window being read, and answers for
+# single occurrences are stored as overrides in event_occurrence_rsvps.
+#
+# events.attending_count is maintained by the write paths below; this is the
+# expression it must agree with, used by the reconciliation job. It counts
+# the series as a whole; occurrences adjust it by their overrides.
+ATTENDING_COUNT_SQL = """
+    CASE WHEN e.lazy_rsvp = 1 THEN
+        (SELECT COUNT(*) FROM group_chat_members WHERE group_id = e.group_id)
+        - (SELECT COUNT(*) FROM event_participants WHERE event_id = e.id AND status = 'not_attending')
+    ELSE
+        (SELECT COUNT(*) FROM event_participants WHERE event_id = e.id AND status = 'attending')
+    END
+"""
+
+
+def add_member_to_events(cursor, group_id):
+    # A new member is implicitly attending every lazy-RSVP event of the group.
+    cursor.execute(
+        "UPDATE events SET attending_count = attending_count + 1 WHERE group_id = %s AND lazy_rsvp = 1",
+        (group_id,)
+    )
+
+
+def remove_member_from_events(cursor, group_id, user_id):
+    # Drop a removed member from the group's upcoming events (and from every
+    # lazy-RSVP event, where attendance follows membership) and keep the
+    # counters in step. A recurring event is upcoming until its last
+    # occurrence. Runs inside the caller's transaction.
+    cursor.execute("""
+        UPDATE events SET attending_count = attending_count - 1
+        WHERE group_id = %s AND lazy_rsvp = 0 AND last_occurrence >= NOW()
+        AND id IN (SELECT event_id FROM event_participants WHERE user_id = %s AND status = 'attending')
+    """, (group_id, user_id))
+    cursor.execute("""
+        UPDATE events SET attending_count = attending_count - 1
+        WHERE group_id = %s AND lazy_rsvp = 1
+        AND id NOT IN (SELECT event_id FROM event_participants WHERE user_id = %s AND status = 'not_attending')
+    """, (group_id, user_id))
+    cursor.execute("""
+        DELETE FROM event_occurrence_rsvps
+        WHERE user_id = %s
+        AND event_id IN (SELECT id FROM events WHERE group_id = %s AND (lazy_rsvp = 1 OR last_occurrence >= NOW()))
+    """, (user_id, group_id))
+    cursor.execute("""
+        DELETE FROM event_participants
+        WHERE user_id = %s
+        AND event_id IN (SELECT id FROM events WHERE group_id = %s AND (lazy_rsvp = 1 OR last_occurrence >= NOW()))
+    """, (user_id, group_id))
+
+
+def remove_user_from_events(cursor, user_id):
+    # Before a user is deleted: take their attendance off the counters of
+    # every event, past ones included, as the delete cascades to all of their
+    # RSVPs and memberships. Returns the ids of the groups whose events
+    # changed. Runs inside the caller's transaction.
+    cursor.execute("""
+        SELECT DISTINCT e.group_id FROM events e
+        JOIN event_participants ep ON ep.event_id = e.id
+        WHERE ep.user_id = %s
+        UNION
+        SELECT group_id FROM group_chat_members WHERE user_id = %s
+    """, (user_id, user_id))
+    group_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("""
+        UPDATE events SET attending_count = attending_count - 1
+        WHERE lazy_rsvp = 0
+        AND id IN (SELECT event_id FROM event_participants WHERE user_id = %s AND status = 'attending')
+    """, (user_id,))
+    cursor.execute("""
+        UPDATE events SET attending_count = attending_count - 1
+        WHERE lazy_rsvp = 1
+        AND group_id IN (SELECT group_id FROM group_chat_members WHERE user_id = %s)
+        AND id NOT IN (SELECT event_id FROM event_participants WHERE user_id = %s AND status = 'not_attending')
+    """, (user_id, user_id))
+    return group_ids
+
+
+def utc_now():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+def parse_window(args):
+    # ?from=&to= (ISO 8601, UTC), both or neither: (start, end) or (None, None).
+    start, end = args.get('from'), args.get('to')
+    if not start and not end:
+        return None, None
+    if not start or not end:
+        raise ValueError("Pass both from and to")
+    start, end = parse_time(start), parse_time(end)
+    if end <= start:
+        raise ValueError("to must be after from")
+    if end - start > datetime.timedelta(days=settings['EVENT_WINDOW_MAX_DAYS']):
+        raise ValueError(f"The window can span at most {settings['EVENT_WINDOW_MAX_DAYS']} days")
+    return start, end
+
+
+def _window_clause(start, end):
+    # An event overlaps [start, end) when it begins before the end and its
+    # last occurrence is not before the start.
+    condition, params = "", ()
+    if start is not None:
+        condition += " AND e.last_occurrence >= %s"
+        params += (start,)
+    if end is not None:
+        condition += " AND e.event_time < %s"
+        params += (end,)
+    return condition, params
+
+
+def _occurrence_answers(cursor, event_ids, user_id, start, end):
+    # Overrides of the given series between start and end: how much each
+    # occurrence's attending count differs from the series, and the user's
+    # own answers.
+    placeholders = ", ".join(["%s"] * len(event_ids))
+    cursor.execute(f"""
+        SELECT o.event_id, o.occurrence_time, o.user_id, o.status,
+               CASE WHEN e.lazy_rsvp = 1 THEN COALESCE(ep.status, 'attending') ELSE ep.status END
+        FROM event_occurrence_rsvps o
+        JOIN events e ON e.id = o.event_id
+        LEFT JOIN event_participants ep ON ep.event_id = o.event_id AND ep.user_id = o.user_id
+        WHERE o.event_id IN ({placeholders}) AND o.occurrence_time >= %s AND o.occurrence_time < %s
+    """, tuple(event_ids) + (start, end))
+    deltas, answers = {}, {}
+    user_id = int(user_id)
+    for event_id, occurrence_time, answer_user_id, status, series_status in cursor.fetchall():
+        key = (event_id, occurrence_time)
+        deltas[key] = deltas.get(key, 0) + int(status == 'attending') - int(series_status == 'attending')
+        if answer_user_id == user_id:
+            answers[key] = status
+    return deltas, answers
+
+
+def expand_occurrences(cursor, events, user_id, start=None, end=None):
+    # Replaces each recurring event by its occurrences in [start, end), or by
+    # its next occurrence from start when there is no end, each with its own
+    # event_time, user_status and attending_count. Without a window series
+    # are left as they are stored.
+    result, expanded = [], []
+    for event in events:
+        if event["recurrence"] is None or start is None:
+            result.append(event)
+            continue
+        series_start = parse_time(event["event_time"])
+        times = occurrences(series_start, parse_rule(event["recurrence"]), start, end or FOREVER)
+        for moment in times:
+            expanded.append(dict(event, event_time=moment, series_start=series_start))
+            if end is None:
+                break
+    if not expanded:
+        return result
+
+    deltas, answers = _occurrence_answers(
+        cursor, {event["id"] for event in expanded}, user_id,
+        min(event["event_time"] for event in expanded),
+        max(event["event_time"] for event in expanded) + datetime.timedelta(seconds=1)
+    )
+    for event in expanded:
+        key = (event["id"], event["event_time"])
+        event["attending_count"] += deltas.get(key, 0)
+        event["user_status"] = answers.get(key, event["user_status"])
+    result.extend(expanded)
+    result.sort(key=lambda event: parse_time(event["event_time"]))
+    return result
+
+
+def user_events_query(user_id, start=None, end=None):
+    # The events the user takes part in, soonest first: all of them, those
+    # still to come after start, or those in the window [start, end).
+    # Recurring events are one row each. Returns (sql, params).
+    condition, condition_params = _window_clause(start, end)
+    sql = f"""
+        SELECT e.id, e.group_id, e.title, e.description, e.event_time, e.created_at,
+               g.name as group_name, 
+               ep.status as user_status,
+               e.attending_count, e.recurrence
+        FROM events e
+        JOIN group_chats g ON e.group_id = g.id
+        JOIN event_participants ep ON e.id = ep.event_id
+        WHERE ep.user_id = %s AND e.lazy_rsvp = 0{condition}
+        UNION ALL
+        SELECT e.id, e.group_id, e.title, e.description, e.event_time, e.created_at,
+               g.name as group_name,
+               COALESCE(ep.status, 'attending') as user_status,
+               e.attending_count, e.recurrence
+        FROM group_chat_members m
+        JOIN events e ON e.group_id = m.group_id AND e.lazy_rsvp = 1
+        JOIN group_chats g ON e.group_id = g.id
+        LEFT JOIN event_participants ep ON ep.event_id = e.id AND ep.user_id = m.user_id
+        WHERE m.user_id = %s{condition}
+        ORDER BY event_time ASC
+    """
+    return sql, (user_id,) + condition_params + (user_id,) + condition_params
+
+
+def format_user_event(event):
+    return {
+        "id": event[0],
+        "group_id": event[1],
+        "title": event[2],
+        "description": event[3],
+        "event_time": event[4],
+        "created_at": event[5],
+        "group_name": event[6],
+        "user_status": event[7],
+        "attending_count": event[8],
+        "recurrence": event[9]
+    }
+
+
+def fetch_user_events(cursor, user_id, start=None, end=None):
+    cursor.execute(*user_events_query(user_id, start, end))
+    events = [format_user_event(event) for event in cursor.fetchall()]
+    return expand_occurrences(cursor, events, user_id, start, end)
+
+
+def group_events_query(group_id, user_id, start=None, end=None):
+    # The group's events with the user's own status, soonest first, limited
+    # like user_events_query. Returns (sql, params).
+    condition, condition_params = _window_clause(start, end)
+    sql = f"""
+        SELECT e.id, e.group_id, e.title, e.description, e.event_time, e.created_at,
+               CASE WHEN e.lazy_rsvp = 1
+                    THEN COALESCE(ep.status, 'attending')
+                    ELSE ep.status
+               END as user_status,
+               e.attending_count, e.recurrence
+        FROM events e
+        LEFT JOIN event_participants ep ON ep.event_id = e.id AND ep.user_id = %s
+        WHERE e.group_id = %s{condition}
+        ORDER BY e.event_time ASC
+    """
+    return sql, (user_id, group_id) + condition_params
+
+
+def format_group_event(event):
+    return {
+        "id": event[0],
+        "group_id": event[1],
+        "title": event[2],
+        "description": event[3],
+        "event_time": event[4],
+        "created_at": event[5],
+        "user_status": event[6],
+        "attending_count": event[7],
+        "recurrence": event[8]
+    }
+
+
+def fetch_group_events(cursor, group_id, user_id, start=None, end=None):
+    cursor.execute(*group_events_query(group_id, user_id, start, end))
+    events = [format_group_event(event) for event in cursor.fetchall()]
+    return expand_occurrences(cursor, events, user_id, start, end)
+
 
 def register_event_routes(app):
     @app.route('/events', methods=['GET'])
@@ -8,38 +274,19 @@ def register_event_routes(app):
         
         if not user_id:
             return jsonify({"error": "Missing user_id parameter"}), 400
+
+        try:
+            start, end = parse_window(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        db = get_db_connection()
+        db = get_read_connection()
         if db is None:
             return jsonify({"error": "Database connection failed"}), 500
 
         cursor = db.cursor()
         try:
-            sql = """
-                SELECT e.*, g.name as group_name, 
-                       ep.status as user_status,
-                       (SELECT COUNT(*) FROM event_participants WHERE event_id = e.id AND status = 'attending') as attending_count
-                FROM events e
-                JOIN group_chats g ON e.group_id = g.id
-                JOIN event_participants ep ON e.id = ep.event_id
-                WHERE ep.user_id = %s
-                ORDER BY e.event_time ASC
-            """
-            cursor.execute(sql, (user_id,))
-            events = cursor.fetchall()
-            
-            result = [{
-                "id": event[0],
-                "group_id": event[1],
-                "title": event[2],
-                "description": event[3],
-                "event_time": event[4],
-                "created_at": event[5],
-                "group_name": event[6],
-                "user_status": event[7],
-                "attending_count": event[8]
-            } for event in events]
-            
+            result = fetch_user_events(cursor, user_id, start, end)
             return jsonify(result), 200
         except Exception as e:
             return jsonify({"error": str(e)}), 500
@@ -53,42 +300,34 @@ def register_event_routes(app):
         
         if not user_id:
             return jsonify({"error": "Missing user_id parameter"}), 400
+
+        try:
+            start, end = parse_window(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Removing a member bumps the group, so a 304 never outlives access
+        etag = versions.etag(group_version(group_id), PROFILES)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
             
-        db = get_db_connection()
+        # Tagged responses are read from the primary: a lagging replica would
+        # hand out old data under the current ETag.
+        db = get_db_connection() if etag else get_read_connection()
         if db is None:
             return jsonify({"error": "Database connection failed"}), 500
 
         cursor = db.cursor()
         try:
-            # First check if user is a member of the group
-            cursor.execute("SELECT 1 FROM group_chat_members WHERE group_id = %s AND user_id = %s", (group_id, user_id))
-            if not cursor.fetchone():
+            # First check if user is a member of the group (on the primary,
+            # as the answer is cached)
+            if not membership.is_member(None, group_id, user_id):
                 return jsonify({"error": "User is not a member of this group"}), 403
                 
             # Get events for the group with user's status
-            sql = """
-                SELECT e.*, 
-                       (SELECT status FROM event_participants WHERE event_id = e.id AND user_id = %s) as user_status,
-                       (SELECT COUNT(*) FROM event_participants WHERE event_id = e.id AND status = 'attending') as attending_count
-                FROM events e
-                WHERE e.group_id = %s
-                ORDER BY e.event_time ASC
-            """
-            cursor.execute(sql, (user_id, group_id))
-            events = cursor.fetchall()
-            
-            result = [{
-                "id": event[0],
-                "group_id": event[1],
-                "title": event[2],
-                "description": event[3],
-                "event_time": event[4],
-                "created_at": event[5],
-                "user_status": event[6],
-                "attending_count": event[7]
-            } for event in events]
-            
-            return jsonify(result), 200
+            result = fetch_group_events(cursor, group_id, user_id, start, end)
+            return tagged(jsonify(result), etag), 200
         except Exception as e:
             return jsonify({"error": str(e)}), 500
         finally:
@@ -102,9 +341,19 @@ def register_event_routes(app):
         description = data.get('description', '')
         event_time = data.get('event_time')
         creator_id = data.get('creator_id')
+        recurrence = data.get('recurrence')
         
         if not all([title, event_time, creator_id]):
             return jsonify({"error": "Missing required fields"}), 400
+
+        # Optional iCalendar-style rule, e.g. "FREQ=WEEKLY;COUNT=10"
+        try:
+            event_time = parse_time(event_time)
+            rule = parse_rule(recurrence) if recurrence else None
+            final_time = last_occurrence(event_time, rule) if rule else event_time
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        recurrence = str(rule) if rule else None
             
         db = get_db_connection()
         if db is None:
@@ -113,39 +362,50 @@ def register_event_routes(app):
         cursor = db.cursor()
         try:
             # Check if user is a member of the group
-            cursor.execute("SELECT 1 FROM group_chat_members WHERE group_id = %s AND user_id = %s", (group_id, creator_id))
-            if not cursor.fetchone():
+            if not membership.is_member(cursor, group_id, creator_id):
                 return jsonify({"error": "User is not a member of this group"}), 403
                 
             # First get the group name
             cursor.execute("SELECT name FROM group_chats WHERE id = %s", (group_id,))
             group_name = cursor.fetchone()[0]
             
+            # Large groups get lazy RSVPs instead of one row per member
+            member_count = len(membership.members(cursor, group_id))
+            lazy_threshold = settings['LAZY_RSVP_MIN_MEMBERS']
+            lazy_rsvp = 1 if lazy_threshold and member_count >= lazy_threshold else 0
+
             # Create the event
             cursor.execute(
-                "INSERT INTO events (group_id, title, description, event_time) VALUES (%s, %s, %s, %s)",
-                (group_id, title, description, event_time)
+                "INSERT INTO events (group_id, title, description, event_time, lazy_rsvp, recurrence, last_occurrence) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                (group_id, title, description, event_time, lazy_rsvp, recurrence, final_time)
             )
             event_id = cursor.lastrowid
             
-            # Get all group members
-            cursor.execute("SELECT user_id FROM group_chat_members WHERE group_id = %s", (group_id,))
-            members = cursor.fetchall()
-            
-            # Add all members as participants with 'attending' status
-            for member in members:
+            # Add all members as participants with 'attending' status in one statement
+            if not lazy_rsvp:
                 cursor.execute(
-                    "INSERT INTO event_participants (event_id, user_id, status) VALUES (%s, %s, 'attending')",
-                    (event_id, member[0])
+                    """
+                    INSERT INTO event_participants (event_id, user_id, status)
+                    SELECT %s, user_id, 'attending' FROM group_chat_members WHERE group_id = %s
+                    """,
+                    (event_id, group_id)
                 )
+                attending_count = cursor.rowcount
+            else:
+                cursor.execute("SELECT COUNT(*) FROM group_chat_members WHERE group_id = %s", (group_id,))
+                attending_count = cursor.fetchone()[0]
+            cursor.execute("UPDATE events SET attending_count = %s WHERE id = %s", (attending_count, event_id))
                 
             db.commit()
+            versions.bump(group_version(group_id))
+            recent_writes.mark()
             
             # Return the created event with group name
             cursor.execute(
                 """
-                SELECT e.*, 
-                       (SELECT COUNT(*) FROM event_participants WHERE event_id = e.id AND status = 'attending') as attending_count
+                SELECT e.id, e.group_id, e.title, e.description, e.event_time, e.created_at,
+                       e.attending_count, e.recurrence
                 FROM events e
                 WHERE e.id = %s
                 """, 
@@ -161,6 +421,7 @@ def register_event_routes(app):
                 "event_time": event[4],
                 "created_at": event[5],
                 "attending_count": event[6],
+                "recurrence": event[7],
                 "user_status": "attending",  # Creator is automatically attending
                 "group_name": group_name  # Add group name to response
             }
@@ -175,20 +436,53 @@ def register_event_routes(app):
 
     @app.route('/events/<int:event_id>/participants', methods=['GET'])
     def get_event_participants(event_id):
-        db = get_db_connection()
+        # Participants also follow the group's membership (lazy RSVPs), so
+        # once the event's group is known its version is part of the ETag.
+        # ?occurrence= applies the answers given for that one occurrence.
+        try:
+            occurrence = request.args.get('occurrence')
+            occurrence = parse_time(occurrence) if occurrence else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        key = event_version(event_id)
+        etag = versions.etag(key, PROFILES)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        db = get_db_connection() if etag else get_read_connection()
         if db is None:
             return jsonify({"error": "Database connection failed"}), 500
 
         cursor = db.cursor()
         try:
+            if etag is not None and not versions.linked(key):
+                cursor.execute("SELECT group_id FROM events WHERE id = %s", (event_id,))
+                event = cursor.fetchone()
+                if event is not None:
+                    versions.link(key, group_version(event[0]))
+
             sql = """
-                SELECT u.id, u.name, u.email, ep.status
+                SELECT u.id, u.name, u.email, COALESCE(o.status, ep.status)
                 FROM user_verification u
                 JOIN event_participants ep ON u.id = ep.user_id
-                WHERE ep.event_id = %s
-                ORDER BY u.name ASC
+                JOIN events e ON e.id = ep.event_id
+                LEFT JOIN event_occurrence_rsvps o
+                    ON o.event_id = e.id AND o.occurrence_time = %s AND o.user_id = u.id
+                WHERE ep.event_id = %s AND e.lazy_rsvp = 0
+                UNION ALL
+                SELECT u.id, u.name, u.email, COALESCE(o.status, ep.status, 'attending')
+                FROM events e
+                JOIN group_chat_members m ON m.group_id = e.group_id
+                JOIN user_verification u ON u.id = m.user_id
+                LEFT JOIN event_participants ep ON ep.event_id = e.id AND ep.user_id = m.user_id
+                LEFT JOIN event_occurrence_rsvps o
+                    ON o.event_id = e.id AND o.occurrence_time = %s AND o.user_id = m.user_id
+                WHERE e.id = %s AND e.lazy_rsvp = 1
+                ORDER BY name ASC
             """
-            cursor.execute(sql, (event_id,))
+            cursor.execute(sql, (occurrence, event_id, occurrence, event_id))
             participants = cursor.fetchall()
             
             result = [{
@@ -198,7 +492,7 @@ def register_event_routes(app):
                 "status": participant[3]
             } for participant in participants]
             
-            return jsonify(result), 200
+            return tagged(jsonify(result), etag), 200
         except Exception as e:
             return jsonify({"error": str(e)}), 500
         finally:
@@ -207,15 +501,23 @@ def register_event_routes(app):
 
     @app.route('/events/<int:event_id>/status', methods=['PUT'])
     def update_participant_status(event_id):
+        # With "occurrence" (the start time of one occurrence of a recurring
+        # event) the answer only applies to that occurrence.
         data = request.json
         user_id = data.get('user_id')
         status = data.get('status')
+        occurrence = data.get('occurrence')
         
         if not user_id or not status:
             return jsonify({"error": "Missing required fields"}), 400
             
         if status not in ['attending', 'not_attending']:
             return jsonify({"error": "Invalid status value"}), 400
+
+        try:
+            occurrence = parse_time(occurrence) if occurrence else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
             
         db = get_db_connection()
         if db is None:
@@ -224,16 +526,61 @@ def register_event_routes(app):
         cursor = db.cursor()
         try:
             # Check if user is a participant
-            cursor.execute("SELECT 1 FROM event_participants WHERE event_id = %s AND user_id = %s", (event_id, user_id))
-            if not cursor.fetchone():
+            cursor.execute("""
+                SELECT e.group_id, e.lazy_rsvp, ep.status, e.event_time, e.recurrence
+                FROM events e
+                LEFT JOIN event_participants ep ON ep.event_id = e.id AND ep.user_id = %s
+                WHERE e.id = %s
+                FOR UPDATE
+            """, (user_id, event_id))
+            event = cursor.fetchone()
+            if not event:
                 return jsonify({"error": "User is not a participant of this event"}), 404
-                
-            # Update status
-            cursor.execute(
-                "UPDATE event_participants SET status = %s WHERE event_id = %s AND user_id = %s",
-                (status, event_id, user_id)
-            )
+
+            group_id, lazy_rsvp, current_status, event_time, recurrence = event
+            if occurrence is not None:
+                if current_status is None and (not lazy_rsvp or not membership.is_member(cursor, group_id, user_id)):
+                    return jsonify({"error": "User is not a participant of this event"}), 404
+                if recurrence is None or not is_occurrence(parse_time(event_time), parse_rule(recurrence), occurrence):
+                    return jsonify({"error": "Occurrence not found"}), 404
+                # The series counter is left alone; occurrences are counted
+                # from their overrides when read.
+                cursor.execute(
+                    "DELETE FROM event_occurrence_rsvps WHERE event_id = %s AND occurrence_time = %s AND user_id = %s",
+                    (event_id, occurrence, user_id)
+                )
+                cursor.execute(
+                    "INSERT INTO event_occurrence_rsvps (event_id, occurrence_time, user_id, status) "
+                    "VALUES (%s, %s, %s, %s)",
+                    (event_id, occurrence, user_id, status)
+                )
+            elif current_status is None:
+                # With lazy RSVPs every group member is a participant; their
+                # first answer is stored as an override row.
+                if not lazy_rsvp or not membership.is_member(cursor, group_id, user_id):
+                    return jsonify({"error": "User is not a participant of this event"}), 404
+                cursor.execute(
+                    "INSERT INTO event_participants (event_id, user_id, status) VALUES (%s, %s, %s)",
+                    (event_id, user_id, status)
+                )
+            else:
+                # Update status
+                cursor.execute(
+                    "UPDATE event_participants SET status = %s WHERE event_id = %s AND user_id = %s",
+                    (status, event_id, user_id)
+                )
+
+            # Keep the event's attending counter in step
+            was_attending = (current_status or ('attending' if lazy_rsvp else None)) == 'attending'
+            delta = int(status == 'attending') - int(was_attending)
+            if delta and occurrence is None:
+                cursor.execute(
+                    "UPDATE events SET attending_count = attending_count + %s WHERE id = %s",
+                    (delta, event_id)
+                )
             db.commit()
+            versions.bump(event_version(event_id), group_version(group_id))
+            recent_writes.mark()
             
             return jsonify({"message": "Status updated successfully"}), 200
         except Exception as e:
@@ -265,17 +612,14 @@ def register_event_routes(app):
             group_id = event[0]
             
             # Check if user is a group admin using the admin column
-            cursor.execute("""
-                SELECT 1 FROM group_chat_members 
-                WHERE group_id = %s AND user_id = %s AND admin = 1
-            """, (group_id, user_id))
-            
-            if not cursor.fetchone():
+            if not membership.is_admin(cursor, group_id, user_id):
                 return jsonify({"error": "Only group admins can delete events"}), 403
                 
             # Delete the event (cascade will delete participants)
             cursor.execute("DELETE FROM events WHERE id = %s", (event_id,))
             db.commit()
+            versions.bump(event_version(event_id), group_version(group_id))
+            recent_writes.mark()
             
             return jsonify({"message": "Event deleted successfully"}), 200
         except Exception as e:
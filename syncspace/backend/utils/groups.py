@@ -1,5 +1,131 @@
 from flask import request, jsonify
-from utils.db import get_db_connection
+from utils.config import settings
+from utils.db import get_db_connection, get_read_connection, recent_writes
+from utils.events import add_member_to_events, remove_member_from_events
+from utils.inbox import record_group_message, join_group, leave_group, forget_group
+from utils.ingest import MessageBatcher
+from utils.membership import membership
+from utils.message_cache import message_cache, group_key
+from utils.pagination import parse_page_args, keyset_clause
+from utils.profiles import with_sender_names
+from utils.pubsub import publish_group_message, follow_group, unfollow_group
+from utils.responses import parse_list_format, list_payload
+from utils.versions import versions, not_modified, tagged, PROFILES, group_version, user_version
+
+
+def format_group_message(msg):
+    return {
+        "id": msg[0],
+        "group_id": msg[1],
+        "sender_id": msg[2],
+        "content": msg[3],
+        "created_at": msg[4]
+    }
+
+
+def fetch_group_messages(cursor, group_id, before_id=None, after_id=None, limit=50):
+    # One page of the group's history, oldest first.
+    condition, condition_params, order = keyset_clause("id", before_id, after_id)
+    sql = f"""
+        SELECT id, group_id, sender_id, content, created_at
+        FROM group_messages
+        WHERE group_id = %s{condition}
+        ORDER BY id {order}
+        LIMIT %s
+    """
+    cursor.execute(sql, (group_id,) + condition_params + (limit,))
+    messages = cursor.fetchall()
+    if order == "DESC":
+        messages = messages[::-1]
+    return [format_group_message(msg) for msg in messages]
+
+
+def fetch_group_messages_since(cursor, group_ids, after_id, limit=50):
+    # New messages across several groups, used to resume the push channel.
+    if not group_ids:
+        return []
+    placeholders = ", ".join(["%s"] * len(group_ids))
+    sql = f"""
+        SELECT id, group_id, sender_id, content, created_at
+        FROM group_messages
+        WHERE group_id IN ({placeholders}) AND id > %s
+        ORDER BY id ASC
+        LIMIT %s
+    """
+    cursor.execute(sql, tuple(group_ids) + (after_id, limit))
+    return [format_group_message(msg) for msg in cursor.fetchall()]
+
+
+def fetch_user_groups(cursor, user_id):
+    sql = """
+        SELECT g.*, u.name as creator_name 
+        FROM group_chats g 
+        JOIN user_verification u ON g.created_by = u.id 
+        JOIN group_chat_members m ON g.id = m.group_id 
+        WHERE m.user_id = %s
+    """
+    cursor.execute(sql, (user_id,))
+    groups = cursor.fetchall()
+
+    return [{
+        "id": group[0],
+        "name": group[1],
+        "created_by": group[2],
+        "created_at": group[3],
+        "creator_name": group[4]
+    } for group in groups]
+
+
+def fetch_group_members(cursor, group_id):
+    sql = """
+        SELECT u.id, u.name, u.email, m.admin
+        FROM user_verification u
+        JOIN group_chat_members m ON u.id = m.user_id
+        WHERE m.group_id = %s
+        ORDER BY u.name ASC
+    """
+    cursor.execute(sql, (group_id,))
+    members = cursor.fetchall()
+
+    return [{
+        "id": member[0],
+        "name": member[1],
+        "email": member[2],
+        "admin": member[3]
+    } for member in members]
+
+
+def fetch_user_group_ids(cursor, user_id):
+    cursor.execute("SELECT group_id FROM group_chat_members WHERE user_id = %s", (user_id,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _record_batched_message(cursor, message):
+    record_group_message(cursor, message["group_id"], message["id"], message["sender_id"], message["content"])
+
+
+group_batcher = MessageBatcher(
+    'group', 'group_messages', ('group_id', 'sender_id', 'content'),
+    """
+        SELECT id, group_id, sender_id, content, created_at FROM group_messages
+        WHERE id BETWEEN %s AND %s
+        ORDER BY id
+    """,
+    format_group_message,
+    _record_batched_message,
+)
+
+
+def deliver_group_message(message, cursor=None):
+    # After the commit: route the sender's reads to the primary, hand the
+    # message to the cache and to listeners, and return it with its sender's
+    # name for the response.
+    recent_writes.mark()
+    message_cache.append(group_key(message["group_id"]), message)
+    result = with_sender_names([message], cursor)[0]
+    publish_group_message(result)
+    return result
+
 
 def register_group_routes(app):
     @app.route('/groups', methods=['GET'])
@@ -8,32 +134,25 @@ def register_group_routes(app):
         
         if not user_id:
             return jsonify({"error": "Missing user_id parameter"}), 400
+
+        try:
+            etag = versions.etag(user_version(user_id), PROFILES)
+        except ValueError:
+            return jsonify({"error": "Invalid user_id"}), 400
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
         
-        db = get_db_connection()
+        # Tagged responses are read from the primary: a lagging replica would
+        # hand out old data under the current ETag.
+        db = get_db_connection() if etag else get_read_connection()
         if db is None:
             return jsonify({"error": "Database connection failed"}), 500
 
         cursor = db.cursor() 
         try:
-            sql = """
-                SELECT g.*, u.name as creator_name 
-                FROM group_chats g 
-                JOIN user_verification u ON g.created_by = u.id 
-                JOIN group_chat_members m ON g.id = m.group_id 
-                WHERE m.user_id = %s
-            """
-            cursor.execute(sql, (user_id,))
-            groups = cursor.fetchall()
-            
-            result = [{
-                "id": group[0],
-                "name": group[1],
-                "created_by": group[2],
-                "created_at": group[3],
-                "creator_name": group[4]
-            } for group in groups]
-            
-            return jsonify(result), 200
+            result = fetch_user_groups(cursor, user_id)
+            return tagged(jsonify(result), etag), 200
         finally:
             cursor.close()
             db.close()
@@ -74,8 +193,15 @@ def register_group_routes(app):
                         "INSERT INTO group_chat_members (group_id, user_id, admin) VALUES (%s, %s, 0)",
                         (group_id, member_id)
                     )
+            join_group(cursor, group_id, [created_by] + [member_id for member_id in member_ids if member_id != created_by])
                 
             db.commit()
+            membership.invalidate(group_id)
+            versions.bump(group_version(group_id), user_version(created_by),
+                          *[user_version(member_id) for member_id in member_ids])
+            recent_writes.mark()
+            for member_id in {created_by, *member_ids}:
+                follow_group(member_id, group_id)
             return jsonify({"message": "Group created successfully", "group_id": group_id}), 201
         except Exception as e:
             db.rollback()
@@ -86,32 +212,37 @@ def register_group_routes(app):
 
     @app.route('/groups/<int:group_id>/messages', methods=['GET'])
     def get_group_messages(group_id):
-        db = get_db_connection()
+        try:
+            before_id, after_id, limit = parse_page_args(request.args)
+            list_format = parse_list_format(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        key = group_key(group_id)
+        if settings['MESSAGE_CACHE_ENABLED']:
+            result = message_cache.get_page(key, before_id, after_id, limit)
+            if result is not None:
+                return jsonify(list_payload(with_sender_names(result), list_format)), 200
+
+        # The cache is filled from the primary; a lagging replica would leave
+        # a gap in the cached tail.
+        db = get_db_connection() if settings['MESSAGE_CACHE_ENABLED'] else get_read_connection()
         if db is None:
             return jsonify({"error": "Database connection failed"}), 500
 
         cursor = db.cursor()
         try:
-            sql = """
-                SELECT m.*, u.name as sender_name 
-                FROM group_messages m 
-                JOIN user_verification u ON m.sender_id = u.id 
-                WHERE m.group_id = %s 
-                ORDER BY m.created_at ASC
-            """
-            cursor.execute(sql, (group_id,))
-            messages = cursor.fetchall()
-            
-            result = [{
-                "id": msg[0],
-                "group_id": msg[1],
-                "sender_id": msg[2],
-                "content": msg[3],
-                "created_at": msg[4],
-                "sender_name": msg[5]
-            } for msg in messages]
-            
-            return jsonify(result), 200
+            result = None
+            if settings['MESSAGE_CACHE_ENABLED']:
+                result = message_cache.load(
+                    key,
+                    lambda n: fetch_group_messages(cursor, group_id, limit=n),
+                    before_id, after_id, limit
+                )
+            if result is None:
+                result = fetch_group_messages(cursor, group_id, before_id, after_id, limit)
+            # Names are read from the primary: they go into the profile cache
+            return jsonify(list_payload(with_sender_names(result), list_format)), 200
         finally:
             cursor.close()
             db.close()
@@ -132,39 +263,28 @@ def register_group_routes(app):
         cursor = db.cursor()
         try:
             # Verify sender is a member of the group
-            cursor.execute("SELECT 1 FROM group_chat_members WHERE group_id = %s AND user_id = %s", (group_id, sender_id))
-            if not cursor.fetchone():
+            if not membership.is_member(cursor, group_id, sender_id):
                 return jsonify({"error": "User is not a member of this group"}), 403
 
-            # Send message
-            cursor.execute(
-                "INSERT INTO group_messages (group_id, sender_id, content, created_at) VALUES (%s, %s, %s, NOW())",
-                (group_id, sender_id, content)
-            )
-            message_id = cursor.lastrowid
-            db.commit()
+            if not settings['MESSAGE_BATCHING_ENABLED']:
+                # Send message
+                cursor.execute(
+                    "INSERT INTO group_messages (group_id, sender_id, content, created_at) VALUES (%s, %s, %s, NOW())",
+                    (group_id, sender_id, content)
+                )
+                message_id = cursor.lastrowid
+                record_group_message(cursor, group_id, message_id, sender_id, content)
+                db.commit()
             
-            # Get the inserted message with sender name
-            sql = """
-                SELECT m.id, m.group_id, m.sender_id, m.content, m.created_at, u.name as sender_name 
-                FROM group_messages m 
-                JOIN user_verification u ON m.sender_id = u.id 
-                WHERE m.id = %s
-            """
-            cursor.execute(sql, (message_id,))
-            message = cursor.fetchone()
+                # Get the inserted message
+                sql = "SELECT id, group_id, sender_id, content, created_at FROM group_messages WHERE id = %s"
+                cursor.execute(sql, (message_id,))
+                message = cursor.fetchone()
             
-            # Format response
-            result = {
-                "id": message[0],
-                "group_id": message[1],
-                "sender_id": message[2],
-                "content": message[3],
-                "created_at": message[4],
-                "sender_name": message[5]
-            }
+                # Format response
+                result = deliver_group_message(format_group_message(message), cursor)
             
-            return jsonify(result), 201
+                return jsonify(result), 201
         except Exception as e:
             db.rollback()
             return jsonify({"error": str(e)}), 500
@@ -172,32 +292,29 @@ def register_group_routes(app):
             cursor.close()
             db.close()
 
+        # Batched: this request's connection is back in the pool while the
+        # message waits for its batch.
+        try:
+            result = deliver_group_message(group_batcher.submit(group_id, sender_id, content))
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        return jsonify(result), 201
+
     @app.route('/groups/<int:group_id>/members', methods=['GET'])
     def get_group_members(group_id):
-        db = get_db_connection()
+        etag = versions.etag(group_version(group_id), PROFILES)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        db = get_db_connection() if etag else get_read_connection()
         if db is None:
             return jsonify({"error": "Database connection failed"}), 500
 
         cursor = db.cursor()
         try:
-            sql = """
-                SELECT u.id, u.name, u.email, m.admin
-                FROM user_verification u
-                JOIN group_chat_members m ON u.id = m.user_id
-                WHERE m.group_id = %s
-                ORDER BY u.name ASC
-            """
-            cursor.execute(sql, (group_id,))
-            members = cursor.fetchall()
-            
-            result = [{
-                "id": member[0],
-                "name": member[1],
-                "email": member[2],
-                "admin": member[3]
-            } for member in members]
-            
-            return jsonify(result)
+            result = fetch_group_members(cursor, group_id)
+            return tagged(jsonify(result), etag)
         except Exception as e:
             return jsonify({"error": str(e)}), 500
         finally:
@@ -225,7 +342,13 @@ def register_group_routes(app):
                 
             # Add member
             cursor.execute("INSERT INTO group_chat_members (group_id, user_id) VALUES (%s, %s)", (group_id, user_id))
+            add_member_to_events(cursor, group_id)
+            join_group(cursor, group_id, [user_id])
             db.commit()
+            membership.invalidate(group_id)
+            versions.bump(group_version(group_id), user_version(user_id))
+            recent_writes.mark()
+            follow_group(user_id, group_id)
             return jsonify({"message": "Member added successfully"}), 201
         except Exception as e:
             db.rollback()
@@ -248,12 +371,7 @@ def register_group_routes(app):
         cursor = db.cursor()
         try:
             # Check if the requester is an admin
-            cursor.execute("""
-                SELECT 1 FROM group_chat_members 
-                WHERE group_id = %s AND user_id = %s AND admin = 1
-            """, (group_id, admin_id))
-            
-            if not cursor.fetchone():
+            if not membership.is_admin(cursor, group_id, admin_id):
                 return jsonify({"error": "Only group admins can remove members"}), 403
                 
             # Remove the member
@@ -262,8 +380,16 @@ def register_group_routes(app):
             
             if cursor.rowcount == 0:
                 return jsonify({"error": "Member not found in group"}), 404
+
+            # Take them off the group's events and fix the attending counters
+            remove_member_from_events(cursor, group_id, user_id)
+            leave_group(cursor, group_id, user_id)
                 
             db.commit()
+            membership.invalidate(group_id)
+            versions.bump(group_version(group_id), user_version(user_id))
+            recent_writes.mark()
+            unfollow_group(user_id, group_id)
             return jsonify({"message": "Member removed successfully"}), 200
         except Exception as e:
             db.rollback()
@@ -286,12 +412,7 @@ def register_group_routes(app):
         cursor = db.cursor()
         try:
             # Check if the requester is an admin
-            cursor.execute("""
-                SELECT 1 FROM group_chat_members 
-                WHERE group_id = %s AND user_id = %s AND admin = 1
-            """, (group_id, admin_id))
-            
-            if not cursor.fetchone():
+            if not membership.is_admin(cursor, group_id, admin_id):
                 return jsonify({"error": "Only group admins can modify admin status"}), 403
                 
             # Get current admin status
@@ -315,6 +436,9 @@ def register_group_routes(app):
             """, (new_status, group_id, user_id))
             
             db.commit()
+            membership.invalidate(group_id)
+            versions.bump(group_version(group_id))
+            recent_writes.mark()
             return jsonify({"message": "Admin status updated successfully", "admin": new_status}), 200
         except Exception as e:
             db.rollback()
@@ -337,21 +461,26 @@ def register_group_routes(app):
         cursor = db.cursor()
         try:
             # Check if the requester is an admin
-            cursor.execute("""
-                SELECT 1 FROM group_chat_members 
-                WHERE group_id = %s AND user_id = %s AND admin = 1
-            """, (group_id, admin_id))
-            
-            if not cursor.fetchone():
+            if not membership.is_admin(cursor, group_id, admin_id):
                 return jsonify({"error": "Only group admins can delete groups"}), 403
+
+            # Everyone whose group list changes
+            member_ids = list(membership.members(cursor, group_id))
                 
             # Delete the group (cascade will delete members, messages, events)
             cursor.execute("DELETE FROM group_chats WHERE id = %s", (group_id,))
             
             if cursor.rowcount == 0:
                 return jsonify({"error": "Group not found"}), 404
+            forget_group(cursor, group_id)
                 
             db.commit()
+            membership.invalidate(group_id)
+            message_cache.evict(group_key(group_id))
+            versions.bump(group_version(group_id), *[user_version(member_id) for member_id in member_ids])
+            recent_writes.mark()
+            for member_id in member_ids:
+                unfollow_group(member_id, group_id)
             return jsonify({"message": "Group deleted successfully"}), 200
         except Exception as e:
             db.rollback()
@@ -0,0 +1,246 @@
+import pymysql
+from flask import request, jsonify
+from utils.config import settings
+from utils.db import get_db_connection, get_read_connection, recent_writes
+
+# One conversations row per (user, peer) for direct messages and per
+# (user, group) for group chats, holding the last message and the user's
+# unread count. Direct rows have group_id 0, group rows have peer_id 0. The
+# rows are written in the same transaction as the message, so GET /inbox is a
+# single range read on (user_id, last_activity).
+
+# Sender's row: read up to their own message. Everyone else: one more unread.
+_SET_LAST_MESSAGE = """
+    last_message_id = %s, last_sender_id = %s, last_content = %s, last_activity = NOW(),
+    unread_count = CASE WHEN user_id = %s THEN 0 ELSE unread_count + 1 END,
+    last_read_id = CASE WHEN user_id = %s THEN %s ELSE last_read_id END
+"""
+
+# Rebuilds every row from the message tables, with all history counted as
+# read. Used after bulk loads that bypass the routes; the migration that adds
+# the table keeps its own copy.
+REBUILD_STATEMENTS = (
+    "DELETE FROM conversations",
+    """
+    INSERT INTO conversations (user_id, peer_id, group_id, last_message_id, last_sender_id, last_content,
+                               last_activity, unread_count, last_read_id)
+    SELECT c.user_id, c.peer_id, 0, m.id, m.sender_id, m.content, m.created_at, 0, m.id
+    FROM (
+        SELECT user_id, peer_id, MAX(id) as last_id FROM (
+            SELECT sender_id as user_id, recipient_id as peer_id, id FROM messages
+            UNION ALL
+            SELECT recipient_id as user_id, sender_id as peer_id, id FROM messages
+        ) exchanged
+        GROUP BY user_id, peer_id
+    ) c
+    JOIN messages m ON m.id = c.last_id
+    """,
+    """
+    INSERT INTO conversations (user_id, peer_id, group_id, last_message_id, last_sender_id, last_content,
+                               last_activity, unread_count, last_read_id)
+    SELECT gm.user_id, 0, gm.group_id, m.id, m.sender_id, m.content, COALESCE(m.created_at, g.created_at), 0, m.id
+    FROM group_chat_members gm
+    JOIN group_chats g ON g.id = gm.group_id
+    LEFT JOIN (
+        SELECT group_id, MAX(id) as last_id FROM group_messages GROUP BY group_id
+    ) latest ON latest.group_id = gm.group_id
+    LEFT JOIN group_messages m ON m.id = latest.last_id
+    """,
+)
+
+
+def rebuild_conversations(cursor):
+    for statement in REBUILD_STATEMENTS:
+        cursor.execute(statement)
+
+
+def _touch_direct(cursor, user_id, peer_id, message_id, sender_id, content):
+    params = (message_id, sender_id, content, sender_id, sender_id, message_id)
+    update = f"UPDATE conversations SET {_SET_LAST_MESSAGE} WHERE user_id = %s AND peer_id = %s AND group_id = 0"
+    cursor.execute(update, params + (user_id, peer_id))
+    if cursor.rowcount:
+        return
+    is_sender = user_id == int(sender_id)
+    try:
+        cursor.execute("""
+            INSERT INTO conversations (user_id, peer_id, group_id, last_message_id, last_sender_id, last_content,
+                                       last_activity, unread_count, last_read_id)
+            VALUES (%s, %s, 0, %s, %s, %s, NOW(), %s, %s)
+        """, (user_id, peer_id, message_id, sender_id, content, 0 if is_sender else 1,
+              message_id if is_sender else None))
+    except pymysql.err.IntegrityError:
+        # Another request created the row since the UPDATE above.
+        cursor.execute(update, params + (user_id, peer_id))
+
+
+def record_direct_message(cursor, message_id, sender_id, recipient_id, content):
+    # Both participants' rows, lower user id first so that two users writing
+    # to each other at the same time lock the rows in the same order.
+    sides = sorted({(int(sender_id), int(recipient_id)), (int(recipient_id), int(sender_id))})
+    for user_id, peer_id in sides:
+        _touch_direct(cursor, user_id, peer_id, message_id, sender_id, content)
+
+
+def record_group_message(cursor, group_id, message_id, sender_id, content):
+    # Every member already has a row (see join_group), so one UPDATE covers
+    # the whole group.
+    cursor.execute(
+        f"UPDATE conversations SET {_SET_LAST_MESSAGE} WHERE group_id = %s",
+        (message_id, sender_id, content, sender_id, sender_id, message_id, group_id)
+    )
+
+
+def join_group(cursor, group_id, user_ids):
+    # An empty row per new member, so the group shows up in their inbox.
+    cursor.executemany(
+        "INSERT INTO conversations (user_id, peer_id, group_id, last_activity) VALUES (%s, 0, %s, NOW())",
+        [(user_id, group_id) for user_id in user_ids]
+    )
+
+
+def leave_group(cursor, group_id, user_id):
+    cursor.execute("DELETE FROM conversations WHERE group_id = %s AND user_id = %s", (group_id, user_id))
+
+
+def forget_group(cursor, group_id):
+    cursor.execute("DELETE FROM conversations WHERE group_id = %s", (group_id,))
+
+
+def forget_user(cursor, user_id):
+    # Run before deleting the user. Their own rows go with them (foreign
+    # key); this removes them from their peers' inboxes, along with the groups
+    # they created, which the delete cascades to.
+    cursor.execute("DELETE FROM conversations WHERE peer_id = %s", (user_id,))
+    cursor.execute(
+        "DELETE FROM conversations WHERE group_id IN (SELECT id FROM group_chats WHERE created_by = %s)",
+        (user_id,)
+    )
+
+
+def fetch_inbox(cursor, user_id, limit=50):
+    # The user's conversations, most recently active first.
+    cursor.execute("""
+        SELECT c.peer_id, c.group_id, COALESCE(u.name, g.name), c.unread_count, c.last_read_id,
+               c.last_activity, c.last_message_id, c.last_sender_id, c.last_content
+        FROM conversations c
+        LEFT JOIN user_verification u ON c.peer_id = u.id
+        LEFT JOIN group_chats g ON c.group_id = g.id
+        WHERE c.user_id = %s
+        ORDER BY c.last_activity DESC
+        LIMIT %s
+    """, (user_id, limit))
+    return [{
+        "type": "group" if row[1] else "direct",
+        "id": row[1] or row[0],
+        "name": row[2],
+        "unread_count": row[3],
+        "last_read_id": row[4],
+        "last_activity": row[5],
+        "last_message": {
+            "id": row[6],
+            "sender_id": row[7],
+            "content": row[8],
+            "created_at": row[5]
+        } if row[6] is not None else None
+    } for row in cursor.fetchall()]
+
+
+def _count_unread(cursor, user_id, peer_id, group_id, after_id):
+    if group_id:
+        cursor.execute(
+            "SELECT COUNT(*) FROM group_messages WHERE group_id = %s AND id > %s AND sender_id != %s",
+            (group_id, after_id, user_id)
+        )
+    else:
+        cursor.execute(
+            "SELECT COUNT(*) FROM messages WHERE sender_id = %s AND recipient_id = %s AND id > %s",
+            (peer_id, user_id, after_id)
+        )
+    return cursor.fetchone()[0]
+
+
+def register_inbox_routes(app):
+    @app.route('/inbox', methods=['GET'])
+    def get_inbox():
+        user_id = request.args.get('user_id')
+        if not user_id:
+            return jsonify({"error": "Missing user_id parameter"}), 400
+
+        try:
+            limit = request.args.get('limit')
+            limit = min(int(limit), settings['INBOX_PAGE_MAX']) if limit else settings['INBOX_PAGE_DEFAULT']
+            if limit <= 0:
+                raise ValueError
+        except ValueError:
+            return jsonify({"error": "Invalid limit parameter"}), 400
+
+        db = get_read_connection()
+        if db is None:
+            return jsonify({"error": "Database connection failed"}), 500
+
+        cursor = db.cursor()
+        try:
+            return jsonify(fetch_inbox(cursor, user_id, limit)), 200
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        finally:
+            cursor.close()
+            db.close()
+
+    @app.route('/inbox/read', methods=['PUT'])
+    def mark_read():
+        # Moves the user's read marker in one conversation to message_id (the
+        # latest message by default) and recounts what is still unread after
+        # it. The marker never moves backwards.
+        data = request.get_json() or {}
+        user_id = data.get('user_id')
+        peer_id = data.get('peer_id')
+        group_id = data.get('group_id')
+        message_id = data.get('message_id')
+
+        if not user_id or bool(peer_id) == bool(group_id):
+            return jsonify({"error": "Pass user_id and either peer_id or group_id"}), 400
+        try:
+            user_id = int(user_id)
+            peer_id = int(peer_id or 0)
+            group_id = int(group_id or 0)
+            message_id = int(message_id) if message_id is not None else None
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid user_id, peer_id, group_id or message_id"}), 400
+
+        db = get_db_connection()
+        if db is None:
+            return jsonify({"error": "Database connection failed"}), 500
+
+        cursor = db.cursor()
+        try:
+            cursor.execute("""
+                SELECT last_message_id, last_read_id, unread_count FROM conversations
+                WHERE user_id = %s AND peer_id = %s AND group_id = %s
+                FOR UPDATE
+            """, (user_id, peer_id, group_id))
+            row = cursor.fetchone()
+            if row is None:
+                return jsonify({"error": "Conversation not found"}), 404
+
+            last_message_id, last_read_id, unread_count = row
+            read_id = message_id if message_id is not None else last_message_id
+            if read_id is not None and (last_read_id is None or read_id > last_read_id):
+                if last_message_id is None or read_id >= last_message_id:
+                    unread_count = 0
+                else:
+                    unread_count = _count_unread(cursor, user_id, peer_id, group_id, read_id)
+                last_read_id = read_id
+                cursor.execute("""
+                    UPDATE conversations SET unread_count = %s, last_read_id = %s
+                    WHERE user_id = %s AND peer_id = %s AND group_id = %s
+                """, (unread_count, last_read_id, user_id, peer_id, group_id))
+            db.commit()
+            recent_writes.mark()
+            return jsonify({"unread_count": unread_count, "last_read_id": last_read_id}), 200
+        except Exception as e:
+            db.rollback()
+            return jsonify({"error": str(e)}), 500
+        finally:
+            cursor.close()
+            db.close()
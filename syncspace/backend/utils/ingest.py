@@ -0,0 +1,169 @@
+import queue
+import threading
+import time
+
+from utils.config import settings
+from utils.db import get_db_connection
+from utils.metrics import message_batch_size, message_batch_wait, message_batch_write, message_batch_fallbacks
+
+# Group commit for message inserts. Requests hand their message to a writer
+# thread and wait; the writer collects whatever arrives within
+# MESSAGE_BATCH_WAIT_MS (up to MESSAGE_BATCH_MAX messages), inserts it with
+# one multi-row INSERT and commits once. A caller only gets its message back
+# after that commit, so a 201 still means the row is durable.
+
+
+class _IdMismatch(Exception):
+    # The rows read back are not the ones just inserted (ids were not
+    # allocated consecutively); the batch is retried one message at a time.
+    pass
+
+
+def _normalize(column, value):
+    # A value as the column gives it back: ids as integers (the request may
+    # have sent "5" for 5), text without surrounding whitespace.
+    if value is None:
+        return None
+    if column.endswith('_id'):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return value
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    return str(value).strip()
+
+
+class _Pending:
+    __slots__ = ('values', 'queued_at', 'done', 'result', 'error')
+
+    def __init__(self, values):
+        self.values = values
+        self.queued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MessageBatcher:
+    # select_sql reads back an id range (two parameters) in id order, as
+    # (id, <columns in insert order>, ...); format_row turns one row into the
+    # response and record(cursor, message) runs in the same transaction.
+    def __init__(self, kind, table, columns, select_sql, format_row, record):
+        self.kind = kind
+        self._table = table
+        self._columns = columns
+        self._select_sql = select_sql
+        self._format_row = format_row
+        self._record = record
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f'{self.kind}-message-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, *values):
+        # Blocks until the message is committed; returns it as the read
+        # routes format it, or raises the error that stopped it.
+        self._start()
+        pending = _Pending(values)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + settings['MESSAGE_BATCH_WAIT_MS'] / 1000
+            while len(batch) < settings['MESSAGE_BATCH_MAX']:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            started = time.perf_counter()
+            for pending in batch:
+                message_batch_wait.observe(started - pending.queued_at, self.kind)
+            message_batch_size.observe(len(batch), self.kind)
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"Error writing {self.kind} message batch: {e}")
+                for pending in batch:
+                    if not pending.done.is_set():
+                        pending.error = e
+                        pending.done.set()
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        db = get_db_connection()
+        if db is None:
+            raise RuntimeError("Database connection failed")
+
+        cursor = db.cursor()
+        try:
+            results = self._insert(cursor, batch)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            if len(batch) == 1:
+                raise
+            # One bad message (say, an unknown recipient) must not fail the
+            # others: retry each on its own.
+            print(f"{self.kind} message batch of {len(batch)} failed, retrying singly: {e}")
+            message_batch_fallbacks.inc(self.kind)
+            results = None
+        finally:
+            cursor.close()
+            db.close()
+
+        if results is None:
+            for pending in batch:
+                try:
+                    self._write([pending])
+                except Exception as e:
+                    pending.error = e
+                    pending.done.set()
+            return
+
+        message_batch_write.observe(time.perf_counter() - started, self.kind)
+        for pending, result in zip(batch, results):
+            pending.result = result
+            pending.done.set()
+
+    def _insert(self, cursor, batch):
+        row = '(' + ', '.join(['%s'] * len(self._columns)) + ', NOW())'
+        cursor.execute(
+            f"INSERT INTO {self._table} ({', '.join(self._columns)}, created_at) VALUES "
+            + ', '.join([row] * len(batch)),
+            [value for pending in batch for value in pending.values]
+        )
+        # A multi-row INSERT reports the first id it generated; the rest
+        # follow it. Reading the rows back checks that and picks up the
+        # timestamps and sender names.
+        first_id = cursor.lastrowid
+        cursor.execute(self._select_sql, (first_id, first_id + len(batch) - 1))
+        rows = cursor.fetchall()
+        if len(rows) != len(batch) or any(
+            not self._matches(result_row, pending.values) for result_row, pending in zip(rows, batch)
+        ):
+            raise _IdMismatch(f"Rows {first_id}..{first_id + len(batch) - 1} are not this batch")
+
+        results = [self._format_row(result_row) for result_row in rows]
+        for result in results:
+            self._record(cursor, result)
+        return results
+
+    def _matches(self, row, values):
+        return all(
+            _normalize(column, row[index + 1]) == _normalize(column, value)
+            for index, (column, value) in enumerate(zip(self._columns, values))
+        )
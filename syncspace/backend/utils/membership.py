@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+
+from utils.config import settings
+from utils.db import get_db_connection
+
+
+def _as_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class MembershipCache:
+    # group_id -> {user_id: admin flag}, loaded one whole group at a time so
+    # authorization checks on hot paths do not need their own query.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._groups = OrderedDict()
+        # Bumped by every invalidation; a load that started before one is
+        # not installed because its rows may predate the change.
+        self._invalidations = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def members(self, cursor, group_id):
+        # Misses are read with cursor, or with a primary connection of its own
+        # when cursor is None; pass None from handlers that read a replica.
+        group_id = int(group_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._groups.get(group_id)
+            if entry is not None and (not settings['MEMBERSHIP_CACHE_TTL']
+                                      or now - entry[0] < settings['MEMBERSHIP_CACHE_TTL']):
+                self.hits += 1
+                self._groups.move_to_end(group_id)
+                return entry[1]
+            self.misses += 1
+            invalidations = self._invalidations
+
+        members = self._load(cursor, group_id)
+
+        with self._lock:
+            if invalidations == self._invalidations:
+                self._groups[group_id] = (now, members)
+                self._groups.move_to_end(group_id)
+                while len(self._groups) > settings['MEMBERSHIP_CACHE_GROUPS']:
+                    self._groups.popitem(last=False)
+        return members
+
+    def _load(self, cursor, group_id):
+        if cursor is None:
+            db = get_db_connection()
+            if db is None:
+                raise RuntimeError("Database connection failed")
+            cursor = db.cursor()
+            try:
+                return self._load(cursor, group_id)
+            finally:
+                cursor.close()
+                db.close()
+
+        cursor.execute("SELECT user_id, admin FROM group_chat_members WHERE group_id = %s", (group_id,))
+        return {row[0]: bool(row[1]) for row in cursor.fetchall()}
+
+    def is_member(self, cursor, group_id, user_id):
+        user_id = _as_id(user_id)
+        return user_id is not None and user_id in self.members(cursor, group_id)
+
+    def is_admin(self, cursor, group_id, user_id):
+        user_id = _as_id(user_id)
+        return user_id is not None and self.members(cursor, group_id).get(user_id, False)
+
+    def invalidate(self, group_id):
+        with self._lock:
+            self._invalidations += 1
+            self._groups.pop(int(group_id), None)
+
+    def stats(self):
+        with self._lock:
+            return {"groups": len(self._groups), "hits": self.hits, "misses": self.misses}
+
+
+membership = MembershipCache()
@@ -0,0 +1,181 @@
+import threading
+from collections import OrderedDict, deque
+
+from utils.config import settings
+
+# Rough per-message overhead of the formatted dict on top of its content
+MESSAGE_OVERHEAD_BYTES = 300
+
+
+def direct_key(user_id, other_user_id):
+    first, second = sorted((int(user_id), int(other_user_id)))
+    return ('direct', first, second)
+
+
+def group_key(group_id):
+    return ('group', int(group_id))
+
+
+def _message_size(message):
+    return MESSAGE_OVERHEAD_BYTES + len(message.get("content") or "")
+
+
+class _Tail:
+    # The newest messages of one conversation, oldest first. complete means
+    # the conversation has no messages older than the ones held here.
+    __slots__ = ('messages', 'complete', 'size')
+
+    def __init__(self, capacity):
+        self.messages = deque(maxlen=capacity)
+        self.complete = False
+        self.size = 0
+
+
+class MessageTailCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tails = OrderedDict()
+        self._bytes = 0
+        # Conversations being loaded from the database, and the ones that
+        # received a write while loading (their snapshot may miss it).
+        self._loading = {}
+        self._stale = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.fills = 0
+        self.evictions = 0
+
+    def _page(self, tail, before_id, after_id, limit):
+        messages = tail.messages
+        if after_id is not None:
+            if not tail.complete and (not messages or messages[0]["id"] > after_id):
+                return None
+            return [m for m in messages if m["id"] > after_id][:limit]
+        if before_id is not None:
+            older = [m for m in messages if m["id"] < before_id]
+            if len(older) < limit and not tail.complete:
+                return None
+            return older[-limit:]
+        if len(messages) < limit and not tail.complete:
+            return None
+        return list(messages)[-limit:]
+
+    def get_page(self, key, before_id=None, after_id=None, limit=50):
+        # A page in the same shape the database query returns, or None when
+        # the cached tail cannot answer it.
+        with self._lock:
+            tail = self._tails.get(key)
+            page = self._page(tail, before_id, after_id, limit) if tail is not None else None
+            if page is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._tails.move_to_end(key)
+            return page
+
+    def load(self, key, loader, before_id=None, after_id=None, limit=50):
+        # Fill the conversation's tail with loader(n) (its newest n messages,
+        # oldest first) and answer the page from it if possible.
+        capacity = settings['MESSAGE_CACHE_TAIL']
+        with self._lock:
+            if key in self._tails:
+                # Already cached but the page reaches past it; the caller
+                # falls back to a normal query.
+                return None
+            self._loading[key] = self._loading.get(key, 0) + 1
+
+        try:
+            messages = loader(capacity)
+        except Exception:
+            with self._lock:
+                self._finish_loading(key)
+            raise
+
+        tail = _Tail(capacity)
+        tail.messages.extend(messages)
+        tail.complete = len(messages) < capacity
+        tail.size = sum(_message_size(m) for m in tail.messages)
+
+        with self._lock:
+            stale = self._finish_loading(key)
+            if not stale and key not in self._tails:
+                self._tails[key] = tail
+                self._bytes += tail.size
+                self.fills += 1
+                self._evict()
+            return self._page(tail, before_id, after_id, limit)
+
+    def _finish_loading(self, key):
+        # Returns True when the conversation was written to while loading.
+        stale = key in self._stale
+        self._loading[key] -= 1
+        if self._loading[key] == 0:
+            del self._loading[key]
+            self._stale.discard(key)
+        return stale
+
+    def append(self, key, message):
+        # Write-through for a newly sent message. Conversations that are not
+        # cached are left alone; they get loaded on their next read.
+        with self._lock:
+            tail = self._tails.get(key)
+            if tail is None:
+                if key in self._loading:
+                    self._stale.add(key)
+                return
+
+            messages = tail.messages
+            if len(messages) == messages.maxlen:
+                tail.size -= _message_size(messages[0])
+                self._bytes -= _message_size(messages[0])
+                tail.complete = False
+            messages.append(message)
+            if len(messages) > 1 and messages[-2]["id"] > message["id"]:
+                # Concurrent sends can commit out of id order
+                ordered = sorted(messages, key=lambda m: m["id"])
+                messages.clear()
+                messages.extend(ordered)
+            tail.size += _message_size(message)
+            self._bytes += _message_size(message)
+            self._tails.move_to_end(key)
+            self._evict()
+
+    def evict(self, key):
+        with self._lock:
+            tail = self._tails.pop(key, None)
+            if tail is not None:
+                self._bytes -= tail.size
+            if key in self._loading:
+                self._stale.add(key)
+
+    def clear(self):
+        with self._lock:
+            self._tails.clear()
+            self._bytes = 0
+            self._stale.update(self._loading)
+
+    def _evict(self):
+        # Drop whole conversations, least recently used first, until the
+        # cache is back under its memory budget.
+        budget = settings['MESSAGE_CACHE_MAX_BYTES']
+        while self._bytes > budget and self._tails:
+            _, tail = self._tails.popitem(last=False)
+            self._bytes -= tail.size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "conversations": len(self._tails),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "fills": self.fills,
+                "evictions": self.evictions,
+            }
+
+
+message_cache = MessageTailCache()
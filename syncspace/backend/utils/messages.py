@@ -1,5 +1,113 @@
 from flask import request, jsonify
-from utils.db import get_db_connection
+from utils.config import settings
+from utils.db import get_db_connection, get_read_connection, recent_writes
+from utils.inbox import record_direct_message
+from utils.ingest import MessageBatcher
+from utils.message_cache import message_cache, direct_key
+from utils.pagination import parse_page_args, keyset_clause
+from utils.profiles import with_sender_names
+from utils.pubsub import publish_direct_message
+from utils.responses import parse_list_format, list_payload
+
+
+def format_message(msg):
+    # Without sender_name: cached messages stay valid across renames, and
+    # with_sender_names adds it on the way out.
+    return {
+        "id": msg[0],
+        "sender_id": msg[1],
+        "recipient_id": msg[2],
+        "content": msg[3],
+        "created_at": msg[4]
+    }
+
+
+def fetch_direct_messages(cursor, user_id, other_user_id, before_id=None, after_id=None, limit=50):
+    # One page of the conversation, oldest first. Each direction is read as
+    # its own bounded range so the work stays proportional to the page size,
+    # not to the length of the conversation.
+    condition, condition_params, order = keyset_clause("id", before_id, after_id)
+    sql = f"""
+        SELECT m.id, m.sender_id, m.recipient_id, m.content, m.created_at
+        FROM (
+            SELECT * FROM (
+                SELECT id, sender_id, recipient_id, content, created_at FROM messages
+                WHERE sender_id = %s AND recipient_id = %s{condition}
+                ORDER BY id {order} LIMIT %s
+            ) sent
+            UNION ALL
+            SELECT * FROM (
+                SELECT id, sender_id, recipient_id, content, created_at FROM messages
+                WHERE sender_id = %s AND recipient_id = %s{condition}
+                ORDER BY id {order} LIMIT %s
+            ) received
+        ) m
+        ORDER BY m.id {order}
+        LIMIT %s
+    """
+    params = (
+        (user_id, other_user_id) + condition_params + (limit,)
+        + (other_user_id, user_id) + condition_params + (limit,)
+        + (limit,)
+    )
+    cursor.execute(sql, params)
+    messages = cursor.fetchall()
+    if order == "DESC":
+        messages = messages[::-1]
+    return [format_message(msg) for msg in messages]
+
+
+def fetch_user_direct_messages(cursor, user_id, after_id, limit=50):
+    # Direct messages sent or received by the user with ids after after_id,
+    # across all of their conversations. Used to resume the push channel.
+    sql = """
+        SELECT m.id, m.sender_id, m.recipient_id, m.content, m.created_at
+        FROM (
+            SELECT * FROM (
+                SELECT id, sender_id, recipient_id, content, created_at FROM messages
+                WHERE sender_id = %s AND id > %s
+                ORDER BY id ASC LIMIT %s
+            ) sent
+            UNION ALL
+            SELECT * FROM (
+                SELECT id, sender_id, recipient_id, content, created_at FROM messages
+                WHERE recipient_id = %s AND sender_id != %s AND id > %s
+                ORDER BY id ASC LIMIT %s
+            ) received
+        ) m
+        ORDER BY m.id ASC
+        LIMIT %s
+    """
+    cursor.execute(sql, (user_id, after_id, limit, user_id, user_id, after_id, limit, limit))
+    return [format_message(msg) for msg in cursor.fetchall()]
+
+
+def _record_batched_message(cursor, message):
+    record_direct_message(cursor, message["id"], message["sender_id"], message["recipient_id"], message["content"])
+
+
+direct_batcher = MessageBatcher(
+    'direct', 'messages', ('sender_id', 'recipient_id', 'content'),
+    """
+        SELECT id, sender_id, recipient_id, content, created_at FROM messages
+        WHERE id BETWEEN %s AND %s
+        ORDER BY id
+    """,
+    format_message,
+    _record_batched_message,
+)
+
+
+def deliver_direct_message(message, cursor=None):
+    # After the commit: route the sender's reads to the primary, hand the
+    # message to the cache and to listeners, and return it with its sender's
+    # name for the response.
+    recent_writes.mark()
+    message_cache.append(direct_key(message["sender_id"], message["recipient_id"]), message)
+    result = with_sender_names([message], cursor)[0]
+    publish_direct_message(result)
+    return result
+
 
 def register_message_routes(app):
     @app.route('/messages', methods=['GET'])
@@ -9,36 +117,42 @@ def register_message_routes(app):
         
         if not user_id or not other_user_id:
             return jsonify({"error": "Missing user_id or other_user_id"}), 400
+
+        try:
+            before_id, after_id, limit = parse_page_args(request.args)
+            list_format = parse_list_format(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        try:
+            key = direct_key(user_id, other_user_id)
+        except ValueError:
+            return jsonify({"error": "Invalid user_id or other_user_id"}), 400
         
-        db = get_db_connection()
+        if settings['MESSAGE_CACHE_ENABLED']:
+            result = message_cache.get_page(key, before_id, after_id, limit)
+            if result is not None:
+                return jsonify(list_payload(with_sender_names(result), list_format)), 200
+        
+        # The cache is filled from the primary; a lagging replica would leave
+        # a gap in the cached tail.
+        db = get_db_connection() if settings['MESSAGE_CACHE_ENABLED'] else get_read_connection()
         if not db:
             return jsonify({"error": "Database connection failed"}), 500
 
         cursor = db.cursor()
         try:
-            # Get messages between the two users
-            sql = """
-                SELECT m.id, m.sender_id, m.recipient_id, m.content, m.created_at, u.name as sender_name 
-                FROM messages m 
-                JOIN user_verification u ON m.sender_id = u.id 
-                WHERE (m.sender_id = %s AND m.recipient_id = %s) 
-                OR (m.sender_id = %s AND m.recipient_id = %s)
-                ORDER BY m.created_at ASC
-            """
-            cursor.execute(sql, (user_id, other_user_id, other_user_id, user_id))
-            messages = cursor.fetchall()
-            
-            # Format messages
-            result = [{
-                "id": msg[0],
-                "sender_id": msg[1],
-                "recipient_id": msg[2],
-                "content": msg[3],
-                "created_at": msg[4],
-                "sender_name": msg[5]
-            } for msg in messages]
-            
-            return jsonify(result), 200
+            result = None
+            if settings['MESSAGE_CACHE_ENABLED']:
+                result = message_cache.load(
+                    key,
+                    lambda n: fetch_direct_messages(cursor, user_id, other_user_id, limit=n),
+                    before_id, after_id, limit
+                )
+            if result is None:
+                result = fetch_direct_messages(cursor, user_id, other_user_id, before_id, after_id, limit)
+            # Names are read from the primary: they go into the profile cache
+            return jsonify(list_payload(with_sender_names(result), list_format)), 200
         finally:
             cursor.close()
             db.close()
@@ -56,6 +170,13 @@ def register_message_routes(app):
         
         if not all([sender_id, recipient_id, content]):
             return jsonify({"error": "Missing required fields"}), 400
+
+        if settings['MESSAGE_BATCHING_ENABLED']:
+            try:
+                result = deliver_direct_message(direct_batcher.submit(sender_id, recipient_id, content))
+            except Exception as e:
+                return jsonify({"error": str(e)}), 500
+            return jsonify(result), 201
         
         db = get_db_connection()
         if not db:
@@ -66,27 +187,17 @@ def register_message_routes(app):
             # Insert message
             sql = "INSERT INTO messages (sender_id, recipient_id, content, created_at) VALUES (%s, %s, %s, NOW())"
             cursor.execute(sql, (sender_id, recipient_id, content))
+            message_id = cursor.lastrowid
+            record_direct_message(cursor, message_id, sender_id, recipient_id, content)
             db.commit()
             
-            # Get the inserted message with sender name
-            sql = """
-                SELECT m.id, m.sender_id, m.recipient_id, m.content, m.created_at, u.name as sender_name 
-                FROM messages m 
-                JOIN user_verification u ON m.sender_id = u.id 
-                WHERE m.id = LAST_INSERT_ID()
-            """
-            cursor.execute(sql)
+            # Get the inserted message
+            sql = "SELECT id, sender_id, recipient_id, content, created_at FROM messages WHERE id = %s"
+            cursor.execute(sql, (message_id,))
             message = cursor.fetchone()
             
             # Format response
-            result = {
-                "id": message[0],
-                "sender_id": message[1],
-                "recipient_id": message[2],
-                "content": message[3],
-                "created_at": message[4],
-                "sender_name": message[5]
-            }
+            result = deliver_direct_message(format_message(message), cursor)
             
             return jsonify(result), 201
         except Exception as e:
@@ -0,0 +1,260 @@
+import bisect
+import threading
+import time
+
+from flask import Response, g, request
+
+from utils.config import settings
+from utils.db import pool_stats, replica_stats
+from utils.membership import membership
+from utils.message_cache import message_cache
+from utils.profiles import profiles
+from utils.pubsub import hub
+from utils.querylog import query_log
+from utils.search_index import search_index
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [
+            f"{self.name}{_labels(self.label_names, labels)} {_number(value)}" for labels, value in items
+        ]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        # One counter per bucket; render() makes them cumulative.
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((labels, (list(counts), total, count))
+                           for labels, (counts, total, count) in self._values.items())
+        lines = self._header()
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = _labels(self.label_names, labels, [('le', _number(bound))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        # name -> function returning a stats() dict, exported as gauges
+        self._collectors = {}
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collect(self, prefix, stats):
+        self._collectors[prefix] = stats
+
+    def _flatten(self, prefix, stats):
+        for key, value in stats.items():
+            name = f"{prefix}_{key}"
+            if isinstance(value, bool):
+                yield name, int(value)
+            elif isinstance(value, (int, float)):
+                yield name, value
+            elif isinstance(value, dict) and all(isinstance(k, str) for k in value):
+                yield from self._flatten(name, value)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, stats in self._collectors.items():
+            try:
+                values = list(self._flatten(f"syncspace_{prefix}", stats()))
+            except Exception as e:
+                print(f"Error collecting {prefix} metrics: {e}")
+                continue
+            for name, value in values:
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_duration = registry.register(Histogram(
+    'syncspace_http_request_duration_seconds',
+    "Time from receiving a request to its response headers, by route.",
+    ('method', 'route'), LATENCY_BUCKETS
+))
+requests_total = registry.register(Counter(
+    'syncspace_http_requests_total',
+    "Responses sent, by route and status code.",
+    ('method', 'route', 'status')
+))
+requests_in_flight = registry.register(Gauge(
+    'syncspace_http_requests_in_flight',
+    "Requests currently being handled, by route.",
+    ('method', 'route')
+))
+response_size = registry.register(Histogram(
+    'syncspace_http_response_size_bytes',
+    "Size of response bodies as sent, by route (streamed bodies excluded).",
+    ('method', 'route'), SIZE_BUCKETS
+))
+
+message_batch_size = registry.register(Histogram(
+    'syncspace_message_batch_size',
+    "Messages written per group-commit batch, by kind (direct or group).",
+    ('kind',), (1, 2, 5, 10, 20, 50, 100, 200, 500)
+))
+message_batch_wait = registry.register(Histogram(
+    'syncspace_message_batch_wait_seconds',
+    "Time a message waited for its batch to start writing, by kind.",
+    ('kind',), (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+))
+message_batch_write = registry.register(Histogram(
+    'syncspace_message_batch_write_seconds',
+    "Time to insert and commit one batch, by kind.",
+    ('kind',), LATENCY_BUCKETS
+))
+message_batch_fallbacks = registry.register(Counter(
+    'syncspace_message_batch_fallbacks_total',
+    "Batches that failed and were retried one message at a time, by kind.",
+    ('kind',)
+))
+
+password_queue_wait = registry.register(Histogram(
+    'syncspace_password_queue_wait_seconds',
+    "Time a password hash or check waited for a bcrypt worker.",
+    (), LATENCY_BUCKETS
+))
+password_duration = registry.register(Histogram(
+    'syncspace_password_duration_seconds',
+    "Time bcrypt took per password, by operation (hash or verify).",
+    ('operation',), LATENCY_BUCKETS
+))
+
+
+def _route():
+    # The URL rule rather than the path keeps one series per route.
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def _start_timer():
+    g.metrics_route = (request.method, _route())
+    g.metrics_started = time.perf_counter()
+    requests_in_flight.inc(*g.metrics_route)
+
+
+def _record_response(response):
+    labels = getattr(g, 'metrics_route', None)
+    if labels is None:
+        return response
+    request_duration.observe(time.perf_counter() - g.metrics_started, *labels)
+    requests_total.inc(*labels, str(response.status_code))
+    if not response.is_streamed and response.content_length is not None:
+        response_size.observe(response.content_length, *labels)
+    return response
+
+
+def _stop_timer(exc):
+    labels = g.pop('metrics_route', None)
+    if labels is not None:
+        requests_in_flight.dec(*labels)
+
+
+def init_app(app):
+    # Register before other after_request hooks (they run in reverse order)
+    # so the recorded size is the size actually sent.
+    if not settings['METRICS_ENABLED']:
+        return
+    # Imported here: the feed and stream modules reach this one through
+    # utils.ingest, and the password module records into the histograms above
+    from utils.calendar_feed import feed_cache
+    from utils.passwords import hasher
+    from utils.stream import stream_slots
+
+    registry.collect('db_pool', pool_stats)
+    registry.collect('db_replicas', replica_stats)
+    registry.collect('message_cache', message_cache.stats)
+    registry.collect('membership_cache', membership.stats)
+    registry.collect('profile_cache', profiles.stats)
+    registry.collect('search_index', search_index.stats)
+    registry.collect('stream_hub', hub.stats)
+    registry.collect('stream_connections', stream_slots.stats)
+    registry.collect('passwords', hasher.stats)
+    registry.collect('queries', query_log.stats)
+    registry.collect('calendar_cache', feed_cache.stats)
+
+    app.before_request(_start_timer)
+    app.after_request(_record_response)
+    app.teardown_request(_stop_timer)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
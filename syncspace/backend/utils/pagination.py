@@ -0,0 +1,46 @@
+from utils.config import settings
+
+
+def _positive_int(value, name):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {name} parameter")
+    if number < 0:
+        raise ValueError(f"Invalid {name} parameter")
+    return number
+
+
+def parse_page_args(args):
+    # Keyset pagination over message ids: after_id returns rows newer than the
+    # client's last id (polling), before_id pages back through history, and
+    # neither returns the newest page.
+    before_id = args.get('before_id')
+    after_id = args.get('after_id')
+    limit = args.get('limit')
+
+    if before_id and after_id:
+        raise ValueError("Use either before_id or after_id, not both")
+
+    before_id = _positive_int(before_id, 'before_id') if before_id else None
+    after_id = _positive_int(after_id, 'after_id') if after_id else None
+
+    if limit:
+        limit = _positive_int(limit, 'limit')
+        if limit == 0:
+            raise ValueError("Invalid limit parameter")
+        limit = min(limit, settings['MESSAGE_PAGE_MAX'])
+    else:
+        limit = settings['MESSAGE_PAGE_DEFAULT']
+
+    return before_id, after_id, limit
+
+
+def keyset_clause(column, before_id, after_id):
+    # Returns the extra WHERE condition, its parameters and the sort direction
+    # for one page. Pages are always returned oldest-first to the client.
+    if after_id is not None:
+        return f" AND {column} > %s", (after_id,), "ASC"
+    if before_id is not None:
+        return f" AND {column} < %s", (before_id,), "DESC"
+    return "", (), "DESC"
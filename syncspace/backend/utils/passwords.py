@@ -0,0 +1,102 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from utils.config import settings
+from utils.metrics import password_queue_wait, password_duration
+
+
+class PasswordBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    # Runs bcrypt off the request threads on a fixed pool of workers (bcrypt
+    # releases the GIL). At most PASSWORD_WORKERS + PASSWORD_QUEUE jobs are
+    # accepted at once; beyond that callers get PasswordBusy straight away.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self.rejected = 0
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                workers = settings['PASSWORD_WORKERS']
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+                self._slots = threading.BoundedSemaphore(workers + settings['PASSWORD_QUEUE'])
+            return self._executor, self._slots
+
+    def _submit(self, operation, fn, args, then=None):
+        # Queues fn(*args) and returns its Future. then(result), if given,
+        # runs on the same worker while the job still holds its slot.
+        executor, slots = self._pool()
+        if not slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordBusy("Too many password operations in progress")
+
+        submitted = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            try:
+                result = fn(*args)
+            finally:
+                password_queue_wait.observe(started - submitted)
+                password_duration.observe(time.perf_counter() - started, operation)
+            return then(result) if then is not None else result
+
+        try:
+            future = executor.submit(job)
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    def _run(self, operation, fn, *args):
+        return self._submit(operation, fn, args).result()
+
+    def start(self):
+        self._pool()
+
+    def hash(self, password):
+        salt = bcrypt.gensalt(rounds=settings['BCRYPT_ROUNDS'])
+        return self._run('hash', bcrypt.hashpw, password.encode('utf-8'), salt)
+
+    def hash_later(self, password, then):
+        # Like hash(), but returns at once; then(new_hash) runs on the bcrypt
+        # worker. Raises PasswordBusy when the pool is full.
+        salt = bcrypt.gensalt(rounds=settings['BCRYPT_ROUNDS'])
+        return self._submit('hash', bcrypt.hashpw, (password.encode('utf-8'), salt), then)
+
+    def verify(self, password, hashed):
+        if isinstance(hashed, str):
+            hashed = hashed.encode('utf-8')
+        return self._run('verify', bcrypt.checkpw, password.encode('utf-8'), hashed)
+
+    def needs_rehash(self, hashed):
+        # bcrypt hashes look like $2b$<cost>$<salt+hash>
+        if isinstance(hashed, bytes):
+            hashed = hashed.decode('utf-8')
+        try:
+            return int(hashed.split('$')[2]) != settings['BCRYPT_ROUNDS']
+        except (IndexError, ValueError):
+            return False
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def stats(self):
+        with self._lock:
+            return {"rejected": self.rejected}
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,212 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from utils.config import settings
+from utils.db import get_db_connection
+
+# redis is optional; without it the local backend is used.
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Seconds to wait on the Redis server before answering from the database
+REDIS_TIMEOUT = 0.5
+
+
+class _LocalStore:
+    # user_id -> (loaded at, profile), least recently used first.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles = OrderedDict()
+        # Bumped by every invalidation; a load that started before one is
+        # not installed because its rows may predate the change.
+        self._invalidations = 0
+
+    def generation(self):
+        with self._lock:
+            return self._invalidations
+
+    def get_many(self, user_ids):
+        now = time.monotonic()
+        ttl = settings['PROFILE_CACHE_TTL']
+        found = {}
+        with self._lock:
+            for user_id in user_ids:
+                entry = self._profiles.get(user_id)
+                if entry is None:
+                    continue
+                if ttl and now - entry[0] >= ttl:
+                    del self._profiles[user_id]
+                    continue
+                self._profiles.move_to_end(user_id)
+                found[user_id] = entry[1]
+        return found
+
+    def put_many(self, profiles, generation):
+        now = time.monotonic()
+        with self._lock:
+            if generation != self._invalidations:
+                return
+            for user_id, profile in profiles.items():
+                self._profiles[user_id] = (now, profile)
+                self._profiles.move_to_end(user_id)
+            while len(self._profiles) > settings['PROFILE_CACHE_ENTRIES']:
+                self._profiles.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._invalidations += 1
+            self._profiles.pop(user_id, None)
+
+    def size(self):
+        with self._lock:
+            return len(self._profiles)
+
+
+class _RedisStore:
+    # One JSON value per user on a Redis-compatible server shared by every
+    # worker, so a rename invalidates the entry for all of them. Size is
+    # bounded by the TTL and the server's maxmemory policy. A load racing an
+    # invalidation can put the old profile back; the TTL bounds that too.
+
+    def __init__(self, url):
+        self._client = redis.Redis.from_url(url, socket_timeout=REDIS_TIMEOUT, socket_connect_timeout=REDIS_TIMEOUT)
+
+    def _key(self, user_id):
+        return f"syncspace:profile:{user_id}"
+
+    def generation(self):
+        return None
+
+    def get_many(self, user_ids):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        values = self._client.mget([self._key(user_id) for user_id in user_ids])
+        return {user_id: json.loads(value) for user_id, value in zip(user_ids, values) if value is not None}
+
+    def put_many(self, profiles, generation):
+        pipeline = self._client.pipeline(transaction=False)
+        ttl = max(int(settings['PROFILE_CACHE_TTL']), 1)
+        for user_id, profile in profiles.items():
+            pipeline.set(self._key(user_id), json.dumps(profile), ex=ttl)
+        pipeline.execute()
+
+    def invalidate(self, user_id):
+        self._client.delete(self._key(user_id))
+
+    def size(self):
+        return None
+
+
+class ProfileCache:
+    # id -> {id, name, username, email}, used to put names on messages
+    # instead of joining user_verification in every message query.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._store = None
+
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _backend(self):
+        with self._lock:
+            if self._store is None:
+                self._store = self._open_store()
+            return self._store
+
+    def _open_store(self):
+        backend = settings['PROFILE_CACHE_BACKEND']
+        if backend == 'redis':
+            if redis is not None:
+                return _RedisStore(settings['PROFILE_CACHE_URL'])
+            print("redis package not installed, using the local profile cache")
+        elif backend != 'local':
+            print(f"Unknown profile cache backend {backend!r}, using the local profile cache")
+        return _LocalStore()
+
+    def _count(self, hits=0, misses=0, errors=0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.errors += errors
+
+    def get_many(self, user_ids, cursor=None):
+        # Profiles of the given users that exist, by id. Misses are read with
+        # cursor, or with a connection of its own when none is passed.
+        user_ids = {int(user_id) for user_id in user_ids}
+        store = self._backend()
+        try:
+            found = store.get_many(user_ids)
+            generation = store.generation()
+        except Exception as e:
+            print(f"Error reading profile cache: {e}")
+            self._count(errors=1)
+            found, generation = {}, None
+        missing = user_ids - found.keys()
+        self._count(hits=len(found), misses=len(missing))
+        if not missing:
+            return found
+
+        loaded = self._load(missing, cursor)
+        try:
+            store.put_many(loaded, generation)
+        except Exception as e:
+            print(f"Error writing profile cache: {e}")
+            self._count(errors=1)
+        found.update(loaded)
+        return found
+
+    def _load(self, user_ids, cursor):
+        if cursor is None:
+            db = get_db_connection()
+            if db is None:
+                raise RuntimeError("Database connection failed")
+            cursor = db.cursor()
+            try:
+                return self._load(user_ids, cursor)
+            finally:
+                cursor.close()
+                db.close()
+
+        placeholders = ", ".join(["%s"] * len(user_ids))
+        cursor.execute(
+            f"SELECT id, name, username, email FROM user_verification WHERE id IN ({placeholders})",
+            tuple(user_ids)
+        )
+        return {
+            row[0]: {"id": row[0], "name": row[1], "username": row[2], "email": row[3]}
+            for row in cursor.fetchall()
+        }
+
+    def invalidate(self, user_id):
+        try:
+            self._backend().invalidate(int(user_id))
+        except Exception as e:
+            print(f"Error invalidating profile cache: {e}")
+            self._count(errors=1)
+
+    def stats(self):
+        store = self._backend()
+        with self._lock:
+            stats = {"hits": self.hits, "misses": self.misses, "errors": self.errors}
+        size = store.size()
+        if size is not None:
+            stats["entries"] = size
+        return stats
+
+
+profiles = ProfileCache()
+
+
+def with_sender_names(messages, cursor=None):
+    # Copies of the messages with sender_name filled in; the originals may be
+    # shared with the message cache, which stores them without names.
+    senders = profiles.get_many({message["sender_id"] for message in messages}, cursor)
+    names = {user_id: profile["name"] for user_id, profile in senders.items()}
+    return [dict(message, sender_name=names.get(message["sender_id"])) for message in messages]
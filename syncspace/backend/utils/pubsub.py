@@ -0,0 +1,152 @@
+import queue
+import threading
+from collections import OrderedDict, deque
+
+from utils.config import settings
+
+
+def user_topic(user_id):
+    return ('user', int(user_id))
+
+
+def group_topic(group_id):
+    return ('group', int(group_id))
+
+
+class Subscription:
+    def __init__(self, topics, max_queue, owner=None):
+        self.topics = topics
+        # The user the subscription belongs to, so that its group topics can
+        # follow membership changes while it is open
+        self.owner = owner
+        self.queue = queue.Queue(max_queue)
+        # Set when the subscriber fell behind and events were dropped; the
+        # client has to reconnect and resume from its last id.
+        self.overflowed = False
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def drain(self):
+        events = []
+        while True:
+            try:
+                events.append(self.queue.get_nowait())
+            except queue.Empty:
+                return events
+
+
+class MessageHub:
+    # In-process publish/subscribe for new messages. Every topic also keeps a
+    # short backlog so a reconnecting client can resume without a DB query.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._owners = {}
+        self._backlogs = OrderedDict()
+
+    def subscribe(self, topics, max_queue=None, owner=None):
+        subscription = Subscription(set(topics), max_queue or settings['STREAM_QUEUE_SIZE'], owner)
+        with self._lock:
+            for topic in subscription.topics:
+                self._subscribers.setdefault(topic, set()).add(subscription)
+            if owner is not None:
+                self._owners.setdefault(owner, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                self._discard(topic, subscription)
+            owned = self._owners.get(subscription.owner)
+            if owned is not None:
+                owned.discard(subscription)
+                if not owned:
+                    del self._owners[subscription.owner]
+
+    def _discard(self, topic, subscription):
+        subscribers = self._subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[topic]
+
+    def add_topic(self, owner, topic):
+        # Adds topic to every open subscription of owner.
+        with self._lock:
+            for subscription in self._owners.get(owner, ()):
+                subscription.topics.add(topic)
+                self._subscribers.setdefault(topic, set()).add(subscription)
+
+    def remove_topic(self, owner, topic):
+        # Removes topic from every open subscription of owner; events of it
+        # that are already queued are dropped by the reader (see topics).
+        with self._lock:
+            for subscription in self._owners.get(owner, ()):
+                subscription.topics.discard(topic)
+                self._discard(topic, subscription)
+
+    def publish(self, topic, event):
+        # event is a dict with "type" ("direct" or "group") and "message".
+        with self._lock:
+            backlog = self._backlogs.get(topic)
+            if backlog is None:
+                backlog = deque(maxlen=settings['STREAM_BACKLOG'])
+                self._backlogs[topic] = backlog
+                # Only the most recently active topics keep a backlog
+                while len(self._backlogs) > settings['STREAM_BACKLOG_TOPICS']:
+                    self._backlogs.popitem(last=False)
+            else:
+                self._backlogs.move_to_end(topic)
+            backlog.append(event)
+            subscribers = list(self._subscribers.get(topic, ()))
+
+        for subscription in subscribers:
+            if subscription.overflowed:
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                subscription.overflowed = True
+
+    def replay(self, topic, last_id):
+        # Events on the topic newer than last_id, or None when the backlog
+        # does not reach back far enough and the caller must ask the database.
+        with self._lock:
+            backlog = self._backlogs.get(topic)
+            if not backlog or backlog[0]["message"]["id"] > last_id:
+                return None
+            return [event for event in backlog if event["message"]["id"] > last_id]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "topics": len(self._subscribers),
+                "subscriptions": len({s for subs in self._subscribers.values() for s in subs}),
+                "backlogs": len(self._backlogs),
+            }
+
+
+hub = MessageHub()
+
+
+def publish_direct_message(message):
+    event = {"type": "direct", "message": message}
+    hub.publish(user_topic(message["sender_id"]), event)
+    if message["recipient_id"] != message["sender_id"]:
+        hub.publish(user_topic(message["recipient_id"]), event)
+
+
+def publish_group_message(message):
+    hub.publish(group_topic(message["group_id"]), {"type": "group", "message": message})
+
+
+def follow_group(user_id, group_id):
+    hub.add_topic(int(user_id), group_topic(group_id))
+
+
+def unfollow_group(user_id, group_id):
+    hub.remove_topic(int(user_id), group_topic(group_id))
@@ -0,0 +1,176 @@
+import re
+import threading
+import time
+
+import pymysql
+from flask import g, has_request_context, request
+
+from utils.config import settings
+
+EXPLAINABLE = re.compile(r'^\s*(SELECT|UPDATE|DELETE|INSERT\s+INTO\s+\w+\s*\([^)]*\)\s*SELECT)\s', re.IGNORECASE)
+WHITESPACE = re.compile(r'\s+')
+
+
+def _statement(sql):
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+def _shape(params):
+    # Types (and lengths of strings) of the bound values, never the values.
+    if params is None:
+        return '()'
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{key}: {_shape_of(value)}' for key, value in params.items()) + '}'
+    if not isinstance(params, (list, tuple)):
+        params = (params,)
+    return '(' + ', '.join(_shape_of(value) for value in params) + ')'
+
+
+def _shape_of(value):
+    if isinstance(value, (str, bytes)):
+        return f'{type(value).__name__}[{len(value)}]'
+    if isinstance(value, (list, tuple)):
+        return f'{type(value).__name__}[{len(value)}]'
+    return type(value).__name__
+
+
+class RequestProfile:
+    __slots__ = ('count', 'seconds', 'statements')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = {}
+
+    def add(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] = self.statements.get(statement, 0) + 1
+
+    def repeated(self):
+        threshold = settings['QUERY_REPEAT_THRESHOLD']
+        return [(statement, count) for statement, count in self.statements.items()
+                if threshold and count >= threshold]
+
+
+class QueryLog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.seconds = 0.0
+        self.slow = 0
+        self.repeated = 0
+
+    def record(self, cursor, sql, params, seconds):
+        statement = _statement(sql)
+        with self._lock:
+            self.queries += 1
+            self.seconds += seconds
+        if has_request_context():
+            profile = g.get('query_profile')
+            if profile is not None:
+                profile.add(statement, seconds)
+        if seconds * 1000 >= settings['SLOW_QUERY_MS']:
+            with self._lock:
+                self.slow += 1
+            self._log_slow(cursor, statement, sql, params, seconds)
+
+    def _log_slow(self, cursor, statement, sql, params, seconds):
+        where = f" in {request.method} {request.path}" if has_request_context() else ""
+        print(f"Slow query ({seconds * 1000:.1f} ms{where}): {statement} params={_shape(params)}")
+        if not settings['SLOW_QUERY_EXPLAIN'] or not EXPLAINABLE.match(sql):
+            return
+        if settings['DB_BACKEND'] != 'mysql':
+            # The plan is printed in MySQL's EXPLAIN format.
+            return
+        if isinstance(cursor, pymysql.cursors.SSCursor):
+            # Rows are still being read from the connection.
+            return
+        explain = None
+        try:
+            explain = cursor.connection.cursor()
+            explain.execute("EXPLAIN " + sql, params)
+            columns = [column[0].lower() for column in explain.description]
+            for row in explain.fetchall():
+                plan = dict(zip(columns, row))
+                print(f"  EXPLAIN table={plan.get('table')} type={plan.get('type')} "
+                      f"key={plan.get('key')} rows={plan.get('rows')} extra={plan.get('extra')}")
+        except Exception as e:
+            print(f"  EXPLAIN failed: {e}")
+        finally:
+            if explain is not None:
+                explain.close()
+
+    def finish_request(self, profile):
+        repeated = profile.repeated()
+        if repeated:
+            with self._lock:
+                self.repeated += 1
+            for statement, count in repeated:
+                print(f"Repeated query ({count}x in {request.method} {request.path}): {statement}")
+
+    def stats(self):
+        with self._lock:
+            return {"queries": self.queries, "seconds": self.seconds, "slow": self.slow,
+                    "repeated_requests": self.repeated}
+
+
+query_log = QueryLog()
+
+
+class InstrumentedCursor:
+    # Wraps a pymysql cursor and times every execute().
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    def execute(self, query, args=None):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(query, args)
+        finally:
+            query_log.record(self._cursor, query, args, time.perf_counter() - started)
+
+    def executemany(self, query, args):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, args)
+        finally:
+            query_log.record(self._cursor, query, args, time.perf_counter() - started)
+
+
+def _start_profile():
+    g.query_profile = RequestProfile()
+
+
+def _finish_profile(response):
+    profile = g.pop('query_profile', None)
+    if profile is None:
+        return response
+    query_log.finish_request(profile)
+    if settings['QUERY_DEBUG_HEADERS']:
+        # Server-Timing shows up in the browser's network panel.
+        response.headers['Server-Timing'] = f'db;dur={profile.seconds * 1000:.2f};desc="{profile.count} queries"'
+        response.headers['X-Query-Count'] = str(profile.count)
+        repeated = profile.repeated()
+        if repeated:
+            response.headers['X-Query-Repeated'] = str(max(count for _, count in repeated))
+    return response
+
+
+def init_app(app):
+    if not settings['QUERY_PROFILING_ENABLED']:
+        return
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
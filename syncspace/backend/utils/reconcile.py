@@ -0,0 +1,73 @@
+import argparse
+import sys
+
+from utils.db import get_db_connection
+from utils.events import ATTENDING_COUNT_SQL
+
+
+# The counters are filled by migration 0003 and kept up to date by the
+# routes; this job finds and repairs drift, e.g. after manual edits.
+
+
+def reconcile_attending_counts(fix=True, batch_size=500):
+    # Recompute events.attending_count from event_participants / membership
+    # in id-ordered batches and report every event whose stored counter
+    # drifted. With fix=True the counter is corrected, but only if nobody
+    # changed it since it was read.
+    db = get_db_connection()
+    if db is None:
+        raise RuntimeError("Database connection failed")
+
+    drift = []
+    cursor = db.cursor()
+    try:
+        last_id = 0
+        while True:
+            cursor.execute(f"""
+                SELECT e.id, e.attending_count, {ATTENDING_COUNT_SQL} as actual
+                FROM events e
+                WHERE e.id > %s
+                ORDER BY e.id ASC
+                LIMIT %s
+            """, (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            for event_id, stored, actual in rows:
+                if stored == actual:
+                    continue
+                drift.append({"event_id": event_id, "stored": stored, "actual": actual})
+                if fix:
+                    cursor.execute(
+                        "UPDATE events SET attending_count = %s WHERE id = %s AND attending_count = %s",
+                        (actual, event_id, stored)
+                    )
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+        db.close()
+
+    return drift
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute event attending counters and report drift.")
+    parser.add_argument('--dry-run', action='store_true', help="report drift without fixing it")
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args(argv)
+
+    drift = reconcile_attending_counts(fix=not args.dry_run, batch_size=args.batch_size)
+    for row in drift:
+        print(f"event {row['event_id']}: stored {row['stored']}, actual {row['actual']}")
+    action = "found" if args.dry_run else "fixed"
+    print(f"{len(drift)} event(s) with drifted attending_count {action}")
+    return 1 if drift and args.dry_run else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
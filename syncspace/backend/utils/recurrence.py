@@ -0,0 +1,171 @@
+import calendar
+import datetime
+
+# Recurring events keep an iCalendar-style rule ("FREQ=WEEKLY;INTERVAL=2;
+# COUNT=10") next to their first occurrence. Occurrences are never stored:
+# they are worked out on demand for the window being read, starting straight
+# at the first one inside it, so the cost follows the window and not the
+# length of the series. Supported are FREQ=DAILY/WEEKLY/MONTHLY/YEARLY with
+# INTERVAL and either COUNT or UNTIL. Monthly and yearly series that start on
+# a day some months lack (the 31st, February 29th) fall on the last day of
+# those months.
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+
+# last_occurrence of a series without an end
+FOREVER = datetime.datetime(9999, 12, 31, 23, 59, 59)
+
+_TIME_FORMATS = ('%Y%m%dT%H%M%S', '%Y%m%d')
+
+
+def parse_time(value):
+    # ISO 8601 ("2025-03-01", "2025-03-01T18:00:00Z", with an offset or a
+    # space) or the iCalendar form ("20250301T180000Z") -> naive UTC, the
+    # way times are stored.
+    if isinstance(value, datetime.datetime):
+        moment = value
+    else:
+        text = str(value).strip()
+        if text.endswith(('Z', 'z')):
+            text = text[:-1] + '+00:00'
+        try:
+            moment = datetime.datetime.fromisoformat(text)
+        except ValueError:
+            moment = None
+            for time_format in _TIME_FORMATS:
+                try:
+                    moment = datetime.datetime.strptime(text.replace('+00:00', ''), time_format)
+                    break
+                except ValueError:
+                    continue
+            if moment is None:
+                raise ValueError(f"Invalid time: {value}")
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return moment.replace(microsecond=0)
+
+
+class Rule:
+    __slots__ = ('freq', 'interval', 'count', 'until')
+
+    def __init__(self, freq, interval=1, count=None, until=None):
+        self.freq = freq
+        self.interval = interval
+        self.count = count
+        self.until = until
+
+    def __str__(self):
+        parts = [f"FREQ={self.freq}"]
+        if self.interval != 1:
+            parts.append(f"INTERVAL={self.interval}")
+        if self.count is not None:
+            parts.append(f"COUNT={self.count}")
+        if self.until is not None:
+            parts.append(f"UNTIL={self.until.strftime('%Y%m%dT%H%M%SZ')}")
+        return ';'.join(parts)
+
+
+def parse_rule(value):
+    text = str(value).strip()
+    if text.upper().startswith('RRULE:'):
+        text = text[6:]
+    fields = {}
+    for part in text.split(';'):
+        if not part:
+            continue
+        name, _, field_value = part.partition('=')
+        fields[name.strip().upper()] = field_value.strip()
+
+    unknown = set(fields) - {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL'}
+    if unknown:
+        raise ValueError(f"Unsupported recurrence field(s): {', '.join(sorted(unknown))}")
+    freq = fields.get('FREQ', '').upper()
+    if freq not in FREQUENCIES:
+        raise ValueError(f"FREQ must be one of {', '.join(FREQUENCIES)}")
+    if 'COUNT' in fields and 'UNTIL' in fields:
+        raise ValueError("Use either COUNT or UNTIL, not both")
+    try:
+        interval = int(fields.get('INTERVAL', 1))
+        count = int(fields['COUNT']) if 'COUNT' in fields else None
+    except ValueError:
+        raise ValueError("INTERVAL and COUNT must be whole numbers")
+    if interval < 1 or (count is not None and count < 1):
+        raise ValueError("INTERVAL and COUNT must be at least 1")
+    until = parse_time(fields['UNTIL']) if 'UNTIL' in fields else None
+    return Rule(freq, interval, count, until)
+
+
+def _shift(start, rule, index):
+    # The index-th occurrence, ignoring COUNT and UNTIL.
+    steps = index * rule.interval
+    if rule.freq == 'DAILY':
+        return start + datetime.timedelta(days=steps)
+    if rule.freq == 'WEEKLY':
+        return start + datetime.timedelta(weeks=steps)
+    month = start.month - 1 + steps * (12 if rule.freq == 'YEARLY' else 1)
+    year = start.year + month // 12
+    month = month % 12 + 1
+    return start.replace(year=year, month=month, day=min(start.day, calendar.monthrange(year, month)[1]))
+
+
+def _first_index(start, rule, moment):
+    # Index of the first occurrence at or after moment.
+    if moment <= start:
+        return 0
+    if rule.freq in ('DAILY', 'WEEKLY'):
+        step = datetime.timedelta(days=rule.interval * (7 if rule.freq == 'WEEKLY' else 1))
+        return -((start - moment) // step)
+    months = (moment.year - start.year) * 12 + moment.month - start.month
+    index = max(months // (rule.interval * (12 if rule.freq == 'YEARLY' else 1)) - 1, 0)
+    while _shift(start, rule, index) < moment:
+        index += 1
+    return index
+
+
+def _end_index(start, rule):
+    # Number of occurrences in the series, or None if it never ends.
+    if rule.count is not None:
+        return rule.count
+    if rule.until is not None:
+        return _first_index(start, rule, rule.until + datetime.timedelta(seconds=1))
+    return None
+
+
+def occurrences(start, rule, window_start, window_end):
+    # Start times of the series' occurrences in [window_start, window_end).
+    index = _first_index(start, rule, window_start)
+    end = _end_index(start, rule)
+    while end is None or index < end:
+        try:
+            moment = _shift(start, rule, index)
+        except (OverflowError, ValueError):
+            return
+        if moment >= window_end:
+            return
+        yield moment
+        index += 1
+
+
+def is_occurrence(start, rule, moment):
+    index = _first_index(start, rule, moment)
+    end = _end_index(start, rule)
+    if end is not None and index >= end:
+        return False
+    try:
+        return _shift(start, rule, index) == moment
+    except (OverflowError, ValueError):
+        return False
+
+
+def last_occurrence(start, rule):
+    # Start of the final occurrence (FOREVER for endless series); stored
+    # with the event so that calendar windows can be answered from an index.
+    end = _end_index(start, rule)
+    if end is None:
+        return FOREVER
+    if end == 0:
+        raise ValueError("UNTIL is before the first occurrence")
+    try:
+        return min(_shift(start, rule, end - 1), FOREVER)
+    except (OverflowError, ValueError):
+        return FOREVER
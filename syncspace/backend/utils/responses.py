@@ -0,0 +1,128 @@
+import datetime
+import decimal
+import gzip
+import json
+
+from flask import request
+from flask.json.provider import JSONProvider
+
+from utils.config import settings
+
+# orjson and brotli are optional; without them responses fall back to the
+# standard library encoder and gzip.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _default(obj):
+    # Types MySQL rows contain that JSON has no literal for. Naive datetimes
+    # come from the database in UTC and are sent as ISO-8601 with a Z.
+    if isinstance(obj, datetime.datetime):
+        if obj.tzinfo is None:
+            return obj.isoformat() + 'Z'
+        return obj.astimezone(datetime.timezone.utc).isoformat().replace('+00:00', 'Z')
+    if isinstance(obj, datetime.date):
+        return obj.isoformat()
+    if isinstance(obj, decimal.Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    if isinstance(obj, bytes):
+        return obj.decode('utf-8')
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS).decode('utf-8')
+
+    def loads(s):
+        return orjson.loads(s)
+else:
+    def dumps(obj):
+        return json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False)
+
+    def loads(s):
+        return json.loads(s)
+
+
+class FastJSONProvider(JSONProvider):
+    # Makes jsonify() and request.json go through dumps/loads above.
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
+
+
+def columnar(records):
+    # [{"a": 1, "b": 2}, ...] -> {"columns": ["a", "b"], "rows": [[1, 2], ...]}
+    columns = list(records[0]) if records else []
+    return {"columns": columns, "rows": [[record[column] for column in columns] for record in records]}
+
+
+def parse_list_format(args):
+    # ?format=columns asks list endpoints for the columnar shape.
+    value = args.get('format') or 'objects'
+    if value not in ('objects', 'columns'):
+        raise ValueError("format must be 'objects' or 'columns'")
+    return value
+
+
+def list_payload(records, list_format):
+    return columnar(records) if list_format == 'columns' else records
+
+
+def _encoding_for(response):
+    if response.status_code != 200 or response.is_streamed or response.direct_passthrough:
+        return None
+    if 'Content-Encoding' in response.headers:
+        return None
+    if not (response.mimetype or '').startswith(('application/json', 'text/')):
+        return None
+    if (response.content_length or 0) < settings['COMPRESS_MIN_BYTES']:
+        return None
+
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    accepted = request.accept_encodings
+    for encoding in offered:
+        if accepted[encoding]:
+            return encoding
+    return None
+
+
+def compress_response(response):
+    encoding = _encoding_for(response)
+    response.vary.add('Accept-Encoding')
+    if encoding is None:
+        return response
+
+    body = response.get_data()
+    if encoding == 'br':
+        body = brotli.compress(body, quality=settings['COMPRESS_BROTLI_QUALITY'])
+    else:
+        body = gzip.compress(body, compresslevel=settings['COMPRESS_GZIP_LEVEL'])
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    app.json = FastJSONProvider(app)
+    if settings['COMPRESS_ENABLED']:
+        app.after_request(compress_response)
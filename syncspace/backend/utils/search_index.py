@@ -0,0 +1,258 @@
+import bisect
+import heapq
+import threading
+import time
+
+from utils.config import settings
+from utils.db import get_db_connection
+
+GRAM_SIZE = 3
+# A search ranks at most MAX_CANDIDATES substring matches, found among the
+# first MAX_SCAN ids of its rarest trigram; very common queries therefore
+# rank a subset of their substring matches (prefix matches are always seen).
+MAX_CANDIDATES = 1000
+MAX_SCAN = 20000
+
+
+def _grams(text):
+    # Every substring of GRAM_SIZE characters. Shorter queries are answered
+    # from the sorted name, username and name-word lists instead.
+    return {text[start:start + GRAM_SIZE] for start in range(len(text) - GRAM_SIZE + 1)}
+
+
+def _words(name_key):
+    return set(name_key.split())
+
+
+def _delete(keys, key):
+    position = bisect.bisect_left(keys, key)
+    if position < len(keys) and keys[position] == key:
+        del keys[position]
+
+
+def _prefixed(keys, prefix, count):
+    # Ids of the first count (key, ..., id) tuples whose key starts with
+    # prefix.
+    ids = []
+    position = bisect.bisect_left(keys, (prefix,))
+    while position < len(keys) and len(ids) < count and keys[position][0].startswith(prefix):
+        ids.append(keys[position][-1])
+        position += 1
+    return ids
+
+
+class _Entry:
+    __slots__ = ('id', 'name', 'username', 'email', 'name_key', 'username_key')
+
+    def __init__(self, user_id, name, username, email):
+        self.id = user_id
+        self.name = name or ''
+        self.username = username or ''
+        self.email = email
+        self.name_key = self.name.lower()
+        self.username_key = self.username.lower()
+
+    def as_dict(self):
+        return {"id": self.id, "name": self.name, "username": self.username, "email": self.email}
+
+
+class _Index:
+    # Trigram postings plus lists sorted by name, username and each word of
+    # the name (then by name, the order results are ranked in). Entries are never modified, only replaced, so
+    # they can be read after the lock is released.
+    def __init__(self):
+        self.entries = {}
+        self.postings = {}
+        self.by_name = []
+        self.by_username = []
+        self.by_word = []
+
+    def add(self, entry, ordered=True):
+        # With ordered=False the lists are appended to; call sort() after.
+        insert = bisect.insort if ordered else list.append
+        self.entries[entry.id] = entry
+        for gram in _grams(entry.name_key) | _grams(entry.username_key):
+            self.postings.setdefault(gram, set()).add(entry.id)
+        insert(self.by_name, (entry.name_key, entry.id))
+        insert(self.by_username, (entry.username_key, entry.id))
+        for word in _words(entry.name_key):
+            insert(self.by_word, (word, entry.name_key, entry.id))
+
+    def sort(self):
+        for keys in (self.by_name, self.by_username, self.by_word):
+            keys.sort()
+
+    def remove(self, user_id):
+        entry = self.entries.pop(user_id, None)
+        if entry is None:
+            return None
+        for gram in _grams(entry.name_key) | _grams(entry.username_key):
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(user_id)
+                if not ids:
+                    del self.postings[gram]
+        _delete(self.by_name, (entry.name_key, user_id))
+        _delete(self.by_username, (entry.username_key, user_id))
+        for word in _words(entry.name_key):
+            _delete(self.by_word, (word, entry.name_key, user_id))
+        return entry
+
+    def candidates(self, query, count):
+        # Entries that can rank among the best count for query: the first
+        # count name, username and name-word prefix matches, and for queries
+        # of at least GRAM_SIZE characters a bounded set of trigram matches.
+        ids = set()
+        for keys in (self.by_name, self.by_username, self.by_word):
+            ids.update(_prefixed(keys, query, count))
+        if len(query) >= GRAM_SIZE and len(ids) < count:
+            posting_lists = [self.postings.get(query[start:start + GRAM_SIZE], ())
+                             for start in range(len(query) - GRAM_SIZE + 1)]
+            posting_lists.sort(key=len)
+            found = 0
+            for scanned, user_id in enumerate(posting_lists[0]):
+                if found == MAX_CANDIDATES or scanned == MAX_SCAN:
+                    break
+                if all(user_id in others for others in posting_lists[1:]):
+                    ids.add(user_id)
+                    found += 1
+        return [self.entries[user_id] for user_id in ids]
+
+
+class UserSearchIndex:
+    # In-process index over user names and usernames for /users/search.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = _Index()
+        self.ready = False
+        self.built_at = 0.0
+        # While a rebuild runs, writes are recorded here and replayed onto
+        # the new index before it replaces the old one.
+        self._building = False
+        self._pending = []
+
+    def _apply(self, index, op, args):
+        if op == 'upsert':
+            user_id, name, username, email = args
+            index.remove(user_id)
+            index.add(_Entry(user_id, name, username, email))
+        elif op == 'update':
+            user_id, name, email = args
+            old = index.remove(user_id)
+            if old is not None:
+                index.add(_Entry(user_id, name, old.username, email))
+        elif op == 'remove':
+            index.remove(args[0])
+
+    def _write(self, op, *args):
+        with self._lock:
+            if self._building:
+                self._pending.append((op, args))
+            self._apply(self._index, op, args)
+
+    def add(self, user_id, name, username, email):
+        self._write('upsert', int(user_id), name, username, email)
+
+    def update(self, user_id, name, email):
+        self._write('update', int(user_id), name, email)
+
+    def remove(self, user_id):
+        self._write('remove', int(user_id))
+
+    def build(self, cursor):
+        with self._lock:
+            if self._building:
+                return False
+            self._building = True
+            self._pending = []
+
+        try:
+            index = _Index()
+            cursor.execute("SELECT id, name, username, email FROM user_verification")
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+                for row in rows:
+                    index.add(_Entry(*row), ordered=False)
+            index.sort()
+
+            with self._lock:
+                for op, args in self._pending:
+                    self._apply(index, op, args)
+                self._index = index
+                self.ready = True
+                self.built_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._building = False
+                self._pending = []
+        return True
+
+    def _rank(self, entry, query):
+        if entry.name_key == query or entry.username_key == query:
+            tier = 0
+        elif entry.name_key.startswith(query) or entry.username_key.startswith(query):
+            tier = 1
+        elif any(word.startswith(query) for word in entry.name_key.split()):
+            tier = 2
+        else:
+            tier = 3
+        return (tier, entry.name_key, entry.id)
+
+    def search(self, query, exclude_id=None, limit=20):
+        # Ranked matches for query (exact, prefix, word prefix, substring),
+        # or None when the index is not built yet. Queries shorter than
+        # GRAM_SIZE only match prefixes. Candidates are collected under the
+        # lock in bounded time and ranked after it is released.
+        query = (query or '').strip().lower()
+        with self._lock:
+            if not self.ready:
+                return None
+            index = self._index
+            if not query:
+                entries = [index.entries[user_id] for _, user_id in index.by_name[:limit + 1]]
+                return [entry.as_dict() for entry in entries if entry.id != exclude_id][:limit]
+            candidates = index.candidates(query, limit + 1)
+
+        matches = [entry for entry in candidates
+                   if entry.id != exclude_id and (query in entry.name_key or query in entry.username_key)]
+        best = heapq.nsmallest(limit, matches, key=lambda entry: self._rank(entry, query))
+        return [entry.as_dict() for entry in best]
+
+    def needs_refresh(self):
+        # Periodic rebuilds pick up users created by other worker processes.
+        refresh = settings['SEARCH_INDEX_REFRESH']
+        with self._lock:
+            return (bool(refresh) and self.ready and not self._building
+                    and time.monotonic() - self.built_at > refresh)
+
+    def stats(self):
+        with self._lock:
+            return {"ready": self.ready, "users": len(self._index.entries), "grams": len(self._index.postings)}
+
+
+search_index = UserSearchIndex()
+
+
+def build_search_index():
+    db = get_db_connection()
+    if db is None:
+        return False
+
+    cursor = db.cursor()
+    try:
+        return search_index.build(cursor)
+    except Exception as e:
+        print(f"Error building user search index: {e}")
+        return False
+    finally:
+        cursor.close()
+        db.close()
+
+
+def build_search_index_in_background():
+    # Searches use the SQL query until the index is ready.
+    thread = threading.Thread(target=build_search_index, name='user-search-index', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,222 @@
+import datetime
+import re
+import sqlite3
+import threading
+
+import pymysql
+
+# An embedded stand-in for the MySQL server, for tests and benchmarks on one
+# machine. Connections and cursors behave like pymysql's as far as the routes
+# use them: statements are written in MySQL's dialect and translated here,
+# and sqlite errors are raised as the matching pymysql exceptions so the
+# existing error handling applies unchanged.
+
+_PLACEHOLDER = re.compile(r'%(s|%)')
+_AUTO_INCREMENT = re.compile(r'\bINT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b', re.IGNORECASE)
+_FOR_UPDATE = re.compile(r'\s+FOR\s+UPDATE\b', re.IGNORECASE)
+_INSERT = re.compile(r'\s*INSERT\b', re.IGNORECASE)
+_FUNCTIONS = (
+    (re.compile(r'\bNOW\(\)', re.IGNORECASE), 'CURRENT_TIMESTAMP'),
+    (re.compile(r'\bLAST_INSERT_ID\(\)', re.IGNORECASE), 'last_insert_rowid()'),
+)
+
+# sqlite error messages mapped to MySQL error codes, so that callers checking
+# e.args[0] (the migration runner, for objects that already exist) see the
+# same codes from both backends.
+_ERROR_CODES = (
+    (re.compile(r'table .* already exists'), 1050),
+    (re.compile(r'duplicate column name'), 1060),
+    (re.compile(r'index .* already exists'), 1061),
+    (re.compile(r'UNIQUE constraint failed'), 1062),
+    (re.compile(r'FOREIGN KEY constraint failed'), 1452),
+    (re.compile(r'database is locked'), 1205),
+)
+
+
+def _timestamp(value):
+    value = value.decode('utf-8')
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        # MySQL would have rejected the value on insert; sqlite keeps it.
+        return value
+
+
+# MySQL's DATETIME/TIMESTAMP columns come back as datetime objects; sqlite
+# stores them as 'YYYY-MM-DD HH:MM:SS' text, which also compares correctly
+# against CURRENT_TIMESTAMP.
+sqlite3.register_converter('DATETIME', _timestamp)
+sqlite3.register_converter('TIMESTAMP', _timestamp)
+sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+
+_cache_lock = threading.Lock()
+_translated = {}
+
+
+def translate(sql, with_params=True):
+    # MySQL statement -> (sqlite statement, whether it asked for row locks).
+    # Like pymysql, placeholders are only interpreted when parameters are
+    # passed.
+    key = (sql, with_params)
+    cached = _translated.get(key)
+    if cached is not None:
+        return cached
+    locking = bool(_FOR_UPDATE.search(sql))
+    converted = sql
+    if with_params:
+        converted = _PLACEHOLDER.sub(lambda match: '?' if match.group(1) == 's' else '%', converted)
+    converted = _AUTO_INCREMENT.sub('INTEGER PRIMARY KEY AUTOINCREMENT', converted)
+    converted = _FOR_UPDATE.sub('', converted)
+    for pattern, replacement in _FUNCTIONS:
+        converted = pattern.sub(replacement, converted)
+    with _cache_lock:
+        if len(_translated) > 4096:
+            _translated.clear()
+        _translated[key] = (converted, locking)
+    return converted, locking
+
+
+def _params(args):
+    if args is None:
+        return ()
+    if isinstance(args, dict):
+        raise pymysql.err.ProgrammingError("Named parameters are not supported by the sqlite backend")
+    # bcrypt hashes arrive as bytes; MySQL stores them in VARCHAR columns as
+    # text, so do the same rather than storing a BLOB.
+    return tuple(value.decode('utf-8') if isinstance(value, bytes) else value for value in args)
+
+
+def _mysql_error(e):
+    message = str(e)
+    code = 0
+    for pattern, error_code in _ERROR_CODES:
+        if pattern.search(message):
+            code = error_code
+            break
+    if isinstance(e, sqlite3.IntegrityError):
+        return pymysql.err.IntegrityError(code, message)
+    if isinstance(e, sqlite3.OperationalError):
+        return pymysql.err.OperationalError(code, message)
+    if isinstance(e, sqlite3.ProgrammingError):
+        return pymysql.err.ProgrammingError(code, message)
+    return pymysql.err.DatabaseError(code, message)
+
+
+class Cursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection._conn.cursor()
+        self._first_id = None
+
+    def execute(self, query, args=None):
+        sql, locking = translate(query, args is not None)
+        try:
+            if locking:
+                self.connection._lock_for_update()
+            self._cursor.execute(sql, _params(args))
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+        self._first_id = None
+        if self._cursor.rowcount > 1 and _INSERT.match(sql):
+            # MySQL reports the first id a multi-row INSERT generated, sqlite
+            # the last; ids from one statement are consecutive here.
+            self._first_id = self._cursor.lastrowid - self._cursor.rowcount + 1
+        return max(self._cursor.rowcount, 0)
+
+    def executemany(self, query, args):
+        sql, _ = translate(query)
+        try:
+            self._cursor.executemany(sql, [_params(row) for row in args])
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+        return max(self._cursor.rowcount, 0)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def lastrowid(self):
+        if self._first_id is not None:
+            return self._first_id
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Connection:
+    def __init__(self, path, timeout=10.0):
+        try:
+            self._conn = sqlite3.connect(
+                path,
+                timeout=timeout,
+                detect_types=sqlite3.PARSE_DECLTYPES,
+                isolation_level='DEFERRED',
+                check_same_thread=False,
+            )
+            self._conn.execute("PRAGMA foreign_keys = ON")
+            if path != ':memory:':
+                # Readers do not block the writer (or each other).
+                self._conn.execute("PRAGMA journal_mode = WAL")
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def cursor(self, cursor=None):
+        # The cursor class is ignored: sqlite cursors already read rows
+        # lazily, like pymysql's SSCursor.
+        return Cursor(self)
+
+    def _lock_for_update(self):
+        # SELECT ... FOR UPDATE: take the database write lock now so that
+        # concurrent read-modify-write sequences run one after another.
+        if not self._conn.in_transaction:
+            self._conn.execute("BEGIN IMMEDIATE")
+
+    def commit(self):
+        try:
+            self._conn.commit()
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def rollback(self):
+        try:
+            self._conn.rollback()
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def ping(self, reconnect=False):
+        try:
+            self._conn.execute("SELECT 1")
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def close(self):
+        self._conn.close()
+
+
+def connect(path, timeout=10.0):
+    return Connection(path, timeout)
@@ -0,0 +1,284 @@
+import math
+import threading
+import time
+from collections import deque
+
+from flask import Response, request, jsonify
+
+from utils.config import settings
+from utils.db import get_db_connection, get_streaming_db_connection
+from utils.pubsub import hub, user_topic, group_topic
+from utils.messages import fetch_user_direct_messages
+from utils.groups import fetch_group_messages_since, fetch_user_group_ids
+from utils.profiles import with_sender_names
+from utils.responses import dumps
+
+# Ids of delivered messages a channel remembers per kind to drop duplicates
+SEEN_IDS = 1000
+
+
+class _StreamSlots:
+    # Counts open streams and long polls against STREAM_MAX_CONNECTIONS.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.rejected = 0
+
+    def acquire(self):
+        limit = settings['STREAM_MAX_CONNECTIONS']
+        with self._lock:
+            if limit and self.open >= limit:
+                self.rejected += 1
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.open -= 1
+
+    def stats(self):
+        with self._lock:
+            return {"open": self.open, "limit": settings['STREAM_MAX_CONNECTIONS'], "rejected": self.rejected}
+
+
+stream_slots = _StreamSlots()
+
+
+def parse_cursor(value):
+    # Cursors look like "<last direct message id>:<last group message id>".
+    if not value:
+        return None, None
+    parts = value.split(':')
+    if len(parts) != 2:
+        raise ValueError("Invalid cursor")
+    try:
+        return tuple(int(part) if part else None for part in parts)
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+def format_cursor(last_direct_id, last_group_id):
+    return f"{last_direct_id}:{last_group_id}"
+
+
+class _Channel:
+    # Subscribes a user to their direct messages and groups, and works out
+    # which messages they missed since the cursor they reconnected with.
+    def __init__(self, user_id, last_direct_id, last_group_id):
+        self.user_id = user_id
+        self.last_ids = {"direct": last_direct_id, "group": last_group_id}
+        # Concurrent sends commit, and so are published, in any id order, so
+        # duplicates are recognised by id rather than by comparing with the
+        # cursor, which would drop a message published after a newer one.
+        self.seen = {"direct": set(), "group": set()}
+        self._seen_order = {"direct": deque(), "group": deque()}
+        self.subscription = None
+        self.backlog = []
+        self.truncated = False
+
+    def open(self, connect=get_db_connection):
+        db = connect()
+        if db is None:
+            return False
+
+        cursor = db.cursor()
+        try:
+            group_ids = fetch_user_group_ids(cursor, self.user_id)
+            topics = [user_topic(self.user_id)] + [group_topic(group_id) for group_id in group_ids]
+            # Subscribe before looking at history so nothing published in
+            # between is lost; duplicates are dropped by id below.
+            self.subscription = hub.subscribe(topics, owner=self.user_id)
+
+            limit = settings['MESSAGE_PAGE_MAX']
+            if self.last_ids["direct"] is None:
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM messages")
+                self.last_ids["direct"] = cursor.fetchone()[0]
+            else:
+                replayed = hub.replay(user_topic(self.user_id), self.last_ids["direct"])
+                if replayed is None:
+                    messages = fetch_user_direct_messages(cursor, self.user_id, self.last_ids["direct"], limit)
+                    self.truncated = self.truncated or len(messages) == limit
+                    replayed = [{"type": "direct", "message": message}
+                                for message in with_sender_names(messages, cursor)]
+                self.backlog.extend(replayed)
+
+            if self.last_ids["group"] is None:
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM group_messages")
+                self.last_ids["group"] = cursor.fetchone()[0]
+            else:
+                missing = []
+                for group_id in group_ids:
+                    replayed = hub.replay(group_topic(group_id), self.last_ids["group"])
+                    if replayed is None:
+                        missing.append(group_id)
+                    else:
+                        self.backlog.extend(replayed)
+                if missing:
+                    messages = fetch_group_messages_since(cursor, missing, self.last_ids["group"], limit)
+                    self.truncated = self.truncated or len(messages) == limit
+                    self.backlog.extend({"type": "group", "message": message}
+                                        for message in with_sender_names(messages, cursor))
+        except Exception:
+            self.close()
+            raise
+        finally:
+            cursor.close()
+            db.close()
+
+        self.backlog.sort(key=lambda event: event["message"]["id"])
+        return True
+
+    def accept(self, event):
+        # Drop events the client already has, and those of groups the user
+        # left since they were queued; advance the cursor otherwise.
+        kind = event["type"]
+        message = event["message"]
+        if kind == "group" and group_topic(message["group_id"]) not in self.subscription.topics:
+            return False
+        seen = self.seen[kind]
+        if message["id"] in seen:
+            return False
+        seen.add(message["id"])
+        order = self._seen_order[kind]
+        order.append(message["id"])
+        if len(order) > SEEN_IDS:
+            seen.discard(order.popleft())
+        self.last_ids[kind] = max(self.last_ids[kind], message["id"])
+        return True
+
+    @property
+    def cursor(self):
+        return format_cursor(self.last_ids["direct"], self.last_ids["group"])
+
+    def close(self):
+        if self.subscription is not None:
+            hub.unsubscribe(self.subscription)
+            self.subscription = None
+
+
+def _new_channel():
+    # An unopened channel for the request's user and cursor, or an error.
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return None, (jsonify({"error": "Missing user_id parameter"}), 400)
+
+    try:
+        user_id = int(user_id)
+        cursor = request.headers.get('Last-Event-ID') or request.args.get('cursor')
+        last_direct_id, last_group_id = parse_cursor(cursor)
+    except ValueError:
+        return None, (jsonify({"error": "Invalid user_id or cursor"}), 400)
+
+    return _Channel(user_id, last_direct_id, last_group_id), None
+
+
+def _open_channel():
+    channel, error = _new_channel()
+    if error:
+        return None, error
+    if not channel.open():
+        return None, (jsonify({"error": "Database connection failed"}), 500)
+    return channel, None
+
+
+def _poll(timeout):
+    # One long poll: the backlog, or else the first push within timeout.
+    channel, error = _open_channel()
+    if error:
+        return error
+
+    try:
+        events = [event for event in channel.backlog if channel.accept(event)]
+        if not events and not channel.truncated:
+            event = channel.subscription.get(timeout)
+            if event is not None:
+                pending = [event] + channel.subscription.drain()
+                events = [event for event in pending if channel.accept(event)]
+        return jsonify({
+            "events": events,
+            "cursor": channel.cursor,
+            "reset": channel.truncated or channel.subscription.overflowed
+        }), 200
+    finally:
+        channel.close()
+
+
+def register_stream_routes(app):
+    @app.route('/messages/stream', methods=['GET'])
+    def stream_messages():
+        channel, error = _new_channel()
+        if error:
+            return error
+
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        retry = int(settings['STREAM_BUSY_RETRY'])
+        if not stream_slots.acquire():
+            # EventSource gives up for good on an error status, so a full
+            # worker answers with an empty stream that asks the browser to
+            # come back later; it then resumes from its last event id.
+            headers['Retry-After'] = str(retry)
+            return Response(f"retry: {retry * 1000}\n\n", mimetype='text/event-stream', headers=headers)
+
+        def generate():
+            # The channel is opened by the body, so a HEAD request or a
+            # response that is never sent holds no subscription.
+            started = time.monotonic()
+            try:
+                yield "retry: 2000\n\n"
+                try:
+                    opened = channel.open(get_streaming_db_connection)
+                except Exception as e:
+                    print(f"Error opening message stream: {e}")
+                    opened = False
+                if not opened:
+                    # Ending the stream makes the browser retry
+                    return
+                if channel.truncated:
+                    # Too much was missed to replay; the client reloads its
+                    # open conversation instead.
+                    yield f"event: reset\nid: {channel.cursor}\ndata: {{}}\n\n"
+                for event in channel.backlog:
+                    if channel.accept(event):
+                        yield f"id: {channel.cursor}\ndata: {dumps(event)}\n\n"
+
+                while time.monotonic() - started < settings['STREAM_MAX_AGE']:
+                    event = channel.subscription.get(settings['STREAM_HEARTBEAT'])
+                    if event is None:
+                        if channel.subscription.overflowed:
+                            break
+                        yield ": heartbeat\n\n"
+                        continue
+                    if channel.accept(event):
+                        yield f"id: {channel.cursor}\ndata: {dumps(event)}\n\n"
+                    if channel.subscription.overflowed and channel.subscription.queue.empty():
+                        # Events were dropped; ending the stream makes the
+                        # browser reconnect and resume from the last id.
+                        break
+            finally:
+                channel.close()
+
+        response = Response(generate(), mimetype='text/event-stream', headers=headers)
+        # Runs whether or not the body was ever iterated
+        response.call_on_close(stream_slots.release)
+        return response
+
+    @app.route('/messages/poll', methods=['GET'])
+    def poll_messages():
+        # Long-poll fallback for clients that cannot use Server-Sent Events.
+        try:
+            timeout = float(request.args.get('timeout', settings['LONG_POLL_TIMEOUT']))
+        except ValueError:
+            return jsonify({"error": "Invalid timeout parameter"}), 400
+        if not math.isfinite(timeout):
+            return jsonify({"error": "Invalid timeout parameter"}), 400
+        timeout = max(0.0, min(timeout, settings['LONG_POLL_TIMEOUT']))
+
+        if not stream_slots.acquire():
+            response = jsonify({"error": "Server busy, please try again"})
+            response.headers['Retry-After'] = str(int(settings['STREAM_BUSY_RETRY']))
+            return response, 503
+        try:
+            return _poll(timeout)
+        finally:
+            stream_slots.release()
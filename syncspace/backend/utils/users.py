@@ -1,23 +1,138 @@
-from flask import request, jsonify
-import bcrypt
+from flask import Response, request, jsonify
 import pymysql
-from utils.db import get_db_connection
+from utils.config import settings
+from utils.db import get_db_connection, get_streaming_db_connection
+from utils.events import remove_user_from_events
+from utils.groups import fetch_user_group_ids
+from utils.inbox import forget_user
+from utils.membership import membership
+from utils.message_cache import message_cache
+from utils.passwords import hasher, PasswordBusy
+from utils.profiles import profiles
+from utils.responses import dumps
+from utils.search_index import search_index, build_search_index_in_background
+from utils.versions import versions, PROFILES, group_version, user_version
+
+USER_FIELDS = ("id", "name", "username", "email")
+
+
+def password_busy_response():
+    response = jsonify({"error": "Server busy, please try again"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
+def parse_user_fields(value):
+    if not value:
+        return USER_FIELDS
+    fields = tuple(field.strip() for field in value.split(',') if field.strip())
+    unknown = [field for field in fields if field not in USER_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown) or value}")
+    return fields
+
+
+def _store_password(user_id, new_hash):
+    db = get_db_connection()
+    if db is None:
+        return
+
+    cursor = db.cursor()
+    try:
+        cursor.execute("UPDATE user_verification SET password = %s WHERE id = %s", (new_hash, user_id))
+        db.commit()
+    except pymysql.MySQLError as e:
+        db.rollback()
+        print(f"Error rehashing password for user {user_id}: {e}")
+    finally:
+        cursor.close()
+        db.close()
+
+
+def rehash_password(user_id, password):
+    # Upgrade a hash made with an old work factor. The new hash is made and
+    # stored on the bcrypt pool, so the login does not wait for it and the
+    # pool's bound still holds; when the pool is full the upgrade is skipped
+    # and retried on the next login.
+    try:
+        hasher.hash_later(password, lambda new_hash: _store_password(user_id, new_hash))
+    except PasswordBusy:
+        pass
+
 
 def register_user_routes(app):
     @app.route('/users', methods=['GET'])
     def get_users():
-        db = get_db_connection()
+        # ?fields=id,name picks columns (the password hash is never selected),
+        # ?limit=&cursor= returns one page ordered by id with the next cursor
+        # in X-Next-Cursor, and without a limit the whole table is streamed.
+        try:
+            fields = parse_user_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        try:
+            limit = request.args.get('limit')
+            limit = min(int(limit), settings['USERS_PAGE_MAX']) if limit else None
+            after_id = int(request.args.get('cursor') or 0)
+        except ValueError:
+            return jsonify({"error": "Invalid limit or cursor"}), 400
+        if limit is not None and limit <= 0:
+            return jsonify({"error": "Invalid limit or cursor"}), 400
+
+        columns = ", ".join(["id"] + [field for field in fields if field != "id"])
+        names = ["id"] + [field for field in fields if field != "id"]
+
+        def project(row):
+            return {field: value for field, value in zip(names, row) if field in fields}
+
+        if limit is not None:
+            db = get_db_connection()
+            if db is None:
+                return jsonify({"error": "Database connection failed"}), 500
+
+            cursor = db.cursor()
+            try:
+                cursor.execute(
+                    f"SELECT {columns} FROM user_verification WHERE id > %s ORDER BY id ASC LIMIT %s",
+                    (after_id, limit)
+                )
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+                db.close()
+
+            response = jsonify([project(row) for row in rows])
+            if len(rows) == limit:
+                response.headers['X-Next-Cursor'] = str(rows[-1][0])
+            return response
+
+        db = get_streaming_db_connection()
         if db is None:
             return jsonify({"error": "Database connection failed"}), 500
-            
-        cursor = db.cursor()
-        cursor.execute("SELECT * FROM user_verification")
-        results = cursor.fetchall()
-        cursor.close()
-        db.close()
-        
-        users = [{"id": row[0], "name": row[1], "username": row[2], "password": row[3], "email": row[4]} for row in results]
-        return jsonify(users)
+
+        def generate():
+            # Unbuffered cursor: rows are read from the socket as they are
+            # written out, so memory stays flat however large the table is.
+            cursor = db.cursor(pymysql.cursors.SSCursor)
+            try:
+                cursor.execute(f"SELECT {columns} FROM user_verification WHERE id > %s ORDER BY id ASC", (after_id,))
+                yield "["
+                first = True
+                for row in cursor:
+                    yield ("" if first else ",") + dumps(project(row))
+                    first = False
+                yield "]"
+            finally:
+                cursor.close()
+                db.close()
+
+        response = Response(generate(), mimetype='application/json')
+        # The body closes db when it runs to the end or is abandoned; a body
+        # that never starts (HEAD, a client gone before the first chunk) does
+        # not run at all, so the response closes it too.
+        response.call_on_close(db.close)
+        return response
 
     @app.route('/users', methods=['POST'])
     def create_user():
@@ -28,7 +143,10 @@ def register_user_routes(app):
         email = data.get('email')
 
         # Hash the password
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        try:
+            hashed_password = hasher.hash(password)
+        except PasswordBusy:
+            return password_busy_response()
 
         db = get_db_connection()
         if db is None:
@@ -42,6 +160,7 @@ def register_user_routes(app):
             )
             user_id = cursor.lastrowid
             db.commit()
+            search_index.add(user_id, name, username, email)
             
             new_user = {
                 "id": user_id,
@@ -78,7 +197,14 @@ def register_user_routes(app):
 
             # Verify password
             stored_password = user[3]
-            if bcrypt.checkpw(password.encode('utf-8'), stored_password.encode('utf-8')):
+            try:
+                valid = hasher.verify(password, stored_password)
+            except PasswordBusy:
+                return password_busy_response()
+
+            if valid:
+                if hasher.needs_rehash(stored_password):
+                    rehash_password(user[0], password)
                 return jsonify({
                     "id": user[0],
                     "name": user[1],
@@ -109,6 +235,11 @@ def register_user_routes(app):
                 (name, email, user_id)
             )
             db.commit()
+            search_index.update(user_id, name, email)
+            # Messages get names from the profile cache; versioned listings
+            # carry the name themselves
+            profiles.invalidate(user_id)
+            versions.bump(PROFILES)
             return jsonify({"message": "User updated successfully"}), 200
         except pymysql.MySQLError as e:
             db.rollback()
@@ -125,8 +256,22 @@ def register_user_routes(app):
 
         cursor = db.cursor()
         try:
+            # Groups whose member lists the delete cascades into, and those
+            # whose event counters lose the user's attendance
+            group_ids = fetch_user_group_ids(cursor, user_id)
+            event_group_ids = remove_user_from_events(cursor, user_id)
+            forget_user(cursor, user_id)
             cursor.execute("DELETE FROM user_verification WHERE id = %s", (user_id,))
             db.commit()
+            for group_id in group_ids:
+                membership.invalidate(group_id)
+            versions.bump(user_version(user_id),
+                          *[group_version(group_id) for group_id in set(group_ids) | set(event_group_ids)])
+            search_index.remove(user_id)
+            # The user's messages went with them
+            profiles.invalidate(user_id)
+            message_cache.clear()
+            versions.bump(PROFILES)
             return jsonify({"message": "User deleted successfully"}), 200
         except pymysql.MySQLError as e:
             db.rollback()
@@ -143,6 +288,19 @@ def register_user_routes(app):
         
         if not current_user_id:
             return jsonify({"error": "Missing current_user_id parameter"}), 400
+
+        # Answer from the in-memory index when it is built; the SQL below is
+        # the fallback.
+        if settings['SEARCH_INDEX_ENABLED']:
+            if search_index.needs_refresh():
+                build_search_index_in_background()
+            try:
+                exclude_id = int(current_user_id)
+            except ValueError:
+                exclude_id = None
+            result = search_index.search('' if show_all else query, exclude_id, 20)
+            if result is not None:
+                return jsonify(result), 200
         
         db = get_db_connection()
         if db is None:
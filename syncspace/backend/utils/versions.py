@@ -0,0 +1,111 @@
+import os
+import threading
+from collections import OrderedDict
+
+from flask import Response, request
+
+from utils.config import settings
+
+# Profile changes (names, emails) show up in every versioned listing, so they
+# share one global counter instead of bumping every group and event.
+PROFILES = ('profiles',)
+
+
+def group_version(group_id):
+    return ('group', int(group_id))
+
+
+def event_version(event_id):
+    return ('event', int(event_id))
+
+
+def user_version(user_id):
+    return ('user', int(user_id))
+
+
+class ResourceVersions:
+    # Per-resource change counters used as ETags. Every bump takes the next
+    # value of one process-wide clock, and resources that were evicted or
+    # never bumped report the highest value evicted so far, so a counter
+    # never goes back to a value an older ETag was built from.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = OrderedDict()
+        # Resources whose content also depends on another one, e.g. an
+        # event's participants on its group's membership.
+        self._parents = OrderedDict()
+        self._clock = 0
+        self._floor = 0
+        # Counters restart with the process; the epoch keeps old ETags from
+        # matching the new ones.
+        self._epoch = os.urandom(4).hex()
+
+    def _trim(self, entries):
+        while len(entries) > settings['VERSION_CACHE_ENTRIES']:
+            _, value = entries.popitem(last=False)
+            if entries is self._versions:
+                self._floor = max(self._floor, value)
+
+    def bump(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._clock += 1
+                self._versions[key] = self._clock
+                self._versions.move_to_end(key)
+            self._trim(self._versions)
+
+    def link(self, key, parent):
+        with self._lock:
+            self._parents[key] = parent
+            self._parents.move_to_end(key)
+            self._trim(self._parents)
+
+    def linked(self, key):
+        with self._lock:
+            return key in self._parents
+
+    def etag(self, *keys):
+        # The ETag for a response built from these resources, or None when
+        # conditional requests are disabled. Take it before reading the data:
+        # a change that lands during the read then yields a fresh ETag.
+        if not settings['ETAGS_ENABLED']:
+            return None
+        return self.token(*keys)
+
+    def token(self, *keys):
+        # Like etag(), whatever ETAGS_ENABLED says; for caches that need to
+        # know whether their source changed.
+        with self._lock:
+            parts = []
+            for key in keys:
+                parts.append(self._versions.get(key, self._floor))
+                parent = self._parents.get(key)
+                if parent is not None:
+                    parts.append(self._versions.get(parent, self._floor))
+            return self._epoch + '-' + '.'.join(str(part) for part in parts)
+
+    def stats(self):
+        with self._lock:
+            return {"resources": len(self._versions), "links": len(self._parents), "clock": self._clock}
+
+
+versions = ResourceVersions()
+
+
+def not_modified(etag):
+    # A 304 response if the client already holds this ETag, otherwise None.
+    if etag is None or not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    return tagged(response, etag)
+
+
+def tagged(response, etag):
+    # no-cache makes browsers revalidate with If-None-Match on every fetch
+    # instead of guessing a freshness lifetime, so the client gets 304s
+    # without any code of its own. The tag is weak because the body may be
+    # sent compressed.
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,121 @@
+import threading
+import time
+
+from flask import jsonify
+
+from migrations import ensure_schema, check_schema
+from utils.config import settings
+from utils.db import get_pool, get_db_connection
+from utils.passwords import hasher
+from utils.search_index import build_search_index
+
+
+def _warm_database():
+    # Open the pool's minimum connections up front, check one of them and
+    # apply pending migrations if configured to. Until the schema is current
+    # the step fails, so the worker stays out of rotation instead of failing
+    # requests that need a missing column.
+    get_pool().fill()
+    db = get_db_connection()
+    if db is None:
+        raise RuntimeError("Database connection failed")
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+    finally:
+        cursor.close()
+        db.close()
+    ensure_schema()
+    check_schema()
+
+
+def _warm_passwords():
+    hasher.start()
+
+
+def _warm_search_index():
+    if settings['SEARCH_INDEX_ENABLED'] and not build_search_index():
+        raise RuntimeError("User search index build failed")
+
+
+STEPS = (
+    ('database', _warm_database),
+    ('passwords', _warm_passwords),
+    ('search_index', _warm_search_index),
+)
+
+
+class WarmUp:
+    # Runs the start-up steps once per process, retrying failed ones, and
+    # reports readiness for /health/ready.
+    def __init__(self, steps=STEPS):
+        self._steps = steps
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = None
+        self.state = 'pending'
+        self.timings = {}
+        self.errors = {}
+
+    @property
+    def ready(self):
+        return self._done.is_set()
+
+    def run(self):
+        with self._lock:
+            self.state = 'running'
+        remaining = list(self._steps)
+        while remaining:
+            failed = []
+            for name, step in remaining:
+                started = time.perf_counter()
+                try:
+                    step()
+                except Exception as e:
+                    print(f"Warm-up step {name} failed: {e}")
+                    with self._lock:
+                        self.errors[name] = str(e)
+                    failed.append((name, step))
+                    continue
+                with self._lock:
+                    self.timings[name] = time.perf_counter() - started
+                    self.errors.pop(name, None)
+            remaining = failed
+            if remaining:
+                with self._lock:
+                    self.state = 'retrying'
+                time.sleep(settings['WARM_UP_RETRY'])
+        with self._lock:
+            self.state = 'ready'
+        self._done.set()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return self._thread
+            self._thread = threading.Thread(target=self.run, name='warm-up', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "timings": dict(self.timings), "errors": dict(self.errors)}
+
+
+warmup = WarmUp()
+
+
+def register_health_routes(app):
+    @app.route('/health/live', methods=['GET'])
+    def liveness():
+        return jsonify({"status": "ok"}), 200
+
+    @app.route('/health/ready', methods=['GET'])
+    def readiness():
+        # Load balancers should only route here once warm-up has finished.
+        result = warmup.stats()
+        return jsonify(result), 200 if warmup.ready else 503
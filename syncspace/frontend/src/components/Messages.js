@@ -20,6 +20,13 @@ const Messages = ({ currentUser }) => {
   // Reference to message list for scrolling
   const messagesListRef = useRef(null);
 
+  // Id of the newest message fetched for the open conversation, so polls
+  // only ask the server for rows after it
+  const lastMessageIdRef = useRef(null);
+
+  // Conversation that pushed messages are compared against
+  const selectedConversationRef = useRef(null);
+
   // API URL
   const API_BASE = 'http://127.0.0.1:5000';
 
@@ -44,33 +51,98 @@ const Messages = ({ currentUser }) => {
     }
   }, [messages]);
 
-  // --- Poll for new messages ---
+  // --- Load the selected conversation ---
   useEffect(() => {
+    selectedConversationRef.current = selectedConversation;
     if (!selectedConversation) return;
     
-    // Initial fetch
+    // Start the new conversation from its newest page
+    setMessages([]);
+    setGroupMembers([]);
+    lastMessageIdRef.current = null;
+
+    // Initial fetch; later messages arrive through the stream below
     updateMessages();
-    
-    // Set up interval
-    const interval = setInterval(updateMessages, 5000);
-    
-    // Clean up
-    return () => clearInterval(interval);
   }, [selectedConversation]);
 
+  // --- Listen for new messages pushed by the server ---
+  useEffect(() => {
+    if (!currentUser) return;
+
+    // The browser reconnects on its own and resumes from the last event id
+    const source = new EventSource(`${API_BASE}/messages/stream?user_id=${currentUser.id}`);
+    source.onmessage = event => handlePushedMessage(JSON.parse(event.data));
+    source.addEventListener('reset', () => updateMessages());
+
+    return () => source.close();
+  }, [currentUser]);
+
   // --- Helper Functions ---
 
   // Update messages based on selected conversation
   function updateMessages() {
-    if (!selectedConversation) return;
+    const conversation = selectedConversationRef.current;
+    if (!conversation) return;
     
-    if (selectedConversation.type === 'direct') {
-      fetchDirectMessages(selectedConversation.id);
+    if (conversation.type === 'direct') {
+      fetchDirectMessages(conversation.id);
     } else {
-      fetchGroupMessages(selectedConversation.id);
+      fetchGroupMessages(conversation.id);
     }
   }
 
+  // Handle a message pushed through the stream
+  function handlePushedMessage({ type, message }) {
+    const conversation = selectedConversationRef.current;
+    let key;
+    let isOpen;
+
+    if (type === 'direct') {
+      const otherUserId = message.sender_id === currentUser.id ? message.recipient_id : message.sender_id;
+      key = `user-${otherUserId}`;
+      isOpen = conversation && conversation.type === 'direct' && conversation.id === otherUserId;
+    } else {
+      key = `group-${message.group_id}`;
+      isOpen = conversation && conversation.type !== 'direct' && conversation.id === message.group_id;
+    }
+
+    if (isOpen) {
+      mergeMessages([message], true);
+    }
+    updateConversationTimestamp(key, message.created_at);
+  }
+
+  // Key of a conversation, as used for conversationTimestamps
+  function conversationKey(type, id) {
+    return type === 'direct' ? `user-${id}` : `group-${id}`;
+  }
+
+  // Whether a response for this conversation still belongs on screen; one
+  // that resolves after the user opened another conversation is dropped
+  function isSelected(key) {
+    const conversation = selectedConversationRef.current;
+    return conversation !== null && conversationKey(conversation.type, conversation.id) === key;
+  }
+
+  // Query string that limits a poll to messages newer than the last one seen
+  function historyParams() {
+    return lastMessageIdRef.current ? `&after_id=${lastMessageIdRef.current}` : '';
+  }
+
+  // Add fetched messages to the list, skipping ones already shown
+  function mergeMessages(newMessages, advanceCursor) {
+    if (newMessages.length === 0) return;
+    if (advanceCursor) {
+      const newestId = Math.max(...newMessages.map(message => message.id));
+      lastMessageIdRef.current = Math.max(lastMessageIdRef.current || 0, newestId);
+    }
+    setMessages(previous => {
+      const seen = new Set(previous.map(message => message.id));
+      const added = newMessages.filter(message => !seen.has(message.id));
+      return [...previous, ...added].sort((a, b) => a.id - b.id);
+    });
+  }
+
   // Fetch list of users
   function fetchUsersList() {
     axios.get(`${API_BASE}/users`)
@@ -99,14 +171,17 @@ const Messages = ({ currentUser }) => {
 
   // Fetch direct messages between two users
   function fetchDirectMessages(otherUserId) {
-    axios.get(`${API_BASE}/messages?user_id=${currentUser.id}&other_user_id=${otherUserId}`)
+    const key = conversationKey('direct', otherUserId);
+    axios.get(`${API_BASE}/messages?user_id=${currentUser.id}&other_user_id=${otherUserId}${historyParams()}`)
       .then(response => {
-        setMessages(response.data);
+        if (isSelected(key)) {
+          mergeMessages(response.data, true);
+        }
         
         // Update timestamp for sorting
         if (response.data.length > 0) {
           const newestMessage = findNewestMessage(response.data);
-          updateConversationTimestamp(`user-${otherUserId}`, newestMessage.created_at);
+          updateConversationTimestamp(key, newestMessage.created_at);
         }
       })
       .catch(error => {
@@ -116,15 +191,19 @@ const Messages = ({ currentUser }) => {
 
   // Fetch group messages
   function fetchGroupMessages(groupId) {
+    const key = conversationKey('group', groupId);
+
     // Get messages
-    axios.get(`${API_BASE}/groups/${groupId}/messages`)
+    axios.get(`${API_BASE}/groups/${groupId}/messages?${historyParams().slice(1)}`)
       .then(response => {
-        setMessages(response.data);
+        if (isSelected(key)) {
+          mergeMessages(response.data, true);
+        }
         
         // Update timestamp for sorting
         if (response.data.length > 0) {
           const newestMessage = findNewestMessage(response.data);
-          updateConversationTimestamp(`group-${groupId}`, newestMessage.created_at);
+          updateConversationTimestamp(key, newestMessage.created_at);
         }
       })
       .catch(error => {
@@ -134,7 +213,9 @@ const Messages = ({ currentUser }) => {
     // Get group members
     axios.get(`${API_BASE}/groups/${groupId}/members`)
       .then(response => {
-        setGroupMembers(response.data);
+        if (isSelected(key)) {
+          setGroupMembers(response.data);
+        }
       })
       .catch(error => {
         setError('Failed to load group members');
@@ -158,6 +239,8 @@ const Messages = ({ currentUser }) => {
       content: newMessage.trim()
     };
 
+    const key = conversationKey(selectedConversation.type, selectedConversation.id);
+
     // Send direct message
     if (selectedConversation.type === 'direct') {
       messageData.recipient_id = selectedConversation.id;
@@ -165,8 +248,10 @@ const Messages = ({ currentUser }) => {
       axios.post(`${API_BASE}/messages`, messageData)
         .then(response => {
           setNewMessage('');
-          setMessages([...messages, response.data]);
-          updateConversationTimestamp(`user-${selectedConversation.id}`, response.data.created_at);
+          if (isSelected(key)) {
+            mergeMessages([response.data], false);
+          }
+          updateConversationTimestamp(key, response.data.created_at);
         })
         .catch(error => {
           setError('Failed to send message');
@@ -177,8 +262,10 @@ const Messages = ({ currentUser }) => {
       axios.post(`${API_BASE}/groups/${selectedConversation.id}/messages`, messageData)
         .then(response => {
           setNewMessage('');
-          setMessages([...messages, response.data]);
-          updateConversationTimestamp(`group-${selectedConversation.id}`, response.data.created_at);
+          if (isSelected(key)) {
+            mergeMessages([response.data], false);
+          }
+          updateConversationTimestamp(key, response.data.created_at);
         })
         .catch(error => {
           setError('Failed to send message');
@@ -229,10 +316,10 @@ const Messages = ({ currentUser }) => {
   
   // Update the timestamp for a conversation
   function updateConversationTimestamp(conversationId, timestamp) {
-    setConversationTimestamps({
-      ...conversationTimestamps,
+    setConversationTimestamps(previous => ({
+      ...previous,
       [conversationId]: timestamp
-    });
+    }));
   }
   
   // Sort users by most recent message
@@ -344,10 +431,7 @@ const Messages = ({ currentUser }) => {
                 <div
                   key={group.id}
                   className={`conversation-item ${selectedConversation?.id === group.id ? 'selected' : ''}`}
-                  onClick={() => {
-                    setSelectedConversation({ id: group.id, type: 'group', name: group.name });
-                    fetchGroupMessages(group.id);
-                  }}
+                  onClick={() => setSelectedConversation({ id: group.id, type: 'group', name: group.name })}
                 >
                   <h3>{group.name}</h3>
                   <p>Created by: {group.creator_name}</p>
@@ -362,10 +446,7 @@ const Messages = ({ currentUser }) => {
               <div
                 key={user.id}
                 className={`conversation-item ${selectedConversation?.id === user.id && selectedConversation?.type === 'direct' ? 'selected' : ''}`}
-                onClick={() => {
-                  setSelectedConversation({ id: user.id, type: 'direct', name: user.name });
-                  fetchDirectMessages(user.id);
-                }}
+                onClick={() => setSelectedConversation({ id: user.id, type: 'direct', name: user.name })}
               >
                 <h3>{user.name}</h3>
                 <p>{user.email}</p>
@@ -2,6 +2,29 @@ import React from 'react';
 import ReactDOM from 'react-dom/client';
 import './index.css';
 import App from './App';
+import axios from 'axios';
+
+// With database replicas the backend answers a write with the time it was
+// made, and reads that send it back go to the primary so the user sees their
+// own change. It is only sent for a minute after the write, as a custom
+// header makes every request need a CORS preflight.
+const LAST_WRITE_HEADER = 'X-SyncSpace-Last-Write';
+let lastWrite = null;
+
+axios.interceptors.response.use(response => {
+  const value = response.headers[LAST_WRITE_HEADER.toLowerCase()];
+  if (value) {
+    lastWrite = { value, receivedAt: Date.now() };
+  }
+  return response;
+});
+
+axios.interceptors.request.use(config => {
+  if (lastWrite && Date.now() - lastWrite.receivedAt < 60000) {
+    config.headers[LAST_WRITE_HEADER] = lastWrite.value;
+  }
+  return config;
+});
 
 const root = ReactDOM.createRoot(document.getElementById('root'));
 root.render(